@@ -1,11 +1,23 @@
-from flask import Flask
+import atexit
+import multiprocessing
 from .tasks import start_background_tasks, stop_background_tasks
+from .http_clients import close_http_clients
 
-# Start background tasks
-start_background_tasks()
+_started = False
 
-# Register shutdown handler
-def register_shutdown_handler(app):
-    @app.teardown_appcontext
-    def shutdown_tasks(exception=None):
-        stop_background_tasks() 
\ No newline at end of file
+if multiprocessing.parent_process() is None:
+    atexit.register(close_http_clients)
+
+def start_background_services():
+    """
+    Start the ingestion workers and calendar slot refresher. Called by
+    create_app, so scripts that import api.* and the document parsing
+    processes don't start them.
+    """
+    global _started
+    if _started or multiprocessing.parent_process() is not None:
+        return
+    _started = True
+    start_background_tasks()
+    # atexit runs last-registered first: drain the workers, then close the shared pools
+    atexit.register(stop_background_tasks)
@@ -0,0 +1,155 @@
+"""
+Async (Quart) versions of the chat endpoints, served next to the Flask app
+by asgi.py so slow LLM calls wait on the event loop instead of holding a
+WSGI worker thread each.
+"""
+
+import json
+
+from quart import Blueprint, Quart, Response, jsonify, request
+from quart.utils import run_sync
+
+from models.database import SessionLocal, Client
+from .chatbot.openai_api import generate_response, astream_response, get_spa_context
+from .chatbot.llm_clients import close_async_client
+
+chat_bp = Blueprint('chat_async', __name__, url_prefix='/api')
+
+# Paths asgi.py routes to this app; everything else goes to Flask
+CHAT_PATHS = {'/api/chat', '/api/chat/stream', '/api/public/chat', '/api/public/chat/stream'}
+
+
+def _spa_exists(spa_id: str) -> bool:
+    db = SessionLocal()
+    try:
+        return db.query(Client).filter_by(spa_id=spa_id).first() is not None
+    finally:
+        db.close()
+
+
+def sse_response(events) -> Response:
+    """Wrap async (event, data) pairs in a Server-Sent Events response."""
+    async def generate():
+        async for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.timeout = None  # streams can outlive the default response timeout
+    return response
+
+
+async def _chat_request():
+    """Validate a /chat body; returns (data, spa_id, error response)."""
+    data = await request.get_json(silent=True)
+    if not data or 'message' not in data:
+        return None, None, (jsonify({'error': 'No message provided'}), 400)
+
+    spa_id = data.get('spa_id')
+    if not spa_id:
+        return None, None, (jsonify({'error': 'No spa_id provided'}), 400)
+
+    # Verify spa exists
+    if not await run_sync(_spa_exists)(spa_id):
+        return None, None, (jsonify({'error': 'Invalid spa_id'}), 404)
+    return data, spa_id, None
+
+
+@chat_bp.route('/chat', methods=['POST'])
+async def chat():
+    # Public endpoint - no authentication required
+    try:
+        data, spa_id, error = await _chat_request()
+        if error:
+            return error
+
+        response_data = await generate_response(
+            message=data['message'],
+            spa_id=spa_id,
+            conversation_history=data.get('conversation_history', [])
+        )
+        return jsonify(response_data)
+    except Exception as e:
+        print(f"Error in chat endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@chat_bp.route('/chat/stream', methods=['POST'])
+async def chat_stream():
+    """Streaming variant of /chat: token events, then a final done event."""
+    data, spa_id, error = await _chat_request()
+    if error:
+        return error
+
+    return sse_response(astream_response(
+        message=data['message'],
+        spa_id=spa_id,
+        conversation_history=data.get('conversation_history', [])
+    ))
+
+
+@chat_bp.route('/public/chat', methods=['POST'])
+async def public_chat():
+    """Public chat endpoint that doesn't require authentication"""
+    try:
+        data = await request.get_json(silent=True) or {}
+        message = data.get('message')
+        spa_id = data.get('spa_id', 'default')
+
+        if not message:
+            return jsonify({'error': 'Message is required'}), 400
+
+        # Get spa context
+        context = await run_sync(get_spa_context)(spa_id)
+
+        response = await generate_response(
+            message=message,
+            spa_id=spa_id,
+            conversation_history=data.get('conversation_history', []),
+            context=context
+        )
+        return jsonify(response)
+
+    except Exception as e:
+        print(f"Error in public chat: {str(e)}")
+        return jsonify({'error': 'Failed to process message'}), 500
+
+
+@chat_bp.route('/public/chat/stream', methods=['POST'])
+async def public_chat_stream():
+    """Streaming variant of /public/chat over Server-Sent Events"""
+    data = await request.get_json(silent=True) or {}
+    message = data.get('message')
+    spa_id = data.get('spa_id', 'default')
+
+    if not message:
+        return jsonify({'error': 'Message is required'}), 400
+
+    # Get spa context
+    context = await run_sync(get_spa_context)(spa_id)
+
+    return sse_response(astream_response(
+        message=message,
+        spa_id=spa_id,
+        conversation_history=data.get('conversation_history', []),
+        context=context
+    ))
+
+
+def create_chat_app() -> Quart:
+    """Quart app serving only the async chat endpoints."""
+    app = Quart(__name__)
+    app.register_blueprint(chat_bp)
+
+    @app.after_request
+    async def add_cors_headers(response):
+        # Same open CORS policy as flask_cors on the main app
+        response.headers['Access-Control-Allow-Origin'] = request.headers.get('Origin', '*')
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        return response
+
+    @app.after_serving
+    async def close_clients():
+        await close_async_client()
+
+    return app
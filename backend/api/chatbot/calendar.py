@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import Dict, List
 from api.integrations.calendar_connector import CalendarConnector
 from models.database import SessionLocal, Client
-import requests
+from ..http_clients import get_session
 import base64
 
 class CalendarIntegration:
@@ -53,7 +53,7 @@ class CalendarIntegration:
             print(f"Using endpoint: https://acuityscheduling.com/api/v1/availability/dates")
             
             # First try to get appointment types
-            types_response = requests.get(
+            types_response = get_session('calendar').get(
                 'https://acuityscheduling.com/api/v1/appointment-types',
                 headers=headers
             )
@@ -69,7 +69,7 @@ class CalendarIntegration:
                 appointment_type_id = None
             
             # Then check availability
-            response = requests.get(
+            response = get_session('calendar').get(
                 'https://acuityscheduling.com/api/v1/availability/dates',
                 headers=headers,
                 params={
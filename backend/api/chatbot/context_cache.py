@@ -0,0 +1,76 @@
+"""Per-spa cache of rendered chat context blocks with versioned invalidation."""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from ..generations import bump_generation, safe_get_generation
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on staleness for writes that skip invalidate_spa_context
+CONTEXT_CACHE_TTL = float(os.getenv('CONTEXT_CACHE_TTL', 300))
+GENERATION_SCOPE = 'spa_context'
+
+
+class SpaContextCache:
+    """
+    Rendered context blocks keyed by (spa_id, kind). Every spa has a
+    version number shared by all worker processes through the
+    cache_generations table; admin writes bump it, which makes all of the
+    spa's cached blocks stale at once in every process. Entries also expire
+    after a TTL to pick up writes that didn't invalidate the spa.
+    """
+
+    def __init__(self, ttl: float = CONTEXT_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, str], Tuple[int, float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def version(self, spa_id: str) -> Optional[int]:
+        """Current context version for a spa, or None if it can't be read (don't cache then)."""
+        return safe_get_generation(GENERATION_SCOPE, spa_id)
+
+    def bump(self, spa_id: str) -> Optional[int]:
+        """Invalidate every cached block for a spa, in this process and the others."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == spa_id]:
+                del self._entries[key]
+        try:
+            return bump_generation(GENERATION_SCOPE, spa_id)
+        except Exception as e:
+            logger.error(f"Error bumping context version for {spa_id}: {str(e)}")
+            return None
+
+    def get_or_build(self, spa_id: str, kind: str, builder: Callable[[], Any]) -> Any:
+        """Return the cached block, rendering it with builder() when missing or stale."""
+        key = (spa_id, kind)
+        version = self.version(spa_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if version is not None and entry and entry[0] == version and time.monotonic() - entry[1] < self.ttl:
+                return entry[2]
+
+        value = builder()
+
+        # Don't store a block rendered before a concurrent bump
+        if version is not None and self.version(spa_id) == version:
+            with self._lock:
+                self._entries[key] = (version, time.monotonic(), value)
+        return value
+
+
+# Shared cache used by the chat and upsell context builders
+spa_context_cache = SpaContextCache()
+
+
+def get_context_version(spa_id: str) -> Optional[int]:
+    return spa_context_cache.version(spa_id)
+
+
+def invalidate_spa_context(spa_id: str) -> None:
+    """Call after writes to a spa's profile, services, brand settings or documents."""
+    if spa_id:
+        spa_context_cache.bump(spa_id)
@@ -0,0 +1,165 @@
+"""Local intent classification: keyword rules plus nearest-centroid over query embeddings."""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..rag.embeddings import generate_embeddings_batch
+
+logger = logging.getLogger(__name__)
+
+INTENT_LABELS = ['BOOKING', 'INFORMATION', 'PRICING', 'AVAILABILITY', 'OTHER']
+
+INTENT_EXAMPLES_PATH = os.getenv(
+    'INTENT_EXAMPLES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intent_examples.json')
+)
+# Gap required between the best and second-best centroid score before we trust it
+INTENT_MIN_MARGIN = float(os.getenv('INTENT_MIN_MARGIN', 0.04))
+# Added to the centroid score of every label whose keyword rules match
+INTENT_RULE_WEIGHT = float(os.getenv('INTENT_RULE_WEIGHT', 0.05))
+# Wait this long before retrying centroid construction after a failure
+INTENT_CENTROID_RETRY_SECONDS = 60
+
+INTENT_RULES = {
+    'BOOKING': [
+        r"\b(book|booking|schedule|reserve|reservation|sign (me|us)( \w+)? up|make an? (appointment|appt))\b",
+        r"\b(reschedule|cancel|move my)\b",
+        r"\b(i'?ll take|let'?s (go with|do)|yes,? please)\b"
+    ],
+    'PRICING': [
+        r"\b(price|prices|pricing|cost|costs|charge|rates?|fees?)\b",
+        r"\bhow much\b",
+        r"\b(discounts?|deals?|promotions?|cheap|cheaper|cheapest|expensive|affordable|gratuity)\b",
+        r"\$\s?\d"
+    ],
+    'AVAILABILITY': [
+        r"\b(available|availability|openings?|slots?|free spots?)\b",
+        r"\b(hours|open|close|closing)\b",
+        r"\b(earliest|how soon|right now|get in|when can i)\b"
+    ],
+    'INFORMATION': [
+        r"\b(what (is|are|does)|what's the difference|tell me about|do you (offer|have|use))\b",
+        r"\b(benefits?|how long|located|address|parking|policy|safe|wear|recommend)\b"
+    ],
+    'OTHER': [
+        r"^\s*(hi|hello|hey|good (morning|afternoon|evening)|thanks?|thank you|bye|goodbye|ok(ay)?|cool|lol)\b"
+    ]
+}
+
+# Labels that only win on rules when no more specific label matched
+_GENERIC_LABELS = {'INFORMATION', 'OTHER'}
+
+_COMPILED_RULES = {
+    label: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+    for label, patterns in INTENT_RULES.items()
+}
+
+
+def match_rules(message: str) -> List[str]:
+    """Labels whose keyword rules match the message."""
+    return [
+        label for label, patterns in _COMPILED_RULES.items()
+        if any(pattern.search(message) for pattern in patterns)
+    ]
+
+
+def load_examples(path: str = INTENT_EXAMPLES_PATH) -> Dict[str, List[Dict]]:
+    """Labelled examples: {'train': [...], 'test': [...]} of {'text', 'label'}."""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class IntentClassifier:
+    """
+    Decides a message's intent locally when it can. Unambiguous keyword
+    rules win outright; otherwise the query embedding is compared with
+    per-label centroids of the training examples. Returns no label when
+    neither is confident, so the caller can fall back to the LLM.
+    """
+
+    def __init__(self, examples_path: str = INTENT_EXAMPLES_PATH, min_margin: float = INTENT_MIN_MARGIN):
+        self.examples_path = examples_path
+        self.min_margin = min_margin
+        self._labels: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._failed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _load_centroids(self) -> Optional[np.ndarray]:
+        """Embed the training examples once (the embedding cache makes restarts cheap)."""
+        if self._centroids is not None:
+            return self._centroids
+        with self._lock:
+            if self._centroids is not None:
+                return self._centroids
+            if self._failed_at is not None and time.monotonic() - self._failed_at < INTENT_CENTROID_RETRY_SECONDS:
+                return None
+            try:
+                train = load_examples(self.examples_path)['train']
+                vectors = np.asarray(
+                    generate_embeddings_batch([example['text'] for example in train]),
+                    dtype=np.float32
+                )
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+                labels = sorted({example['label'] for example in train})
+                centroids = np.stack([
+                    vectors[[i for i, example in enumerate(train) if example['label'] == label]].mean(axis=0)
+                    for label in labels
+                ])
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+                self._labels = labels
+                self._centroids = centroids
+                logger.info(f"Built intent centroids from {len(train)} examples")
+            except Exception as e:
+                self._failed_at = time.monotonic()
+                logger.error(f"Could not build intent centroids: {str(e)}")
+            return self._centroids
+
+    def classify(self, message: str, query_embedding: Optional[List[float]] = None) -> Tuple[Optional[str], float, str]:
+        """
+        Returns (label, confidence, method) where method is 'rules' or
+        'centroid'. label is None when the classifier is unsure.
+        """
+        matched = match_rules(message)
+        specific = [label for label in matched if label not in _GENERIC_LABELS]
+        if len(specific) == 1:
+            return specific[0], 1.0, 'rules'
+        if not specific and len(matched) == 1:
+            return matched[0], 1.0, 'rules'
+
+        if query_embedding is None:
+            return None, 0.0, 'rules'
+        centroids = self._load_centroids()
+        if centroids is None:
+            return None, 0.0, 'centroid'
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = centroids @ query
+        for i, label in enumerate(self._labels):
+            if label in matched:
+                scores[i] += INTENT_RULE_WEIGHT
+
+        best, second = np.argsort(scores)[::-1][:2]
+        margin = float(scores[best] - scores[second])
+        if margin < self.min_margin:
+            return None, margin, 'centroid'
+        return self._labels[best], margin, 'centroid'
+
+
+# Shared classifier used by classify_turn
+intent_classifier = IntentClassifier()
+
+
+def classify_intent(message: str, query_embedding: Optional[List[float]] = None) -> Tuple[Optional[str], float, str]:
+    """Classify with the shared classifier."""
+    return intent_classifier.classify(message, query_embedding)
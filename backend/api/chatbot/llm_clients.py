@@ -0,0 +1,38 @@
+"""Shared AsyncOpenAI clients for the async chat path."""
+
+import asyncio
+import os
+import threading
+import weakref
+
+from openai import AsyncOpenAI
+
+from ..http_clients import new_openai_async_http_client, OPENAI_TIMEOUT
+
+# httpx pools are bound to the loop they were created on, so clients are kept per loop
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_async_client() -> AsyncOpenAI:
+    """AsyncOpenAI client for the running event loop, sharing one connection pool."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=os.getenv('OPENAI_API_KEY'),
+                timeout=OPENAI_TIMEOUT,
+                http_client=new_openai_async_http_client()
+            )
+            _clients[loop] = client
+        return client
+
+
+async def close_async_client() -> None:
+    """Close the running loop's client (call on server shutdown)."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _clients.pop(loop, None)
+    if client is not None:
+        await client.close()
@@ -1,62 +1,68 @@
 from openai import OpenAI
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Callable, Any, AsyncIterator, Tuple
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import time
 import os
 from models.database import SessionLocal, SpaService, Embedding, Document, DocumentChunk, SpaProfile, BrandSettings
 from sqlalchemy import func
 import numpy as np
 from ..rag.embeddings import generate_embeddings
+from ..rag.vector_index import get_index
 import traceback
-from ..services.upsell_service import UpsellService
+from ..services.upsell_service import UpsellService, get_brand_services, addon_options
+from ..services.upsell_ranking import rank_addons, conversation_text
+from .intent_classifier import classify_intent, INTENT_LABELS
+from .context_cache import spa_context_cache, get_context_version
+from .response_cache import response_cache, response_cache_enabled
+from .prompt_builder import build_prompt
+from .llm_clients import get_async_client
+from ..http_clients import get_openai_http_client
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Initialize OpenAI client (sync callers; the chat pipeline uses get_async_client)
+client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), http_client=get_openai_http_client())
+
+# Bounded pool for the blocking stages that run before the main completion
+CHAT_STAGE_WORKERS = int(os.getenv('CHAT_STAGE_WORKERS', 16))
+_stage_executor = ThreadPoolExecutor(max_workers=CHAT_STAGE_WORKERS, thread_name_prefix='ChatStage')
+
+async def _run_stage(name: str, timings: Dict[str, float], func: Callable, *args) -> Any:
+    """Run a blocking stage on the stage pool and record how long it took."""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_stage_executor, func, *args)
+    finally:
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+async def _timed(name: str, timings: Dict[str, float], awaitable) -> Any:
+    """Await a coroutine stage and record how long it took."""
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
 
 def cosine_similarity(a: List[float], b: List[float]) -> float:
     """Calculate cosine similarity between two vectors."""
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
-def get_relevant_context(query: str, spa_id: str, top_k: int = 3) -> Dict[str, List[str]]:
+def get_relevant_context(query: str, spa_id: str, top_k: int = 3, query_embedding: List[float] = None) -> Dict[str, List[str]]:
     """Get relevant context from the document embeddings, organized by type."""
     print("\n=== Getting Relevant Context ===")
     print(f"Query: {query}")
     print(f"Spa ID: {spa_id}")
     
-    db = SessionLocal()
     try:
-        # Get query embedding
-        query_embedding = generate_embeddings(query)
+        # Get query embedding (unless the caller already computed it)
+        if query_embedding is None:
+            query_embedding = generate_embeddings(query)
         
-        # Get all chunks for this spa
-        chunks = (
-            db.query(DocumentChunk)
-            .join(Document)
-            .filter(Document.spa_id == spa_id)
-            .filter(Document.processed == True)
-            .all()
-        )
-        
-        print(f"Found {len(chunks)} document chunks")
-        
-        if not chunks:
-            print("No processed documents found")
-            return {
-                'pricing': [],
-                'booking': [],
-                'service': [],
-                'staff': [],
-                'general': []
-            }
-        
-        # Calculate similarities
-        similarities = []
-        for chunk in chunks:
-            if chunk.embedding:  # Ensure chunk has embeddings
-                similarity = cosine_similarity(query_embedding, chunk.embedding)
-                similarities.append((chunk, similarity))
-        
-        # Sort by similarity
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        # Search the spa's in-memory vector index
+        index = get_index(spa_id)
+        print(f"Found {len(index)} document chunks")
         
         # Organize by type (for now, all chunks are considered 'general')
         context_by_type = {
@@ -67,17 +73,21 @@ def get_relevant_context(query: str, spa_id: str, top_k: int = 3) -> Dict[str, L
             'general': []
         }
         
+        if not len(index):
+            print("No processed documents found")
+            return context_by_type
+        
         # Take top k most relevant chunks
-        top_chunks = similarities[:top_k]
+        top_chunks = index.search(query_embedding, top_k)
         print(f"Selected {len(top_chunks)} most relevant chunks")
         
         for chunk, score in top_chunks:
             # For now, add all chunks to general category
             # TODO: Implement chunk type classification
             context_by_type['general'].append({
-                'content': chunk.content,
-                'score': float(score),
-                'source': chunk.document.name if chunk.document else 'Unknown'
+                'content': chunk['content'],
+                'score': score,
+                'source': chunk['source']
             })
         
         return context_by_type
@@ -92,11 +102,13 @@ def get_relevant_context(query: str, spa_id: str, top_k: int = 3) -> Dict[str, L
             'staff': [],
             'general': []
         }
-    finally:
-        db.close()
 
 def get_spa_context(spa_id: str = None) -> str:
-    """Get spa-specific context from the database."""
+    """Get spa-specific context, rendered once per spa context version."""
+    return spa_context_cache.get_or_build(spa_id, 'chat', lambda: _render_spa_context(spa_id))
+
+def _render_spa_context(spa_id: str = None) -> str:
+    """Build the spa context block from the database."""
     db = SessionLocal()
     try:
         # Get spa profile
@@ -148,114 +160,122 @@ def get_spa_context(spa_id: str = None) -> str:
     finally:
         db.close()
 
-def detect_intent(message: str) -> str:
-    """Detect user intent from message."""
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{
-            "role": "system",
-            "content": "Classify the user's intent into one of these categories: BOOKING, INFORMATION, PRICING, AVAILABILITY, OTHER"
-        }, {
-            "role": "user",
-            "content": message
-        }],
+# Service types assumed when the spa has no service catalog in its brand settings
+DEFAULT_SERVICE_TYPES = ['massage', 'facial']
+# Model for the structured turn plan (needs JSON mode)
+TURN_PLAN_MODEL = os.getenv('TURN_PLAN_MODEL', 'gpt-4-turbo-preview')
+
+TURN_PLAN_PROMPT = """Analyze the spa client's latest message in the context of the conversation.
+Return a JSON object with exactly these keys:
+- "intent": one of {intents}
+- "service_type": the service type being booked or asked about, one of {service_types}, or null
+- "addons": add-on names from the catalog below for that service type, most relevant to this client first (empty list if none fit)
+
+Add-on catalog by service type:
+{catalog}"""
+
+def _service_catalog(services: List[Dict]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """Bookable service types and the add-on names offered for each."""
+    types = {s.get('type') for s in services if s.get('type') and s.get('type') != 'add-on'}
+    addons: Dict[str, List[str]] = {}
+    for service in services:
+        if service.get('type') == 'add-on' and service.get('parent_type') and service.get('name'):
+            types.add(service['parent_type'])
+            addons.setdefault(service['parent_type'], []).append(service['name'])
+    return sorted(types) or list(DEFAULT_SERVICE_TYPES), addons
+
+def validate_turn_plan(raw: Dict, services: List[Dict]) -> Dict:
+    """Keep only an intent label, service type and add-on names that exist for this spa."""
+    types, addons = _service_catalog(services)
+    intent = str(raw.get('intent') or '').strip().upper()
+    if intent not in INTENT_LABELS:
+        intent = 'OTHER'
+
+    service_type = str(raw.get('service_type') or '').strip().lower()
+    service_type = next((t for t in types if t.lower() == service_type), None)
+
+    names = {name.lower(): name for name in addons.get(service_type, [])}
+    ranked = []
+    for name in raw.get('addons') or []:
+        match = names.get(str(name).strip().lower())
+        if match and match not in ranked:
+            ranked.append(match)
+    return {'intent': intent, 'service_type': service_type, 'addons': ranked}
+
+async def plan_turn(message: str, conversation_history: Optional[list], services: List[Dict]) -> Dict:
+    """One JSON-mode call for the intent, service type and ranked add-ons of a turn."""
+    types, addons = _service_catalog(services)
+    catalog = "\n".join(f"- {t}: {', '.join(addons.get(t, [])) or 'none'}" for t in types)
+    messages = [{
+        "role": "system",
+        "content": TURN_PLAN_PROMPT.format(intents=", ".join(INTENT_LABELS), service_types=", ".join(types), catalog=catalog)
+    }]
+    for msg in (conversation_history or [])[-3:]:  # Look at last 3 messages
+        messages.append({
+            "role": "user" if msg.get('isUser') else "assistant",
+            "content": msg.get('content', '')
+        })
+    messages.append({"role": "user", "content": message})
+
+    completion = await get_async_client().chat.completions.create(
+        model=TURN_PLAN_MODEL,
+        messages=messages,
         temperature=0,
-        max_tokens=50
+        max_tokens=150,
+        response_format={"type": "json_object"}
     )
-    return response.choices[0].message.content.strip()
+    return validate_turn_plan(json.loads(completion.choices[0].message.content), services)
 
-async def generate_response(
-    message: str, 
-    spa_id: Optional[str] = None, 
-    conversation_history: Optional[list] = None
+async def classify_turn(
+    message: str,
+    spa_id: Optional[str],
+    conversation_history: Optional[list],
+    query_embedding: List[float] = None
 ) -> Dict:
-    print("\n=== Generating Response ===")
-    print(f"Message: {message}")
-    print(f"Spa ID: {spa_id}")
-    
+    """
+    Intent of the turn, plus its service type and ranked add-ons. The local
+    classifier decides most turns; booking turns and turns it is unsure
+    about get the structured plan call instead of separate intent,
+    service type and upsell ranking calls.
+    """
+    loop = asyncio.get_running_loop()
+    intent, confidence, method = await loop.run_in_executor(_stage_executor, classify_intent, message, query_embedding)
+    if intent and intent != "BOOKING":
+        print(f"Intent {intent} from {method} (confidence {confidence:.2f})")
+        return {'intent': intent, 'service_type': None, 'addons': []}
+
+    print(f"Planning turn with the LLM (local: {intent or 'unsure'}, {method}, {confidence:.2f})")
     try:
-        # Get spa context and detect intent
-        spa_context = get_spa_context(spa_id)
-        intent = detect_intent(message)
-        print(f"Detected intent: {intent}")
-        
-        # Initialize upsell service with spa_id
-        upsell_service = UpsellService(spa_id=spa_id)
-        
-        # Get relevant context based on intent
-        relevant_context = ""
-        if spa_id:
-            context_by_type = get_relevant_context(message, spa_id)
-            
-            # Collect relevant documents based on intent
-            relevant_docs = []
-            if intent == "PRICING":
-                relevant_docs.extend(context_by_type['pricing'])
-                relevant_docs.extend(context_by_type['general'])
-            elif intent == "BOOKING":
-                relevant_docs.extend(context_by_type['booking'])
-                relevant_docs.extend(context_by_type['service'])
-                relevant_docs.extend(context_by_type['general'])
-                
-                # For booking intent, check if we should suggest upsells
-                service_type = await extract_service_type(message, conversation_history)
-                if service_type:
-                    upsell_options = await upsell_service.get_personalized_upsell(
-                        service_type=service_type,
-                        customer_history=conversation_history
-                    )
-                    if upsell_options:
-                        upsell_suggestion = upsell_service.format_upsell_message(
-                            service_type,
-                            upsell_options[0]  # Use the top suggestion
-                        )
-                        relevant_context += f"\n\nSuggested Upsell: {upsell_suggestion}"
-                
-            elif intent == "INFORMATION":
-                relevant_docs.extend(context_by_type['service'])
-                relevant_docs.extend(context_by_type['staff'])
-                relevant_docs.extend(context_by_type['general'])
-            else:
-                relevant_docs.extend(context_by_type['general'])
-            
-            # Format context from documents
-            if relevant_docs:
-                context_texts = []
-                for doc in relevant_docs:
-                    if isinstance(doc, dict):  # New format with metadata
-                        context_texts.append(f"From {doc['source']}: {doc['content']}")
-                    else:  # Old format (string only)
-                        context_texts.append(doc)
-                relevant_context = "\n\n".join(context_texts)
-                print(f"Found {len(relevant_docs)} relevant documents")
-            else:
-                print("No relevant documents found")
-        
-        # Initialize response dict
-        response_data = {
-            "message": "",
-            "intent": intent,
-            "actions": []
-        }
-        
-        # Build conversation context
-        conversation_context = []
-        if conversation_history:
-            for msg in conversation_history[-5:]:  # Only use last 5 messages
-                role = "user" if msg.get('isUser') else "assistant"
-                conversation_context.append({
-                    "role": role,
-                    "content": msg.get('content', '')
-                })
-        
-        # Add current message
-        conversation_context.append({
-            "role": "user",
-            "content": message
-        })
-        
-        # Create system message with context
-        system_message = f"""You are a friendly and knowledgeable spa assistant. Your goal is to provide a warm, personalized experience while helping clients discover the perfect spa services for their needs.
+        services = await loop.run_in_executor(_stage_executor, get_brand_services, spa_id)
+        plan = await plan_turn(message, conversation_history, services)
+    except Exception as e:
+        print(f"Error planning turn: {str(e)}")
+        plan = {'intent': 'OTHER', 'service_type': None, 'addons': []}
+    if intent:
+        plan['intent'] = intent  # a confident local BOOKING stands
+    return plan
+
+def _upsell_suggestion(spa_id: str, plan: Dict, conversation_history: Optional[list], message: str) -> Optional[str]:
+    """Top add-on for the planned service type, ranked locally; the plan's order breaks ties."""
+    services = get_brand_services(spa_id)
+    options = addon_options(services, plan['service_type'], ranked=plan['addons'])
+    upsell_options, _ = rank_addons(
+        spa_id, plan['service_type'], options, services, conversation_text(conversation_history, message)
+    )
+    if not upsell_options:
+        return None
+    return UpsellService.format_upsell_message(plan['service_type'], upsell_options[0])  # Use the top suggestion
+
+def _query_embedding(message: str) -> Optional[List[float]]:
+    """Embed the message once for both intent detection and retrieval."""
+    try:
+        return generate_embeddings(message)
+    except Exception as e:
+        print(f"Error embedding query: {str(e)}")
+        return None
+
+# Fixed instructions for the chat completion; context sections are packed in by build_prompt
+SYSTEM_PROMPT_TEMPLATE = """You are a friendly and knowledgeable spa assistant. Your goal is to provide a warm, personalized experience while helping clients discover the perfect spa services for their needs.
 
 Spa Information:
 {spa_context}
@@ -302,27 +322,183 @@ Interaction Guidelines:
 7. For booking inquiries, guide clients through the process and explain next steps
 
 Remember to maintain a professional yet approachable demeanor while providing accurate information from the context."""
+
+def _response_cache_version(spa_id: str) -> Optional[int]:
+    """Context version to cache the spa's answers under; None when its response cache is off."""
+    if not response_cache_enabled(spa_id):
+        return None
+    return get_context_version(spa_id)
+
+async def prepare_response(
+    message: str, 
+    spa_id: Optional[str] = None, 
+    conversation_history: Optional[list] = None,
+    context: Optional[str] = None
+) -> Dict:
+    """Gather context for a chat turn and build the completion messages."""
+    print("\n=== Generating Response ===")
+    print(f"Message: {message}")
+    print(f"Spa ID: {spa_id}")
+    
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    
+    # Spa context runs alongside the query embedding, which intent detection and retrieval share
+    spa_context_stage = asyncio.ensure_future(
+        _run_stage('spa_context', timings, get_spa_context, spa_id) if context is None else asyncio.sleep(0, context)
+    )
+    query_embedding = await _run_stage('embedding', timings, _query_embedding, message)
+    
+    # First-turn questions can be answered from the spa's semantic response cache
+    cache_key = None
+    version = None
+    if query_embedding is not None and not conversation_history:
+        version = await _run_stage('response_cache', timings, _response_cache_version, spa_id)
+    if version is not None:
+        cache_key = (spa_id, query_embedding, version)
+        hit = response_cache.lookup(*cache_key)
+        if hit:
+            cached, similarity = hit
+            spa_context_stage.cancel()
+            print(f"Response cache hit (similarity {similarity:.3f})")
+            return {
+                "intent": cached["intent"],
+                "cached": cached,
+                "similarity": similarity,
+                "timings": timings,
+                "started": started
+            }
+    
+    stages = [
+        spa_context_stage,
+        _timed('intent', timings, classify_turn(message, spa_id, conversation_history, query_embedding)),
+        _run_stage('retrieval', timings, get_relevant_context, message, spa_id, 3, query_embedding) if spa_id else asyncio.sleep(0, None)
+    ]
+    spa_context, plan, context_by_type = await asyncio.gather(*stages)
+    intent = plan['intent']
+    print(f"Detected intent: {intent}")
+    
+    # Collect relevant documents based on intent
+    relevant_docs = []
+    upsell_suggestions = []
+    if spa_id:
+        if intent == "PRICING":
+            relevant_docs.extend(context_by_type['pricing'])
+            relevant_docs.extend(context_by_type['general'])
+        elif intent == "BOOKING":
+            relevant_docs.extend(context_by_type['booking'])
+            relevant_docs.extend(context_by_type['service'])
+            relevant_docs.extend(context_by_type['general'])
+            
+            # For booking intent, check if we should suggest upsells
+            if plan['service_type']:
+                upsell_suggestion = await _run_stage(
+                    'upsell', timings, _upsell_suggestion, spa_id, plan, conversation_history, message
+                )
+                if upsell_suggestion:
+                    upsell_suggestions.append(f"Suggested Upsell: {upsell_suggestion}")
+            
+        elif intent == "INFORMATION":
+            relevant_docs.extend(context_by_type['service'])
+            relevant_docs.extend(context_by_type['staff'])
+            relevant_docs.extend(context_by_type['general'])
+        else:
+            relevant_docs.extend(context_by_type['general'])
+        
+        print(f"Found {len(relevant_docs)} relevant documents" if relevant_docs else "No relevant documents found")
+    
+    # Build conversation context
+    conversation_context = []
+    if conversation_history:
+        for msg in conversation_history[-5:]:  # Only use last 5 messages
+            role = "user" if msg.get('isUser') else "assistant"
+            conversation_context.append({
+                "role": role,
+                "content": msg.get('content', '')
+            })
+    
+    # Pack spa facts, documents and history into the prompt token budget
+    messages, prompt_tokens = build_prompt(
+        SYSTEM_PROMPT_TEMPLATE,
+        spa_context,
+        [doc if isinstance(doc, dict) else {'content': doc, 'score': 0, 'source': None} for doc in relevant_docs],
+        conversation_context,
+        message,
+        extras=upsell_suggestions
+    )
+    print(f"Prompt tokens: {prompt_tokens}")
+    
+    return {
+        "intent": intent,
+        "messages": messages,
+        "prompt_tokens": prompt_tokens,
+        "timings": timings,
+        "started": started,
+        "cache_key": cache_key
+    }
+
+def _remember_response(prepared: Dict, response_data: Dict) -> None:
+    """Store a freshly generated answer in the response cache when the turn is cacheable."""
+    if prepared.get("cache_key"):
+        response_cache.store(*prepared["cache_key"], {
+            "message": response_data["message"],
+            "intent": response_data["intent"],
+            "actions": response_data["actions"]
+        }, prepared["timings"].get('total', 0.0))
+
+def _cached_response(prepared: Dict) -> Dict:
+    """Response for a cache hit, with timings and the match similarity."""
+    timings = prepared["timings"]
+    timings['total'] = round((time.perf_counter() - prepared["started"]) * 1000, 1)
+    return {
+        **prepared["cached"],
+        "metadata": {
+            "timings_ms": timings,
+            "cache": {"hit": True, "similarity": round(prepared["similarity"], 4)}
+        }
+    }
+
+def _response_actions(intent: str) -> List[Dict]:
+    """Client actions for the detected intent."""
+    actions = []
+    # Add booking action if intent is BOOKING
+    if intent == "BOOKING":
+        actions.append({
+            "type": "SHOW_CALENDAR"
+        })
+    return actions
+
+async def generate_response(
+    message: str, 
+    spa_id: Optional[str] = None, 
+    conversation_history: Optional[list] = None,
+    context: Optional[str] = None
+) -> Dict:
+    try:
+        prepared = await prepare_response(message, spa_id, conversation_history, context)
+        if prepared.get("cached"):
+            return _cached_response(prepared)
+        timings = prepared["timings"]
         
         # Generate response using OpenAI
-        response = client.chat.completions.create(
+        completion_start = time.perf_counter()
+        response = await get_async_client().chat.completions.create(
             model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": system_message},
-                *conversation_context
-            ],
+            messages=prepared["messages"],
             temperature=0.7,
             max_tokens=500
         )
+        timings['completion'] = round((time.perf_counter() - completion_start) * 1000, 1)
+        timings['total'] = round((time.perf_counter() - prepared["started"]) * 1000, 1)
+        print(f"Stage timings (ms): {timings}")
         
-        # Extract response text
-        response_data["message"] = response.choices[0].message.content
-
-        # Add booking action if intent is BOOKING
-        if intent == "BOOKING":
-            response_data["actions"].append({
-                "type": "SHOW_CALENDAR"
-            })
-        
+        response_data = {
+            "message": response.choices[0].message.content,
+            "intent": prepared["intent"],
+            "actions": _response_actions(prepared["intent"]),
+            "metadata": {"timings_ms": timings, "prompt_tokens": prepared["prompt_tokens"]}
+        }
+        _remember_response(prepared, response_data)
         return response_data
         
     except Exception as e:
@@ -334,6 +510,65 @@ Remember to maintain a professional yet approachable demeanor while providing ac
             "actions": []
         }
 
+async def astream_response(
+    message: str, 
+    spa_id: Optional[str] = None, 
+    conversation_history: Optional[list] = None,
+    context: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Streaming variant of generate_response. Yields ('token', {'token': ...})
+    events as the completion arrives, then one ('done', ...) event with the
+    intent, actions and timings, or an ('error', ...) event.
+    """
+    try:
+        prepared = await prepare_response(message, spa_id, conversation_history, context)
+        if prepared.get("cached"):
+            cached = _cached_response(prepared)
+            yield 'token', {'token': cached.pop("message")}
+            yield 'done', cached
+            return
+        timings = prepared["timings"]
+        
+        completion_start = time.perf_counter()
+        stream = await get_async_client().chat.completions.create(
+            model="gpt-4-turbo-preview",
+            messages=prepared["messages"],
+            temperature=0.7,
+            max_tokens=500,
+            stream=True
+        )
+        tokens = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                if 'first_token' not in timings:
+                    timings['first_token'] = round((time.perf_counter() - prepared["started"]) * 1000, 1)
+                tokens.append(token)
+                yield 'token', {'token': token}
+        timings['completion'] = round((time.perf_counter() - completion_start) * 1000, 1)
+        timings['total'] = round((time.perf_counter() - prepared["started"]) * 1000, 1)
+        print(f"Stage timings (ms): {timings}")
+        
+        actions = _response_actions(prepared["intent"])
+        _remember_response(prepared, {"message": "".join(tokens), "intent": prepared["intent"], "actions": actions})
+        yield 'done', {
+            "intent": prepared["intent"],
+            "actions": actions,
+            "metadata": {"timings_ms": timings, "prompt_tokens": prepared["prompt_tokens"]}
+        }
+        
+    except Exception as e:
+        print(f"Error streaming response: {str(e)}")
+        print(f"Stack trace: {traceback.format_exc()}")
+        yield 'error', {
+            "message": "I apologize, but I encountered an error while processing your request. Please try again.",
+            "intent": "ERROR",
+            "actions": []
+        }
+
 def extract_service_id(message: str, conversation_history: list) -> Optional[int]:
     """Extract service ID from conversation context"""
     try:
@@ -355,41 +590,3 @@ def extract_service_id(message: str, conversation_history: list) -> Optional[int
         return service_id
     except:
         return None
-
-async def extract_service_type(message: str, conversation_history: list) -> Optional[str]:
-    """Extract the service type from the conversation context."""
-    try:
-        # Ask GPT to identify the service type
-        messages = [
-            {
-                "role": "system",
-                "content": "Extract the spa service type from the conversation. Return only 'massage' or 'facial' if mentioned, otherwise return 'none'."
-            }
-        ]
-        
-        # Add conversation history
-        if conversation_history:
-            for msg in conversation_history[-3:]:  # Look at last 3 messages
-                role = "user" if msg.get('isUser') else "assistant"
-                messages.append({
-                    "role": role,
-                    "content": msg.get('content', '')
-                })
-        
-        # Add current message
-        messages.append({
-            "role": "user",
-            "content": message
-        })
-        
-        completion = await client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,
-            temperature=0,
-            max_tokens=10
-        )
-        
-        service_type = completion.choices[0].message.content.strip().lower()
-        return service_type if service_type != "none" else None
-    except:
-        return None 
\ No newline at end of file
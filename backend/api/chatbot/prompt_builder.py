@@ -0,0 +1,143 @@
+"""Token-budgeted assembly of the chat completion prompt."""
+
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from ..rag.embeddings import count_tokens, truncate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Total prompt budget (system message plus history plus the current message)
+PROMPT_MAX_TOKENS = int(os.getenv('PROMPT_MAX_TOKENS', 6000))
+# Share of the budget left after the fixed instructions and the current message
+PROMPT_SECTION_SHARES = {'documents': 0.45, 'spa_facts': 0.3, 'history': 0.25}
+# Sections that receive unused budget from the others, in this order
+PROMPT_OVERFLOW_ORDER = ['documents', 'history', 'spa_facts']
+# Chunks whose word shingles overlap at least this much with a kept chunk are dropped
+CHUNK_DUPLICATE_OVERLAP = 0.8
+# A chunk is only cut to fit when at least this many tokens of it would remain
+MIN_PARTIAL_CHUNK_TOKENS = 50
+# Per-message overhead of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def dedupe_chunks(chunks: List[Dict]) -> List[Dict]:
+    """Highest-scored first, dropping chunks that mostly repeat one already kept."""
+    kept, kept_shingles = [], []
+    for chunk in sorted(chunks, key=lambda c: c.get('score', 0), reverse=True):
+        shingles = _shingles(chunk['content'])
+        if any(len(shingles & other) / max(1, min(len(shingles), len(other))) >= CHUNK_DUPLICATE_OVERLAP
+               for other in kept_shingles):
+            continue
+        kept.append(chunk)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def _allocate(available: int, needs: Dict[str, int]) -> Dict[str, int]:
+    """Split the budget by share, then hand unused budget to sections that need more."""
+    budgets = {name: int(available * share) for name, share in PROMPT_SECTION_SHARES.items()}
+    surplus = sum(max(0, budgets[name] - needs[name]) for name in budgets)
+    budgets = {name: min(budgets[name], needs[name]) for name in budgets}
+    for name in PROMPT_OVERFLOW_ORDER:
+        extra = min(surplus, needs[name] - budgets[name])
+        budgets[name] += extra
+        surplus -= extra
+    return budgets
+
+
+def _chunk_text(chunk: Dict) -> str:
+    return f"From {chunk['source']}: {chunk['content']}" if chunk.get('source') else chunk['content']
+
+
+def _pack_documents(chunks: List[Dict], extras: List[str], budget: int) -> Tuple[str, int]:
+    """Extras first, then chunks by score until the budget runs out; lowest scores are cut."""
+    parts, used = [], 0
+    for text in extras:
+        tokens = count_tokens(text)
+        if used + tokens <= budget:
+            parts.append(text)
+            used += tokens
+    for chunk in chunks:
+        text = _chunk_text(chunk)
+        tokens = count_tokens(text) + 1
+        if used + tokens <= budget:
+            parts.append(text)
+            used += tokens
+        elif budget - used >= MIN_PARTIAL_CHUNK_TOKENS:
+            parts.append(truncate_tokens(text, budget - used - 1))
+            used = budget
+            break
+        else:
+            break
+    return "\n\n".join(parts), used
+
+
+def _pack_history(history: List[Dict], budget: int) -> Tuple[List[Dict], int]:
+    """Keep the most recent messages that fit; the oldest are dropped first."""
+    kept, used = [], 0
+    for msg in reversed(history):
+        tokens = count_tokens(msg['content']) + MESSAGE_OVERHEAD_TOKENS
+        if used + tokens > budget:
+            break
+        kept.append(msg)
+        used += tokens
+    return list(reversed(kept)), used
+
+
+def build_prompt(
+    template: str,
+    spa_context: str,
+    chunks: List[Dict],
+    history: List[Dict],
+    message: str,
+    extras: Optional[List[str]] = None,
+    max_tokens: int = PROMPT_MAX_TOKENS
+) -> Tuple[List[Dict], Dict[str, int]]:
+    """
+    Assemble the completion messages within max_tokens. The template's
+    fixed instructions and the current message are always kept; spa
+    facts, retrieved chunks and history share the rest by budget.
+    Returns the messages and the token count of each section.
+    """
+    extras = extras or []
+    chunks = dedupe_chunks(chunks)
+    instructions_tokens = count_tokens(template.format(spa_context="", relevant_context=""))
+    message_tokens = count_tokens(message) + MESSAGE_OVERHEAD_TOKENS
+    available = max(0, max_tokens - instructions_tokens - message_tokens - MESSAGE_OVERHEAD_TOKENS)
+
+    needs = {
+        'spa_facts': count_tokens(spa_context),
+        'documents': sum(count_tokens(text) for text in extras) +
+                     sum(count_tokens(_chunk_text(chunk)) + 1 for chunk in chunks),
+        'history': sum(count_tokens(msg['content']) + MESSAGE_OVERHEAD_TOKENS for msg in history)
+    }
+    budgets = _allocate(available, needs)
+
+    spa_facts = spa_context if needs['spa_facts'] <= budgets['spa_facts'] else truncate_tokens(spa_context, budgets['spa_facts'])
+    relevant_context, documents_tokens = _pack_documents(chunks, extras, budgets['documents'])
+    history, history_tokens = _pack_history(history, budgets['history'])
+
+    counts = {
+        'instructions': instructions_tokens,
+        'spa_facts': count_tokens(spa_facts),
+        'documents': documents_tokens,
+        'history': history_tokens,
+        'message': message_tokens
+    }
+    counts['total'] = sum(counts.values()) + MESSAGE_OVERHEAD_TOKENS
+    logger.info(f"Prompt tokens {counts} (budget {max_tokens}, needs {needs})")
+
+    messages = [
+        {"role": "system", "content": template.format(spa_context=spa_facts, relevant_context=relevant_context)},
+        *history,
+        {"role": "user", "content": message}
+    ]
+    return messages, counts
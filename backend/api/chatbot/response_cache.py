@@ -0,0 +1,198 @@
+"""Opt-in semantic cache of chat answers, keyed on the query embedding."""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from models.database import SessionLocal, Client
+from .context_cache import spa_context_cache
+
+logger = logging.getLogger(__name__)
+
+# Minimum cosine similarity between questions for a stored answer to be reused
+RESPONSE_CACHE_SIMILARITY = float(os.getenv('RESPONSE_CACHE_SIMILARITY', 0.95))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 500))
+
+# Answers for these intents are personal or transient and never cached
+UNCACHEABLE_INTENTS = {'BOOKING', 'ERROR'}
+
+
+class _SpaResponses:
+    """One spa's cached answers, least recently used first."""
+
+    def __init__(self):
+        self.entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self.next_id = 0
+        # Context version every entry was produced under
+        self.version: Optional[int] = None
+        # Entry embeddings stacked row by row; rebuilt only after entries are added or dropped
+        self.ids: List[int] = []
+        self.matrix: Optional[np.ndarray] = None
+        self.created: Optional[np.ndarray] = None
+        self.stats = {'lookups': 0, 'hits': 0, 'stores': 0, 'evictions': 0, 'latency_saved_ms': 0.0}
+
+    def reset(self, version: Optional[int]) -> None:
+        self.entries.clear()
+        self.version = version
+        self.matrix = None
+
+    def drop(self, entry_id: int) -> None:
+        del self.entries[entry_id]
+        self.matrix = None
+
+    def index(self) -> None:
+        """Stack the entries' embeddings and creation times if they changed since the last lookup."""
+        if self.matrix is not None:
+            return
+        self.ids = list(self.entries)
+        self.matrix = np.stack([self.entries[entry_id]['embedding'] for entry_id in self.ids])
+        self.created = np.array([self.entries[entry_id]['created'] for entry_id in self.ids])
+
+
+class ResponseCache:
+    """
+    Per-spa LRU of answered first-turn questions. A lookup returns the
+    stored answer of the most similar question when the similarity passes
+    the threshold, the entry is younger than the TTL and was produced
+    under the spa's current context version. The version comes from the
+    cross-process context generation, so a write handled by another worker
+    process also retires the answers cached here.
+    """
+
+    def __init__(self, threshold: float = RESPONSE_CACHE_SIMILARITY, ttl: float = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._spas: Dict[str, _SpaResponses] = {}
+        self._lock = threading.Lock()
+
+    def _spa(self, spa_id: str) -> _SpaResponses:
+        if spa_id not in self._spas:
+            self._spas[spa_id] = _SpaResponses()
+        return self._spas[spa_id]
+
+    def lookup(self, spa_id: str, embedding: List[float], version: Optional[int]) -> Optional[Tuple[Dict, float]]:
+        """Return (response, similarity) for a close enough question, or None."""
+        if version is None:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        now = time.monotonic()
+
+        with self._lock:
+            spa = self._spa(spa_id)
+            spa.stats['lookups'] += 1
+
+            # Answers from an older context version are all stale
+            if spa.version != version:
+                spa.reset(version)
+            if not spa.entries:
+                return None
+
+            spa.index()
+            expired = np.flatnonzero(now - spa.created >= self.ttl)
+            if len(expired):
+                for position in expired:
+                    spa.drop(spa.ids[position])
+                if not spa.entries:
+                    return None
+                spa.index()
+
+            scores = spa.matrix @ query
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                return None
+
+            entry_id = spa.ids[best]
+            entry = spa.entries[entry_id]
+            spa.entries.move_to_end(entry_id)
+            spa.stats['hits'] += 1
+            spa.stats['latency_saved_ms'] += entry['latency_ms']
+            return dict(entry['response']), similarity
+
+    def store(self, spa_id: str, embedding: List[float], version: Optional[int], response: Dict,
+              latency_ms: float) -> None:
+        """Remember an answer produced under the given context version."""
+        if version is None or response.get('intent') in UNCACHEABLE_INTENTS:
+            return
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+        with self._lock:
+            spa = self._spa(spa_id)
+            if spa.version is not None and version < spa.version:
+                # Produced before the context changed
+                return
+            if spa.version != version:
+                spa.reset(version)
+            spa.entries[spa.next_id] = {
+                'embedding': vector,
+                'response': response,
+                'created': time.monotonic(),
+                'latency_ms': latency_ms
+            }
+            spa.matrix = None
+            spa.next_id += 1
+            spa.stats['stores'] += 1
+            while len(spa.entries) > self.max_entries:
+                spa.drop(next(iter(spa.entries)))
+                spa.stats['evictions'] += 1
+
+    def clear(self, spa_id: str) -> None:
+        with self._lock:
+            if spa_id in self._spas:
+                self._spas[spa_id].reset(None)
+
+    def _summary(self, spa: _SpaResponses) -> Dict:
+        stats = dict(spa.stats)
+        stats['entries'] = len(spa.entries)
+        stats['misses'] = stats['lookups'] - stats['hits']
+        stats['hit_rate'] = round(stats['hits'] / stats['lookups'], 4) if stats['lookups'] else 0.0
+        stats['latency_saved_ms'] = round(stats['latency_saved_ms'], 1)
+        return stats
+
+    def stats(self, spa_id: str = None) -> Dict:
+        """Hit rate and latency saved, for one spa or for all spas with totals."""
+        with self._lock:
+            if spa_id is not None:
+                return self._summary(self._spa(spa_id))
+
+            spas = {spa_id: self._summary(spa) for spa_id, spa in self._spas.items()}
+        totals = {key: sum(spa[key] for spa in spas.values())
+                  for key in ('lookups', 'hits', 'misses', 'stores', 'evictions', 'entries', 'latency_saved_ms')}
+        totals['hit_rate'] = round(totals['hits'] / totals['lookups'], 4) if totals['lookups'] else 0.0
+        totals['latency_saved_ms'] = round(totals['latency_saved_ms'], 1)
+        return {'totals': totals, 'spas': spas}
+
+
+# Shared cache used by the chat pipeline
+response_cache = ResponseCache()
+
+
+def _load_enabled(spa_id: str) -> bool:
+    db = SessionLocal()
+    try:
+        client = db.query(Client).filter_by(spa_id=spa_id).first()
+        config = (client.config or {}) if client else {}
+        return bool(config.get('response_cache', {}).get('enabled', False))
+    finally:
+        db.close()
+
+
+def response_cache_enabled(spa_id: str) -> bool:
+    """Whether the spa opted in; cached with the spa's other context blocks."""
+    if not spa_id:
+        return False
+    try:
+        return spa_context_cache.get_or_build(spa_id, 'response_cache_enabled', lambda: _load_enabled(spa_id))
+    except Exception as e:
+        logger.error(f"Error reading response cache setting for {spa_id}: {str(e)}")
+        return False
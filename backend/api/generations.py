@@ -0,0 +1,65 @@
+"""
+Cross-process cache generations. Each worker process keeps its own
+in-memory caches, so a write handled by one process bumps a counter in
+the database and every process compares it before serving a cached value.
+"""
+
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from models.database import SessionLocal, CacheGeneration
+
+logger = logging.getLogger(__name__)
+
+
+def get_generation(scope: str, key, db=None) -> int:
+    """Current generation of (scope, key); 0 until it is first bumped."""
+    session = db or SessionLocal()
+    try:
+        value = session.query(CacheGeneration.generation).filter_by(scope=scope, key=str(key)).scalar()
+        return value or 0
+    finally:
+        if db is None:
+            session.close()
+
+
+def bump_generation(scope: str, key, db=None) -> int:
+    """
+    Increment (scope, key) and return the new generation. With `db` the
+    bump joins the caller's transaction and commits with it; otherwise it
+    is committed on its own session.
+    """
+    session = db or SessionLocal()
+    try:
+        values = {'generation': CacheGeneration.generation + 1, 'updated_at': datetime.utcnow()}
+        statement = update(CacheGeneration).where(
+            CacheGeneration.scope == scope, CacheGeneration.key == str(key)
+        ).values(**values)
+        if session.execute(statement).rowcount == 0:
+            try:
+                with session.begin_nested():
+                    session.add(CacheGeneration(scope=scope, key=str(key), generation=1,
+                                                updated_at=datetime.utcnow()))
+            except IntegrityError:
+                # Another process created the row first
+                session.execute(statement)
+        generation = get_generation(scope, key, session)
+        if db is None:
+            session.commit()
+        return generation
+    finally:
+        if db is None:
+            session.close()
+
+
+def safe_get_generation(scope: str, key) -> Optional[int]:
+    """get_generation for cache reads: None (treat the cache as stale) if the lookup fails."""
+    try:
+        return get_generation(scope, key)
+    except Exception as e:
+        logger.error(f"Error reading {scope} generation for {key}: {str(e)}")
+        return None
@@ -0,0 +1,117 @@
+"""
+Shared outbound HTTP clients. Integrations get a pooled requests.Session
+per policy (keep-alive, timeouts, retry with backoff) and OpenAI callers
+share one httpx pool, so short calls reuse warm TLS connections.
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connections kept alive per host in each session's pool
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 20))
+# Requests in flight to one host across all sessions and threads
+HTTP_HOST_CONCURRENCY = int(os.getenv('HTTP_HOST_CONCURRENCY', 10))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+
+# OpenAI pool, shared by the chat client and the embeddings client
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 200))
+OPENAI_MAX_KEEPALIVE = int(os.getenv('OPENAI_MAX_KEEPALIVE', 50))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 60))
+
+# Per-integration policies: read timeout (s), retries and backoff factor.
+# Only idempotent methods are retried after a response or read error;
+# connection failures are retried for every method since nothing was sent.
+HTTP_POLICIES = {
+    'default': {'read_timeout': 15, 'retries': 2, 'backoff': 0.5},
+    'calendar': {'read_timeout': 15, 'retries': 3, 'backoff': 0.5},
+    'webhooks': {'read_timeout': 5, 'retries': 2, 'backoff': 0.3},
+}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_sessions: Dict[str, requests.Session] = {}
+_host_limits: Dict[str, threading.BoundedSemaphore] = {}
+_lock = threading.Lock()
+_openai_http_client: Optional[httpx.Client] = None
+
+
+def _host_limit(host: str) -> threading.BoundedSemaphore:
+    with _lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(HTTP_HOST_CONCURRENCY)
+        return _host_limits[host]
+
+
+class PooledSession(requests.Session):
+    """Session that applies a default timeout and the per-host concurrency limit."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.default_timeout)
+        with _host_limit(urlsplit(url).netloc):
+            return super().request(method, url, **kwargs)
+
+
+def _build_session(policy: Dict) -> PooledSession:
+    retry = Retry(
+        total=policy['retries'],
+        backoff_factor=policy['backoff'],
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=HTTP_POOL_MAXSIZE, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session = PooledSession(timeout=(HTTP_CONNECT_TIMEOUT, policy['read_timeout']))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(name: str = 'default') -> requests.Session:
+    """Shared session for an integration, using its policy in HTTP_POLICIES."""
+    with _lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = _build_session(HTTP_POLICIES.get(name, HTTP_POLICIES['default']))
+            _sessions[name] = session
+        return session
+
+
+def _openai_limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_KEEPALIVE)
+
+
+def get_openai_http_client() -> httpx.Client:
+    """Shared httpx pool for the sync OpenAI and embeddings clients."""
+    global _openai_http_client
+    with _lock:
+        if _openai_http_client is None:
+            _openai_http_client = httpx.Client(limits=_openai_limits(), timeout=OPENAI_TIMEOUT)
+        return _openai_http_client
+
+
+def new_openai_async_http_client() -> httpx.AsyncClient:
+    """httpx pool for an AsyncOpenAI client; async pools belong to one event loop."""
+    return httpx.AsyncClient(limits=_openai_limits(), timeout=OPENAI_TIMEOUT)
+
+
+def close_http_clients() -> None:
+    """Close every shared pool (process shutdown)."""
+    global _openai_http_client
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+        openai_client, _openai_http_client = _openai_http_client, None
+    for session in sessions:
+        session.close()
+    if openai_client is not None:
+        openai_client.close()
@@ -1,5 +1,4 @@
 from typing import Dict, List, Optional
-import requests
 from datetime import datetime, timedelta
 import os
 import logging
@@ -8,9 +7,15 @@ from sqlalchemy import func
 from models.database import Appointment, Client, SessionLocal
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from ..http_clients import get_session
+from ..services.upsell_ranking import cobooking_cache
+from .slot_cache import slot_cache, fetch_start
 
 logger = logging.getLogger(__name__)
 
+class ProviderError(Exception):
+    """A calendar provider couldn't be reached or didn't answer a slot request."""
+
 class CalendarConnector:
     """
     Flexible calendar connector that can integrate with various calendar systems.
@@ -34,24 +39,38 @@ class CalendarConnector:
         }
 
     def get_available_slots(self, date: datetime) -> List[Dict]:
-        """Fetch available slots from the calendar system"""
+        """Available slots on the given day; provider answers come from the slot cache"""
         try:
-            if self.calendar_type in self.SUPPORTED_CALENDARS:
-                return self.SUPPORTED_CALENDARS[self.calendar_type]('get_slots', date)
-            else:
-                return self._handle_custom_calendar('get_slots', date)
+            if self.calendar_type == 'none':
+                return self.fetch_slots(date)
+            day = date.date()
+            return slot_cache.get(self.spa_id, self.calendar_type, day, lambda: self.fetch_slots(fetch_start(day)))
                 
         except Exception as e:
             logger.error(f"Error fetching slots for {self.calendar_type}: {str(e)}")
             return []
 
+    def fetch_slots(self, date: datetime) -> List[Dict]:
+        """
+        Fetch available slots from the calendar system, bypassing the cache.
+        Raises ProviderError when the provider fails, so the slot cache
+        keeps its previous answer instead of storing an empty day.
+        """
+        if self.calendar_type in self.SUPPORTED_CALENDARS:
+            return self.SUPPORTED_CALENDARS[self.calendar_type]('get_slots', date)
+        else:
+            return self._handle_custom_calendar('get_slots', date)
+
     def book_appointment(self, appointment_data: Dict) -> bool:
         """Book an appointment in the calendar system"""
         try:
             if self.calendar_type in self.SUPPORTED_CALENDARS:
-                return self.SUPPORTED_CALENDARS[self.calendar_type]('book', appointment_data)
+                booked = self.SUPPORTED_CALENDARS[self.calendar_type]('book', appointment_data)
             else:
-                return self._handle_custom_calendar('book', appointment_data)
+                booked = self._handle_custom_calendar('book', appointment_data)
+            if booked and isinstance(appointment_data.get('datetime'), datetime):
+                slot_cache.invalidate(self.spa_id, appointment_data['datetime'].date())
+            return booked
                 
         except Exception as e:
             logger.error(f"Error booking appointment for {self.calendar_type}: {str(e)}")
@@ -64,7 +83,9 @@ class CalendarConnector:
         """
         if not self.api_base_url or not self.api_key:
             logger.error(f"Missing API configuration for calendar type: {self.calendar_type}")
-            return [] if action == 'get_slots' else False
+            if action == 'get_slots':
+                raise ProviderError(f"Missing API configuration for calendar type: {self.calendar_type}")
+            return False
 
         try:
             headers = {
@@ -74,14 +95,14 @@ class CalendarConnector:
 
             if action == 'get_slots':
                 endpoint = f"{self.api_base_url}/available-slots"
-                response = requests.get(
+                response = get_session('calendar').get(
                     endpoint,
                     params={'date': data.strftime('%Y-%m-%d')},
                     headers=headers
                 )
             else:  # book
                 endpoint = f"{self.api_base_url}/appointments"
-                response = requests.post(
+                response = get_session('calendar').post(
                     endpoint,
                     json=data,
                     headers=headers
@@ -91,20 +112,28 @@ class CalendarConnector:
                 return response.json().get('slots', []) if action == 'get_slots' else True
             else:
                 logger.error(f"API error: {response.status_code} - {response.text}")
-                return [] if action == 'get_slots' else False
+                if action == 'get_slots':
+                    raise ProviderError(f"{self.calendar_type} API returned {response.status_code}")
+                return False
 
+        except ProviderError:
+            raise
         except Exception as e:
             logger.error(f"Error with custom calendar API: {str(e)}")
-            return [] if action == 'get_slots' else False
+            if action == 'get_slots':
+                raise ProviderError(str(e)) from e
+            return False
 
     def _handle_acuity(self, action: str, data: any) -> any:
         """Handle Acuity Scheduling API"""
         if not self.api_key:
-            return [] if action == 'get_slots' else False
+            if action == 'get_slots':
+                raise ProviderError("Missing Acuity API key")
+            return False
             
         try:
             if action == 'get_slots':
-                response = requests.get(
+                response = get_session('calendar').get(
                     'https://acuityscheduling.com/api/v1/availability/times',
                     params={
                         'date': data.strftime('%Y-%m-%d'),
@@ -112,6 +141,8 @@ class CalendarConnector:
                     },
                     headers={'Authorization': f'Bearer {self.api_key}'}
                 )
+                if response.status_code != 200:
+                    raise ProviderError(f"Acuity API returned {response.status_code}")
                 
                 return [
                     {
@@ -119,28 +150,34 @@ class CalendarConnector:
                         'duration': slot['duration'],
                         'service': slot['service']
                     }
-                    for slot in (response.json() if response.status_code == 200 else [])
+                    for slot in response.json()
                 ]
             else:
-                response = requests.post(
+                response = get_session('calendar').post(
                     'https://acuityscheduling.com/api/v1/appointments',
                     json=data,
                     headers={'Authorization': f'Bearer {self.api_key}'}
                 )
                 return response.status_code == 201
                 
+        except ProviderError:
+            raise
         except Exception as e:
             logger.error(f"Acuity API error: {str(e)}")
-            return [] if action == 'get_slots' else False
+            if action == 'get_slots':
+                raise ProviderError(str(e)) from e
+            return False
 
     def _handle_calendly(self, action: str, data: any) -> any:
         """Handle Calendly API"""
         if not self.api_key:
-            return [] if action == 'get_slots' else False
+            if action == 'get_slots':
+                raise ProviderError("Missing Calendly API key")
+            return False
             
         try:
             if action == 'get_slots':
-                response = requests.get(
+                response = get_session('calendar').get(
                     'https://api.calendly.com/scheduled_events/available_times',
                     params={
                         'start_time': data.isoformat(),
@@ -154,22 +191,26 @@ class CalendarConnector:
                         {
                             'time': slot['start_time'],
                             'duration': 60,
-                            'service': data.get('service', 'Consultation')
+                            'service': 'Consultation'
                         }
                         for slot in response.json()['collection']
                     ]
-                return []
+                raise ProviderError(f"Calendly API returned {response.status_code}")
             else:
-                response = requests.post(
+                response = get_session('calendar').post(
                     'https://api.calendly.com/scheduled_events',
                     json=data,
                     headers={'Authorization': f'Bearer {self.api_key}'}
                 )
                 return response.status_code == 201
                 
+        except ProviderError:
+            raise
         except Exception as e:
             logger.error(f"Calendly API error: {str(e)}")
-            return [] if action == 'get_slots' else False
+            if action == 'get_slots':
+                raise ProviderError(str(e)) from e
+            return False
 
     def _handle_google_calendar(self, action: str, data: any) -> any:
         """Handle Google Calendar API"""
@@ -216,7 +257,9 @@ class CalendarConnector:
                 
         except Exception as e:
             logger.error(f"Google Calendar API error: {str(e)}")
-            return [] if action == 'get_slots' else False
+            if action == 'get_slots':
+                raise ProviderError(str(e)) from e
+            return False
 
     def _handle_mindbody(self, action: str, data: any) -> any:
         """Handle MINDBODY API"""
@@ -288,6 +331,7 @@ class CalendarConnector:
                     status='confirmed'
                 )
                 db.add(appointment)
+                cobooking_cache.invalidate(self.spa_id, db)
                 db.commit()
                 return True
                 
@@ -0,0 +1,250 @@
+"""
+Available slots from external calendar providers, cached per (spa,
+provider, day). Fresh entries are served as is; entries up to
+SLOT_CACHE_MAX_STALE seconds past their TTL are served while a
+background refresh replaces them, and concurrent misses share one
+provider call. A refresher thread keeps the next SLOT_PREWARM_DAYS days
+warm for every spa with an external calendar, and calendar webhooks
+invalidate the days they change. An invalidation also bumps the spa's
+'slot_cache' generation in the database; other worker processes compare
+it on every lookup and refetch the spa's days it has made out of date.
+
+A failed fetch (CalendarConnector.fetch_slots raises ProviderError) never
+replaces an entry: the previous slots keep being served until they are
+SLOT_CACHE_MAX_STALE past their TTL, and the day is not retried in the
+background for SLOT_REFRESH_RETRY seconds.
+
+The cache and the refresher live in each worker process, so with N
+processes every spa's upcoming days are fetched N times per
+SLOT_REFRESH_INTERVAL. Size SLOT_PREWARM_DAYS and SLOT_REFRESH_INTERVAL
+for the process count, or set SLOT_PREWARM_DAYS=0 to fill the caches
+only on demand.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import load_only
+
+from models.database import SessionLocal, Client
+from ..generations import bump_generation, safe_get_generation
+
+logger = logging.getLogger(__name__)
+
+# Seconds an entry is served without refreshing it
+SLOT_CACHE_TTL = float(os.getenv('SLOT_CACHE_TTL', 300))
+# Seconds past the TTL an entry may still be served while it is refreshed
+SLOT_CACHE_MAX_STALE = float(os.getenv('SLOT_CACHE_MAX_STALE', 1800))
+# Days from today the refresher keeps warm (0 disables it)
+SLOT_PREWARM_DAYS = int(os.getenv('SLOT_PREWARM_DAYS', 7))
+SLOT_REFRESH_INTERVAL = float(os.getenv('SLOT_REFRESH_INTERVAL', 240))
+SLOT_REFRESH_WORKERS = int(os.getenv('SLOT_REFRESH_WORKERS', 2))
+# Seconds before a day whose fetch failed is refreshed in the background again
+SLOT_REFRESH_RETRY = float(os.getenv('SLOT_REFRESH_RETRY', 60))
+
+Fetch = Callable[[], List[Dict]]
+
+GENERATION_SCOPE = 'slot_cache'
+
+
+def fetch_start(day: date) -> datetime:
+    """Where a day's slots are fetched from: its start, or now for today."""
+    now = datetime.utcnow().replace(microsecond=0)
+    return now if day == now.date() else datetime.combine(day, datetime.min.time())
+
+
+class SlotCache:
+    """Provider slots keyed by (spa_id, provider, day) with stale-while-revalidate."""
+
+    def __init__(self, ttl: float = SLOT_CACHE_TTL, max_stale: float = SLOT_CACHE_MAX_STALE):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        # key -> (fetched at, slots, spa generation the fetch started under)
+        self._entries: Dict[tuple, Tuple[float, List[Dict], int]] = {}
+        self._inflight: Dict[tuple, Future] = {}
+        # When each key's last fetch failed; background refreshes wait SLOT_REFRESH_RETRY after it
+        self._failures: Dict[tuple, float] = {}
+        # Bumped by invalidate in this process; a fetch that started before it is not stored
+        self._local_generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.stats = {'fresh': 0, 'stale': 0, 'misses': 0, 'fetches': 0, 'errors': 0}
+
+    def get(self, spa_id: str, provider: str, day: date, fetch: Fetch) -> List[Dict]:
+        """Cached slots for the day, calling fetch only on a miss or in the background when stale."""
+        key = (spa_id, provider, day)
+        generation = safe_get_generation(GENERATION_SCOPE, spa_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[2] != generation:
+                # Invalidated by this or another process, or the generation can't be read
+                entry = None
+            age = time.monotonic() - entry[0] if entry else None
+            if entry and age < self.ttl:
+                self.stats['fresh'] += 1
+                return entry[1]
+            if entry and age < self.ttl + self.max_stale:
+                self.stats['stale'] += 1
+                self._refresh_locked(key, fetch, generation)
+                return entry[1]
+            self.stats['misses'] += 1
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if owner:
+            self._run(key, fetch, future, generation)
+        return future.result()
+
+    def refresh_if_due(self, spa_id: str, provider: str, day: date, fetch: Fetch, ahead: float = 0.0) -> None:
+        """Refresh in the background if the entry is missing, out of date or expires within `ahead` seconds."""
+        key = (spa_id, provider, day)
+        generation = safe_get_generation(GENERATION_SCOPE, spa_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] != generation or time.monotonic() - entry[0] >= self.ttl - ahead:
+                self._refresh_locked(key, fetch, generation)
+
+    def _refresh_locked(self, key: tuple, fetch: Fetch, generation: Optional[int]) -> None:
+        if key in self._inflight:
+            return
+        failed = self._failures.get(key)
+        if failed is not None and time.monotonic() - failed < SLOT_REFRESH_RETRY:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=SLOT_REFRESH_WORKERS, thread_name_prefix='SlotRefresh')
+        future = self._inflight[key] = Future()
+        self._executor.submit(self._run, key, fetch, future, generation)
+
+    def _run(self, key: tuple, fetch: Fetch, future: Future, generation: Optional[int]) -> None:
+        with self._lock:
+            local_generation = self._local_generations.get(key[0], 0)
+            self.stats['fetches'] += 1
+        try:
+            slots = fetch()
+        except Exception as e:
+            # Any cached entry stays as it is and is served until it is too stale
+            logger.error(f"Error fetching slots for {key}: {str(e)}")
+            with self._lock:
+                self.stats['errors'] += 1
+                self._failures[key] = time.monotonic()
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+            future.set_exception(e)
+            return
+        # Store only if no process invalidated the spa while the provider was answering
+        current = safe_get_generation(GENERATION_SCOPE, key[0]) if generation is not None else None
+        with self._lock:
+            self._failures.pop(key, None)
+            if (current is not None and current == generation
+                    and self._local_generations.get(key[0], 0) == local_generation):
+                self._entries[key] = (time.monotonic(), slots, generation)
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        future.set_result(slots)
+
+    def invalidate(self, spa_id: str, day: Optional[date] = None) -> None:
+        """
+        Drop a spa's cached days (all of them when day is None); the
+        refresher refills them. Other processes drop all of the spa's days.
+        """
+        with self._lock:
+            self._local_generations[spa_id] = self._local_generations.get(spa_id, 0) + 1
+            for store in (self._entries, self._inflight, self._failures):
+                for key in [key for key in store if key[0] == spa_id and (day is None or key[2] == day)]:
+                    del store[key]
+        try:
+            generation = bump_generation(GENERATION_SCOPE, spa_id)
+        except Exception as e:
+            logger.error(f"Error bumping slot cache generation for {spa_id}: {str(e)}")
+            return
+        # Only this bump separates entries of the previous generation from the new one,
+        # so the days it didn't drop stay valid in this process
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if key[0] == spa_id and entry[2] == generation - 1:
+                    self._entries[key] = (entry[0], entry[1], generation)
+
+    def drop_before(self, day: date) -> None:
+        """Forget days that have passed."""
+        with self._lock:
+            for store in (self._entries, self._failures):
+                for key in [key for key in store if key[2] < day]:
+                    del store[key]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Shared cache used by CalendarConnector.get_available_slots
+slot_cache = SlotCache()
+
+_refresher: Optional[threading.Thread] = None
+_stop_refresher = threading.Event()
+
+
+def _external_calendars() -> List[Tuple[str, str]]:
+    """(spa_id, calendar_type) of spas whose slots come from a provider."""
+    db = SessionLocal()
+    try:
+        clients = db.query(Client).options(load_only(Client.spa_id, Client.config)).all()
+        # Same setting CalendarIntegration builds its connector from
+        calendars = [(client.spa_id, (client.config or {}).get('calendar_type', 'none')) for client in clients]
+        return [(spa_id, calendar_type) for spa_id, calendar_type in calendars if calendar_type and calendar_type != 'none']
+    finally:
+        db.close()
+
+
+def warm_slot_cache(days: int = SLOT_PREWARM_DAYS) -> None:
+    """Schedule refreshes for the next `days` days that are missing or about to expire."""
+    from .calendar_connector import CalendarConnector
+
+    today = datetime.utcnow().date()
+    slot_cache.drop_before(today)
+    for spa_id, calendar_type in _external_calendars():
+        connector = CalendarConnector(spa_id, calendar_type)
+        for offset in range(days):
+            day = today + timedelta(days=offset)
+            slot_cache.refresh_if_due(
+                spa_id, connector.calendar_type, day,
+                lambda connector=connector, day=day: connector.fetch_slots(fetch_start(day)),
+                ahead=SLOT_REFRESH_INTERVAL
+            )
+
+
+def _refresh_loop() -> None:
+    while True:
+        try:
+            warm_slot_cache()
+        except Exception as e:
+            logger.error(f"Error warming slot cache: {str(e)}")
+        if _stop_refresher.wait(SLOT_REFRESH_INTERVAL):
+            return
+
+
+def start_slot_refresher() -> None:
+    """Start this process's thread that keeps upcoming provider slots warm."""
+    global _refresher
+    if SLOT_PREWARM_DAYS <= 0 or (_refresher and _refresher.is_alive()):
+        return
+    _stop_refresher.clear()
+    _refresher = threading.Thread(target=_refresh_loop, daemon=True, name="SlotCacheRefresher")
+    _refresher.start()
+    logger.info(f"Slot cache refresher started ({SLOT_PREWARM_DAYS} days every {SLOT_REFRESH_INTERVAL:.0f}s)")
+
+
+def stop_slot_refresher(timeout: float = 5) -> None:
+    global _refresher
+    _stop_refresher.set()
+    if _refresher is not None:
+        _refresher.join(timeout)
+        _refresher = None
+    slot_cache.shutdown()
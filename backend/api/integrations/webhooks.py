@@ -1,11 +1,15 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
-import requests
 import os
 import hmac
 import hashlib
 import json
-from models.database import SessionLocal, Appointment
+from models.database import SessionLocal, Appointment, Location
+from ..http_clients import get_session
+from ..scheduling.bitmap_cache import availability_cache
+from ..scheduling.reservations import claim_slot, release_appointment
+from ..services.upsell_ranking import cobooking_cache
+from .slot_cache import slot_cache
 
 webhook_bp = Blueprint('webhooks', __name__, url_prefix='/webhooks')
 
@@ -43,12 +47,24 @@ def handle_calendar_webhook():
                     client_email=data['client_email'],
                     client_phone=data.get('client_phone'),
                     service_id=data['service_id'],
-                    therapist_id=data['therapist_id'],
+                    location_id=data.get('location_id'),
                     datetime=datetime.fromisoformat(data['datetime']),
                     status='confirmed'
                 )
                 db.add(appointment)
+                db.flush()
+                location = db.query(Location).filter_by(id=appointment.location_id).first()
+                if location:
+                    # The external calendar already accepted it, so record it even if that overbooks
+                    claim_slot(db, location, appointment.datetime,
+                               appointment.service.duration if appointment.service else None,
+                               appointment_id=appointment.id, enforce_capacity=False)
+                version = availability_cache.begin_change(db, appointment.location_id)
+                cobooking_cache.invalidate(appointment.spa_id, db)
                 db.commit()
+                availability_cache.record_appointment(appointment, 1, version)
+                # The provider's slots for that day changed
+                slot_cache.invalidate(appointment.spa_id, appointment.datetime.date())
                 
                 # Trigger SMS notification via Twilio
                 send_appointment_confirmation(appointment)
@@ -62,8 +78,16 @@ def handle_calendar_webhook():
             try:
                 appointment = db.query(Appointment).filter_by(id=data['appointment_id']).first()
                 if appointment:
+                    was_active = appointment.status not in (None, 'cancelled')
                     appointment.status = 'cancelled'
+                    release_appointment(db, appointment.id)
+                    version = availability_cache.begin_change(db, appointment.location_id)
+                    cobooking_cache.invalidate(appointment.spa_id, db)
                     db.commit()
+                    if was_active:
+                        availability_cache.record_appointment(appointment, -1, version)
+                    if appointment.datetime:
+                        slot_cache.invalidate(appointment.spa_id, appointment.datetime.date())
                     
                     # Notify client about cancellation
                     send_cancellation_notification(appointment)
@@ -81,7 +105,7 @@ def send_appointment_confirmation(appointment):
         # Make.com webhook for SMS notification
         webhook_url = os.getenv('MAKE_SMS_WEBHOOK_URL')
         if webhook_url:
-            requests.post(webhook_url, json={
+            get_session('webhooks').post(webhook_url, json={
                 'type': 'sms.send',
                 'phone': appointment.client_phone,
                 'message': f"Hi {appointment.client_name}! Your appointment at Serenity Spa is confirmed for {appointment.datetime.strftime('%B %d at %I:%M %p')}. Reply YES to confirm or NO to cancel."
@@ -94,7 +118,7 @@ def send_cancellation_notification(appointment):
     try:
         webhook_url = os.getenv('MAKE_SMS_WEBHOOK_URL')
         if webhook_url:
-            requests.post(webhook_url, json={
+            get_session('webhooks').post(webhook_url, json={
                 'type': 'sms.send',
                 'phone': appointment.client_phone,
                 'message': f"Hi {appointment.client_name}, your appointment at Serenity Spa for {appointment.datetime.strftime('%B %d at %I:%M %p')} has been cancelled. Please call us to reschedule."
@@ -0,0 +1,365 @@
+"""Durable document ingestion job queue stored in the application database."""
+
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import func, or_, and_, select, update
+from sqlalchemy.orm import aliased
+
+from models.database import SessionLocal, Document, IngestionJob
+
+logger = logging.getLogger(__name__)
+
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 120))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_BASE_SECONDS = int(os.getenv('JOB_RETRY_BASE_SECONDS', 30))
+JOB_RETRY_MAX_SECONDS = int(os.getenv('JOB_RETRY_MAX_SECONDS', 3600))
+JOB_MAX_RUNNING_PER_SPA = int(os.getenv('INGEST_MAX_PER_SPA', 2))
+
+ACTIVE_STATES = ('queued', 'running')
+# A superseded job's worker may still be reading the document until its lease is released
+BUSY_STATES = ('running', 'superseded')
+
+
+def supersede_jobs(db, document_id: int) -> int:
+    """
+    Tell running jobs for a document to stop: their heartbeats fail, so
+    the worker aborts at its next progress check. They keep their lease
+    until the worker lets go (release_superseded) or it expires.
+    """
+    now = datetime.utcnow()
+    return db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.document_id == document_id, IngestionJob.state == 'running')
+        .values(state='superseded', finished_at=now, updated_at=now,
+                last_error='Superseded by a newer version of the document')
+    ).rowcount
+
+
+def enqueue_job(document_id: int, spa_id: Optional[str] = None, supersede: bool = False) -> int:
+    """
+    Create a queued job for a document. A queued job is reused since it
+    reads the document when it starts; a running one is reused unless
+    `supersede`, in which case it is stopped and a fresh job is queued.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        job = (
+            db.query(IngestionJob)
+            .filter(IngestionJob.document_id == document_id, IngestionJob.state == 'queued')
+            .first()
+        )
+        if job:
+            if supersede and job.next_run_at > now:
+                job.next_run_at = now
+                db.commit()
+            return job.id
+
+        if supersede:
+            if supersede_jobs(db, document_id):
+                logger.info(f"Superseded running ingestion job for document {document_id}")
+        else:
+            job = (
+                db.query(IngestionJob)
+                .filter(IngestionJob.document_id == document_id, IngestionJob.state == 'running')
+                .first()
+            )
+            if job:
+                return job.id
+
+        job = IngestionJob(
+            document_id=document_id,
+            spa_id=spa_id or 'default',
+            state='queued',
+            attempts=0,
+            max_attempts=JOB_MAX_ATTEMPTS,
+            next_run_at=now,
+            created_at=now,
+            updated_at=now
+        )
+        db.add(job)
+        db.commit()
+        logger.info(f"Queued ingestion job {job.id} for document {document_id}")
+        return job.id
+    finally:
+        db.close()
+
+
+def _runnable(now: datetime):
+    """Jobs that are due, or running under a lease that has expired."""
+    return or_(
+        and_(IngestionJob.state == 'queued', IngestionJob.next_run_at <= now),
+        and_(IngestionJob.state == 'running', IngestionJob.lease_expires_at < now)
+    )
+
+
+def _spa_has_room(spa_id: str, now: datetime):
+    """Whether the spa is below JOB_MAX_RUNNING_PER_SPA live jobs, evaluated inside the claiming UPDATE."""
+    other = aliased(IngestionJob)
+    running = (
+        select(func.count(other.id))
+        .where(other.spa_id == spa_id, other.state == 'running', other.lease_expires_at >= now)
+        .scalar_subquery()
+    )
+    return running < JOB_MAX_RUNNING_PER_SPA
+
+
+def claim_job(worker_id: str, lease_seconds: int = JOB_LEASE_SECONDS) -> Optional[Dict]:
+    """
+    Atomically lease the next runnable job. Spas with the fewest running
+    jobs go first so one tenant cannot starve the others. Safe across
+    processes: the claim is a conditional UPDATE that only one worker wins,
+    and it re-checks the per-spa limit so concurrent claims can't exceed it.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        running = dict(
+            db.query(IngestionJob.spa_id, func.count(IngestionJob.id))
+            .filter(IngestionJob.state == 'running', IngestionJob.lease_expires_at >= now)
+            .group_by(IngestionJob.spa_id)
+            .all()
+        )
+        # One worker per document at a time, including one still winding down a superseded job
+        busy = {
+            document_id for (document_id,) in
+            db.query(IngestionJob.document_id)
+            .filter(IngestionJob.state.in_(BUSY_STATES), IngestionJob.lease_expires_at >= now)
+        }
+        candidates = (
+            db.query(IngestionJob.id, IngestionJob.document_id, IngestionJob.spa_id,
+                     IngestionJob.attempts, IngestionJob.max_attempts)
+            .filter(_runnable(now))
+            .order_by(IngestionJob.next_run_at, IngestionJob.id)
+            .limit(200)
+            .all()
+        )
+        candidates = [c for c in candidates
+                      if running.get(c.spa_id, 0) < JOB_MAX_RUNNING_PER_SPA and c.document_id not in busy]
+        candidates.sort(key=lambda c: running.get(c.spa_id, 0))
+
+        for candidate in candidates:
+            if candidate.attempts >= candidate.max_attempts:
+                # Lease expired on the final attempt: the worker died, give up
+                db.execute(
+                    update(IngestionJob)
+                    .where(IngestionJob.id == candidate.id, _runnable(now))
+                    .values(state='failed', finished_at=now, lease_owner=None,
+                            last_error='Worker lease expired on final attempt')
+                )
+                db.commit()
+                continue
+
+            result = db.execute(
+                update(IngestionJob)
+                .where(IngestionJob.id == candidate.id, _runnable(now),
+                       _spa_has_room(candidate.spa_id, now))
+                .values(
+                    state='running',
+                    lease_owner=worker_id,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds),
+                    heartbeat_at=now,
+                    attempts=IngestionJob.attempts + 1,
+                    started_at=now,
+                    finished_at=None,
+                    updated_at=now
+                )
+            )
+            db.commit()
+            if result.rowcount == 1:
+                job = db.query(IngestionJob).filter_by(id=candidate.id).first()
+                return {
+                    'id': job.id,
+                    'document_id': job.document_id,
+                    'spa_id': job.spa_id,
+                    'attempts': job.attempts
+                }
+        return None
+    finally:
+        db.close()
+
+
+def heartbeat(job_id: int, worker_id: str, chunks_done: int = None, chunks_total: int = None,
+              lease_seconds: int = JOB_LEASE_SECONDS) -> bool:
+    """Extend a job lease and record progress; False if the lease was lost."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        values = {
+            'heartbeat_at': now,
+            'lease_expires_at': now + timedelta(seconds=lease_seconds),
+            'updated_at': now
+        }
+        if chunks_done is not None:
+            values['chunks_done'] = chunks_done
+        if chunks_total is not None:
+            values['chunks_total'] = chunks_total
+        result = db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id, IngestionJob.lease_owner == worker_id,
+                   IngestionJob.state == 'running')
+            .values(**values)
+        )
+        db.commit()
+        return result.rowcount == 1
+    finally:
+        db.close()
+
+
+def complete_job(job_id: int, worker_id: str, chunks_done: int = None, chunks_total: int = None) -> bool:
+    """Mark a leased job as done."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        values = {
+            'state': 'done',
+            'finished_at': now,
+            'lease_owner': None,
+            'lease_expires_at': None,
+            'last_error': None,
+            'updated_at': now
+        }
+        if chunks_done is not None:
+            values['chunks_done'] = chunks_done
+        if chunks_total is not None:
+            values['chunks_total'] = chunks_total
+        result = db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id, IngestionJob.lease_owner == worker_id)
+            .values(**values)
+        )
+        db.commit()
+        return result.rowcount == 1
+    finally:
+        db.close()
+
+
+def fail_job(job_id: int, worker_id: str, error: str) -> str:
+    """Record a failure; requeue with exponential backoff until attempts run out."""
+    db = SessionLocal()
+    try:
+        job = db.query(IngestionJob).filter_by(id=job_id, lease_owner=worker_id, state='running').first()
+        if not job:
+            # Taken over, or superseded and waiting for release_superseded
+            return 'lost'
+
+        now = datetime.utcnow()
+        job.last_error = error
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.updated_at = now
+        if job.attempts < job.max_attempts:
+            delay = min(JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1), JOB_RETRY_MAX_SECONDS)
+            job.state = 'queued'
+            job.next_run_at = now + timedelta(seconds=delay)
+            logger.info(f"Job {job_id} attempt {job.attempts} failed, retrying in {delay}s")
+        else:
+            job.state = 'failed'
+            job.finished_at = now
+            logger.error(f"Job {job_id} failed after {job.attempts} attempts")
+        db.commit()
+        return job.state
+    finally:
+        db.close()
+
+
+def release_superseded(job_id: int, worker_id: str) -> bool:
+    """Give up the lease of a superseded job once its worker has stopped; True if it was superseded."""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id, IngestionJob.lease_owner == worker_id,
+                   IngestionJob.state == 'superseded')
+            .values(lease_owner=None, lease_expires_at=None, updated_at=datetime.utcnow())
+        )
+        db.commit()
+        return result.rowcount == 1
+    finally:
+        db.close()
+
+
+def document_busy(document_id: int) -> bool:
+    """Whether a worker may be reading the document right now."""
+    db = SessionLocal()
+    try:
+        return db.query(IngestionJob.id).filter(
+            IngestionJob.document_id == document_id,
+            IngestionJob.state.in_(BUSY_STATES),
+            IngestionJob.lease_expires_at >= datetime.utcnow()
+        ).first() is not None
+    finally:
+        db.close()
+
+
+def recover_jobs() -> int:
+    """Queue jobs for unprocessed documents that have no active job (e.g. after a restart)."""
+    db = SessionLocal()
+    try:
+        active = db.query(IngestionJob.document_id).filter(IngestionJob.state.in_(ACTIVE_STATES))
+        orphaned = (
+            db.query(Document.id, Document.spa_id)
+            .filter(Document.processed == False, Document.error_message == None)
+            .filter(~Document.id.in_(active))
+            .all()
+        )
+    finally:
+        db.close()
+
+    for document_id, spa_id in orphaned:
+        enqueue_job(document_id, spa_id)
+    if orphaned:
+        logger.info(f"Recovered {len(orphaned)} unprocessed documents into the job queue")
+    return len(orphaned)
+
+
+def _job_status(job: IngestionJob) -> Dict:
+    eta_seconds = None
+    if job.state == 'running' and job.chunks_total and job.chunks_done and job.started_at:
+        elapsed = (datetime.utcnow() - job.started_at).total_seconds()
+        eta_seconds = round(elapsed / job.chunks_done * (job.chunks_total - job.chunks_done), 1)
+    elif job.state == 'done':
+        eta_seconds = 0
+
+    return {
+        'job_id': job.id,
+        'document_id': job.document_id,
+        'state': job.state,
+        'attempts': job.attempts,
+        'chunks_done': job.chunks_done,
+        'chunks_total': job.chunks_total,
+        'eta_seconds': eta_seconds,
+        'next_run_at': job.next_run_at.isoformat() if job.state == 'queued' and job.next_run_at else None,
+        'queued_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'error': job.last_error
+    }
+
+
+def get_job_status(job_id: int) -> Optional[Dict]:
+    """Progress of an ingestion job: state, chunks done/total, ETA and error."""
+    db = SessionLocal()
+    try:
+        job = db.query(IngestionJob).filter_by(id=job_id).first()
+        return _job_status(job) if job else None
+    finally:
+        db.close()
+
+
+def get_document_job_status(document_id: int) -> Optional[Dict]:
+    """Status of the most recent ingestion job for a document."""
+    db = SessionLocal()
+    try:
+        job = (
+            db.query(IngestionJob)
+            .filter_by(document_id=document_id)
+            .order_by(IngestionJob.id.desc())
+            .first()
+        )
+        return _job_status(job) if job else None
+    finally:
+        db.close()
@@ -0,0 +1,138 @@
+"""Content-addressed store for raw uploaded files on local disk."""
+
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterator, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: hashes are only locked between threads of one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Stored next to instance/spa.db unless overridden
+BLOB_STORE_PATH = os.getenv('BLOB_STORE_PATH', os.path.join('instance', 'blobs'))
+BLOB_READ_SIZE = 1024 * 1024
+# Hash locks are striped by the first hash byte
+BLOB_LOCK_STRIPES = 256
+
+
+class BlobStore:
+    """
+    Files are stored once per SHA-256 of their bytes, sharded as
+    ab/cd/<hash>. Writes go to a temporary file that is renamed into
+    place, so a blob path either holds the complete file or nothing.
+    Storing a blob and deleting an unreferenced one take the hash's lock,
+    so a delete can't remove a file an upload is about to reference.
+    """
+
+    def __init__(self, root: str = BLOB_STORE_PATH):
+        self.root = root
+        self._thread_locks = [threading.Lock() for _ in range(BLOB_LOCK_STRIPES)]
+
+    def path(self, blob_hash: str) -> str:
+        """Location of a blob on disk."""
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    def exists(self, blob_hash: str) -> bool:
+        return os.path.exists(self.path(blob_hash))
+
+    def open(self, blob_hash: str) -> BinaryIO:
+        return open(self.path(blob_hash), 'rb')
+
+    @contextmanager
+    def lock(self, blob_hash: str) -> Iterator[None]:
+        """Hold a hash's lock across threads and, where flock exists, processes."""
+        stripe = blob_hash[:2]
+        with self._thread_locks[int(stripe, 16) % BLOB_LOCK_STRIPES]:
+            if fcntl is None:
+                yield
+                return
+            lock_dir = os.path.join(self.root, 'locks')
+            os.makedirs(lock_dir, exist_ok=True)
+            with open(os.path.join(lock_dir, f'{stripe}.lock'), 'a') as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _write_temp(self, stream: BinaryIO) -> Tuple[str, str, int]:
+        """Copy a stream to a temporary file in fixed-size reads; returns (path, hash, size)."""
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    block = stream.read(BLOB_READ_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+                    out.write(block)
+                    size += len(block)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest(), size
+
+    @contextmanager
+    def storing(self, stream: BinaryIO) -> Iterator[Tuple[str, int]]:
+        """
+        Store a stream and keep its hash locked until the block exits.
+        Commit the row that references the blob inside the block:
+
+            with blob_store.storing(file.stream) as (blob_hash, size):
+                db.add(Document(blob_hash=blob_hash, ...))
+                db.commit()
+        """
+        tmp_path, blob_hash, size = self._write_temp(stream)
+        try:
+            with self.lock(blob_hash):
+                target = self.path(blob_hash)
+                if not os.path.exists(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(tmp_path, target)
+                yield blob_hash, size
+        finally:
+            # Same bytes already stored, or the move failed
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def put_stream(self, stream: BinaryIO) -> Tuple[str, int]:
+        """Copy a stream into the store; returns (hash, size)."""
+        with self.storing(stream) as stored:
+            return stored
+
+    def put_bytes(self, data: bytes) -> Tuple[str, int]:
+        """Store an in-memory buffer."""
+        return self.put_stream(io.BytesIO(data))
+
+    def delete(self, blob_hash: str) -> None:
+        """Remove a blob unconditionally; use delete_unreferenced when documents may share it."""
+        try:
+            os.unlink(self.path(blob_hash))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error deleting blob {blob_hash}: {str(e)}")
+
+    def delete_unreferenced(self, blob_hash: str, is_referenced: Callable[[], bool]) -> bool:
+        """Delete a blob if is_referenced() is false, checked under the hash's lock."""
+        with self.lock(blob_hash):
+            if is_referenced():
+                return False
+            self.delete(blob_hash)
+            return True
+
+
+# Shared store used by the upload route and ingestion workers
+blob_store = BlobStore()
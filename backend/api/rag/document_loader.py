@@ -1,13 +1,17 @@
-from typing import List, Dict
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Dict, Optional, Tuple, Union
 from werkzeug.datastructures import FileStorage
 from datetime import datetime
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from models.database import Document, DocumentChunk, SessionLocal
-from .embeddings import generate_embeddings
+from .embeddings import generate_embeddings_batch, EMBEDDING_BATCH_SIZE
+from .embedding_cache import text_hash
+from .vector_index import invalidate_index
+from pypdf import PdfReader
+from xml.etree import ElementTree
+import io
 import os
-import tempfile
 import re
+import zipfile
 from dotenv import load_dotenv
 import threading
 import traceback
@@ -16,14 +20,329 @@ import traceback
 # Load environment variables
 load_dotenv()
 
-def get_loader(file_path: str, file_type: str):
-    """Get the appropriate document loader based on file type."""
-    if file_type == 'pdf':
-        return PyPDFLoader(file_path)
-    elif file_type == 'docx':
-        return Docx2txtLoader(file_path)
-    else:  # txt and other text files
-        return TextLoader(file_path)
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Text from non-paged formats is handed to the splitter in blocks of about this many characters
+TEXT_BLOCK_SIZE = 32 * 1024
+
+_WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# A source is a path on disk or a seekable binary file-like object
+Source = Union[str, BinaryIO]
+
+def _open_source(source: Source) -> BinaryIO:
+    return open(source, 'rb') if isinstance(source, str) else source
+
+def count_pages(source: Source, file_type: str) -> Optional[int]:
+    """Number of pages for paged formats (PDF), None otherwise."""
+    if file_type != 'pdf':
+        return None
+    stream = _open_source(source)
+    try:
+        return len(PdfReader(stream).pages)
+    finally:
+        if isinstance(source, str):
+            stream.close()
+
+def _iter_pdf_pages(stream: BinaryIO, start_page: int, end_page: Optional[int]) -> Iterator[Tuple[str, Dict]]:
+    reader = PdfReader(stream)
+    total_pages = len(reader.pages)
+    for page_number in range(start_page, min(end_page or total_pages, total_pages)):
+        text = reader.pages[page_number].extract_text() or ''
+        yield text, {'page': page_number, 'total_pages': total_pages}
+
+def _iter_docx_blocks(stream: BinaryIO) -> Iterator[Tuple[str, Dict]]:
+    """Stream paragraphs out of word/document.xml without building the whole tree."""
+    with zipfile.ZipFile(stream) as archive, archive.open('word/document.xml') as xml:
+        block, block_size = [], 0
+        for _, elem in ElementTree.iterparse(xml, events=('end',)):
+            if elem.tag != f'{_WORD_NS}p':
+                continue
+            paragraph = ''.join(node.text or '' for node in elem.iter(f'{_WORD_NS}t'))
+            elem.clear()
+            if not paragraph:
+                continue
+            block.append(paragraph)
+            block_size += len(paragraph)
+            if block_size >= TEXT_BLOCK_SIZE:
+                yield '\n'.join(block), {}
+                block, block_size = [], 0
+        if block:
+            yield '\n'.join(block), {}
+
+def _iter_text_blocks(stream: BinaryIO) -> Iterator[Tuple[str, Dict]]:
+    """Read text in line-aligned blocks."""
+    reader = io.TextIOWrapper(stream, encoding='utf-8', errors='replace')
+    try:
+        block, block_size = [], 0
+        for line in reader:
+            block.append(line)
+            block_size += len(line)
+            if block_size >= TEXT_BLOCK_SIZE:
+                yield ''.join(block), {}
+                block, block_size = [], 0
+        if block:
+            yield ''.join(block), {}
+    finally:
+        # Leave the caller's stream open
+        reader.detach()
+
+def iter_pages(source: Source, file_type: str, start_page: int = 0,
+               end_page: Optional[int] = None) -> Iterator[Tuple[str, Dict]]:
+    """
+    Lazily yield (text, metadata) per page (PDF) or per text block (DOCX, TXT)
+    from a path or file-like object, so only one page is held in memory.
+    """
+    stream = _open_source(source)
+    try:
+        if file_type == 'pdf':
+            yield from _iter_pdf_pages(stream, start_page, end_page)
+        elif file_type == 'docx':
+            yield from _iter_docx_blocks(stream)
+        else:  # txt and other text files
+            yield from _iter_text_blocks(stream)
+    finally:
+        if isinstance(source, str):
+            stream.close()
+
+def iter_chunks(pages: Iterable[Tuple[str, Dict]], source_name: str = None) -> Iterator[Dict]:
+    """Split pages into chunks as they arrive."""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+    for text, metadata in pages:
+        for piece in text_splitter.split_text(text):
+            if not piece.strip():
+                continue
+            chunk_metadata = dict(metadata)
+            if source_name:
+                chunk_metadata['source'] = source_name
+            yield {'content': piece, 'metadata': chunk_metadata}
+
+def iter_document_chunks(source: Source, file_type: str, source_name: str = None) -> Iterator[Dict]:
+    """Lazily load and split a whole document."""
+    return iter_chunks(iter_pages(source, file_type), source_name)
+
+def split_pages(file_path: str, file_type: str, start_page: int, end_page: int,
+                source_name: str = None) -> List[Dict]:
+    """
+    Load and split one window of pages from a file on disk.
+    CPU-bound and picklable so it can run in a process pool.
+    """
+    return list(iter_chunks(iter_pages(file_path, file_type, start_page, end_page), source_name))
+
+def _estimate_total(done: int, last_chunk: Dict) -> Optional[int]:
+    """Extrapolate the final chunk count from how far through the pages we are."""
+    metadata = last_chunk.get('metadata') or {}
+    if 'page' in metadata and metadata.get('total_pages'):
+        return max(done, int(done * metadata['total_pages'] / (metadata['page'] + 1)))
+    return None
+
+def store_chunks(
+    document_id: int,
+    chunks: Iterable[Dict],
+    progress_callback: Optional[Callable[[int, Optional[int]], None]] = None,
+    batch_size: int = None
+) -> str:
+    """
+    Generate embeddings for a (possibly lazy) stream of chunks and store them.
+    Chunks are consumed, embedded and committed one batch at a time, so
+    memory stays bounded regardless of document size. The chunks stay
+    invisible to retrieval until the document is marked processed.
+    Network-bound, so it runs on ingestion worker threads.
+    """
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    db = SessionLocal()
+    try:
+        # Get the document record by ID
+        doc = db.query(Document).filter_by(id=document_id).first() if document_id else None
+        
+        if not doc:
+            print("Warning: Document record not found in database")
+            return "Error: Document record not found"
+
+        spa_id = doc.spa_id
+
+        # Drop chunks left by an earlier, interrupted attempt
+        db.query(DocumentChunk).filter_by(document_id=document_id).delete()
+        db.commit()
+
+        stored = 0
+        batch: List[Dict] = []
+
+        def flush_batch() -> None:
+            nonlocal stored
+            # Generate embeddings for the batch in one request
+            embeddings = generate_embeddings_batch([chunk['content'] for chunk in batch])
+            rows = []
+            for chunk, embedding in zip(batch, embeddings):
+                rows.append(DocumentChunk(
+                    document_id=document_id,
+                    chunk_index=stored,
+                    content=chunk['content'],
+                    content_hash=text_hash(chunk['content']),
+                    embedding=embedding,
+                    chunk_metadata=chunk['metadata'],
+                    created_at=datetime.utcnow()
+                ))
+                stored += 1
+            db.add_all(rows)
+            db.commit()
+            # Don't keep stored chunks in the session's identity map
+            for row in rows:
+                db.expunge(row)
+            if progress_callback:
+                progress_callback(stored, _estimate_total(stored, batch[-1]))
+            batch.clear()
+
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                flush_batch()
+        if batch:
+            flush_batch()
+
+        if progress_callback:
+            progress_callback(stored, stored)
+        invalidate_index(spa_id)
+        print(f"Stored {stored} chunks with embeddings")
+        return "Document processed successfully"
+        
+    finally:
+        db.close()
+
+def _commit_if_current(db, document_id: int, lease_check: Optional[Callable[[], None]]) -> None:
+    """
+    Commit the open write transaction unless the job's lease was lost or
+    the document was deleted meanwhile. The existence check runs after the
+    writes, so a delete can't slip in between it and the commit.
+    """
+    if lease_check:
+        lease_check()
+    if db.query(Document.id).filter_by(id=document_id).first() is None:
+        raise LookupError(f"Document {document_id} was deleted during re-ingest")
+    db.commit()
+
+def update_chunks(
+    document_id: int,
+    chunks: Iterable[Dict],
+    progress_callback: Optional[Callable[[int, Optional[int]], None]] = None,
+    batch_size: int = None,
+    lease_check: Optional[Callable[[], None]] = None
+) -> str:
+    """
+    Re-ingest a document by diffing its new chunks against the stored ones
+    by content hash. Unchanged chunks keep their embeddings; new or edited
+    chunks are embedded and committed a batch at a time as staged rows that
+    retrieval ignores. The swap (renumber kept chunks, un-stage new ones,
+    delete stale ones) happens in one short transaction, so retrieval sees
+    either the old or the new version of the document.
+    lease_check is called before every commit and raises to abandon the job.
+    """
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    db = SessionLocal()
+    try:
+        doc = db.query(Document).filter_by(id=document_id).first() if document_id else None
+        
+        if not doc:
+            print("Warning: Document record not found in database")
+            return "Error: Document record not found"
+
+        spa_id = doc.spa_id
+
+        # Drop rows staged by an earlier, interrupted attempt
+        if db.query(DocumentChunk).filter_by(document_id=document_id, staged=True).delete():
+            db.commit()
+
+        # Hashes of the stored chunks; legacy rows without one are hashed from their content
+        existing: Dict[str, List[int]] = {}
+        for chunk_id, content_hash, content in (
+            db.query(DocumentChunk.id, DocumentChunk.content_hash, DocumentChunk.content)
+            .filter_by(document_id=document_id)
+            .order_by(DocumentChunk.chunk_index)
+        ):
+            existing.setdefault(content_hash or text_hash(content or ''), []).append(chunk_id)
+        db.rollback()  # End the read transaction before the slow embedding phase
+
+        if not existing:
+            return store_chunks(document_id, chunks, progress_callback, batch_size)
+
+        # Phase 1: match chunks, embed the changed ones and stage them batch by batch
+        kept: List[Tuple[int, int, Dict]] = []  # (chunk id, new index, metadata)
+        pending: List[Tuple[int, Dict, str]] = []
+        added = 0
+        index = 0
+
+        def flush_pending() -> None:
+            nonlocal added
+            embeddings = generate_embeddings_batch([chunk['content'] for _, chunk, _ in pending])
+            now = datetime.utcnow()
+            rows = [
+                DocumentChunk(
+                    document_id=document_id,
+                    chunk_index=chunk_index,
+                    content=chunk['content'],
+                    content_hash=digest,
+                    embedding=embedding,
+                    chunk_metadata=chunk['metadata'],
+                    staged=True,
+                    created_at=now
+                )
+                for (chunk_index, chunk, digest), embedding in zip(pending, embeddings)
+            ]
+            db.add_all(rows)
+            db.flush()
+            _commit_if_current(db, document_id, lease_check)
+            for row in rows:
+                db.expunge(row)
+            added += len(rows)
+            pending.clear()
+            if progress_callback:
+                progress_callback(index, None)
+
+        for chunk in chunks:
+            digest = text_hash(chunk['content'])
+            matches = existing.get(digest)
+            if matches:
+                kept.append((matches.pop(0), index, chunk['metadata']))
+            else:
+                pending.append((index, chunk, digest))
+                if len(pending) >= batch_size:
+                    flush_pending()
+            index += 1
+        if pending:
+            flush_pending()
+
+        stale = [chunk_id for chunk_ids in existing.values() for chunk_id in chunk_ids]
+
+        # Phase 2: swap in the new chunk set in a single transaction
+        for chunk_id, chunk_index, metadata in kept:
+            db.query(DocumentChunk).filter_by(id=chunk_id).update(
+                {'chunk_index': chunk_index, 'chunk_metadata': metadata},
+                synchronize_session=False
+            )
+        db.query(DocumentChunk).filter_by(document_id=document_id, staged=True).update(
+            {'staged': False}, synchronize_session=False
+        )
+        for start in range(0, len(stale), 500):
+            db.query(DocumentChunk).filter(
+                DocumentChunk.id.in_(stale[start:start + 500])
+            ).delete(synchronize_session=False)
+        _commit_if_current(db, document_id, lease_check)
+
+        if progress_callback:
+            progress_callback(index, index)
+        invalidate_index(spa_id)
+        print(f"Updated chunks: {len(kept)} kept, {added} embedded, {len(stale)} removed")
+        return "Document processed successfully"
+
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
 def process_document(file_path: str, spa_id: str = None, document_id: int = None) -> str:
     """
@@ -35,51 +354,9 @@ def process_document(file_path: str, spa_id: str = None, document_id: int = None
     print(f"Document ID: {document_id}")
     
     try:
-        # Get appropriate loader based on file type
         file_type = os.path.splitext(file_path)[1][1:].lower()
-        loader = get_loader(file_path, file_type)
-        
-        # Load and split the document
-        documents = loader.load()
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
-        chunks = text_splitter.split_documents(documents)
-        print(f"Split document into {len(chunks)} chunks")
-        
-        # Store chunks with embeddings
-        db = SessionLocal()
-        try:
-            # Get the document record by ID
-            doc = db.query(Document).filter_by(id=document_id).first() if document_id else None
-            
-            if not doc:
-                print("Warning: Document record not found in database")
-                return "Error: Document record not found"
-
-            # Process and store each chunk
-            for i, chunk in enumerate(chunks):
-                # Generate embedding for chunk
-                embedding = generate_embeddings(chunk.page_content)
-                
-                # Store chunk with embedding
-                chunk_doc = DocumentChunk(
-                    document_id=doc.id,
-                    chunk_index=i,
-                    content=chunk.page_content,
-                    embedding=embedding,
-                    chunk_metadata=chunk.metadata,
-                    created_at=datetime.utcnow()
-                )
-                db.add(chunk_doc)
-            
-            db.commit()
-            print(f"Stored {len(chunks)} chunks with embeddings")
-            return "Document processed successfully"
-            
-        finally:
-            db.close()
+        chunks = iter_document_chunks(file_path, file_type, os.path.basename(file_path))
+        return update_chunks(document_id, chunks)
             
     except Exception as e:
         print(f"Error processing document: {str(e)}")
@@ -0,0 +1,173 @@
+"""Persistent, content-addressed cache for text embeddings."""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from models.database import encode_embedding, decode_embedding
+
+logger = logging.getLogger(__name__)
+
+# Stored next to instance/spa.db unless overridden
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', os.path.join('instance', 'embedding_cache.db'))
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv('EMBEDDING_CACHE_MEMORY_ITEMS', 10000))
+
+
+def normalize_text(text: str) -> str:
+    """Normalise text so trivially different copies share a cache entry."""
+    text = unicodedata.normalize('NFC', text)
+    return ' '.join(text.split())
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 of the normalised text."""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embedding cache keyed on (model name, SHA-256 of normalised text).
+    An in-process LRU sits in front of a SQLite table shared by all workers.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS):
+        self.path = path
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[tuple, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'tokens_saved': 0,
+            'api_texts': 0,
+            'api_seconds': 0.0
+        }
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                " model TEXT NOT NULL,"
+                " text_hash TEXT NOT NULL,"
+                " embedding BLOB NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (model, text_hash))"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, key: tuple, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: List[str], token_counts: Optional[List[int]] = None) -> Dict[int, List[float]]:
+        """Look up many texts; returns {index: embedding} for the hits only."""
+        hashes = [text_hash(text) for text in texts]
+        found: Dict[int, List[float]] = {}
+        missing: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, digest in enumerate(hashes):
+                key = (model, digest)
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[i] = self._memory[key]
+                    self._stats['memory_hits'] += 1
+                else:
+                    missing.setdefault(digest, []).append(i)
+
+            if missing:
+                try:
+                    conn = self._connection()
+                    digests = list(missing)
+                    for start in range(0, len(digests), 500):
+                        part = digests[start:start + 500]
+                        rows = conn.execute(
+                            f"SELECT text_hash, embedding FROM embedding_cache "
+                            f"WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                            [model, *part]
+                        ).fetchall()
+                        for digest, blob in rows:
+                            vector = decode_embedding(blob).tolist()
+                            self._remember((model, digest), vector)
+                            for i in missing.pop(digest):
+                                found[i] = vector
+                                self._stats['disk_hits'] += 1
+                except sqlite3.Error as e:
+                    logger.error(f"Embedding cache read failed: {str(e)}")
+
+            self._stats['misses'] += sum(len(indices) for indices in missing.values())
+            if token_counts:
+                self._stats['tokens_saved'] += sum(token_counts[i] for i in found)
+
+        return found
+
+    def get(self, model: str, text: str, token_count: int = None) -> Optional[List[float]]:
+        """Look up a single text."""
+        found = self.get_many(model, [text], [token_count] if token_count else None)
+        return found.get(0)
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """Store embeddings for the given texts."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                digest = text_hash(text)
+                self._remember((model, digest), list(vector))
+                rows.append((model, digest, encode_embedding(vector, 'float32'), now))
+            try:
+                conn = self._connection()
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embedding_cache (model, text_hash, embedding, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Embedding cache write failed: {str(e)}")
+
+    def put(self, model: str, text: str, vector: List[float]) -> None:
+        """Store a single embedding."""
+        self.put_many(model, [text], [vector])
+
+    def record_api_call(self, text_count: int, seconds: float) -> None:
+        """Record an embeddings API call so savings from hits can be estimated."""
+        with self._lock:
+            self._stats['api_texts'] += text_count
+            self._stats['api_seconds'] += seconds
+
+    def stats(self) -> Dict:
+        """Hit/miss counters plus estimated API spend and latency saved."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_items'] = len(self._memory)
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = hits + stats['misses']
+        avg_seconds = stats['api_seconds'] / stats['api_texts'] if stats['api_texts'] else 0.0
+        stats['hits'] = hits
+        stats['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+        stats['avg_api_ms_per_text'] = round(avg_seconds * 1000, 2)
+        stats['estimated_latency_saved_ms'] = round(hits * avg_seconds * 1000, 2)
+        stats['api_seconds'] = round(stats['api_seconds'], 3)
+        return stats
+
+
+# Shared cache instance used by the embeddings module
+embedding_cache = EmbeddingCache()
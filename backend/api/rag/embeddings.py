@@ -2,10 +2,158 @@ from langchain_openai import OpenAIEmbeddings
 import os
 from dotenv import load_dotenv
 import threading
+import time
+from typing import Callable, Iterator, List, Optional
+from .embedding_cache import embedding_cache
+from ..http_clients import get_openai_http_client
 
 # Load environment variables
 load_dotenv()
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Batch limits for generate_embeddings_batch
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 100))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv('EMBEDDING_BATCH_MAX_TOKENS', 100000))
+EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', 3))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+def count_tokens(text: str) -> int:
+    """Count tokens with cl100k_base, used by the embedding and chat models (approximate if unavailable)."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else _encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+def _validate_api_key(api_key: str = None) -> str:
+    """Return a usable OpenAI API key or raise ValueError."""
+    if not api_key:
+        api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        raise ValueError("OpenAI API key not found")
+    if not (api_key.startswith('sk-') or api_key.startswith('sk-proj-')):
+        raise ValueError("Invalid OpenAI API key format - must start with 'sk-' or 'sk-proj-'")
+    return api_key
+
+def _get_embeddings_client(api_key: str, batch_size: int = EMBEDDING_BATCH_SIZE) -> OpenAIEmbeddings:
+    """Get a shared OpenAIEmbeddings client for this key and batch size."""
+    key = (api_key, batch_size)
+    with _clients_lock:
+        embeddings = _clients.get(key)
+        if embeddings is None:
+            embeddings = OpenAIEmbeddings(
+                openai_api_key=api_key,
+                model=EMBEDDING_MODEL,
+                chunk_size=batch_size,
+                http_client=get_openai_http_client()
+            )
+            _clients[key] = embeddings
+        return embeddings
+
+def _clean_text(text) -> str:
+    """Normalise input text before sending it to the embeddings API."""
+    if not isinstance(text, str):
+        text = str(text)
+    return text.replace('\x00', '').strip()
+
+def _iter_batches(texts: List[str], batch_size: int, max_tokens: int) -> Iterator[List[int]]:
+    """Yield lists of text indices that respect both the size and token limits."""
+    batch, batch_tokens = [], 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if batch and (len(batch) >= batch_size or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+def generate_embeddings_batch(
+    texts: List[str],
+    api_key: str = None,
+    batch_size: int = None,
+    max_batch_tokens: int = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None
+) -> List[List[float]]:
+    """
+    Generate embeddings for many texts, sending them to OpenAI in batches.
+    Each batch is retried with exponential backoff on failure.
+    progress_callback(done, total) is called after every batch.
+    """
+    api_key = _validate_api_key(api_key)
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    max_batch_tokens = max_batch_tokens or EMBEDDING_BATCH_MAX_TOKENS
+
+    texts = [_clean_text(text) for text in texts]
+    if any(not text for text in texts):
+        raise ValueError("Empty text provided for embeddings generation")
+
+    results: List[List[float]] = [None] * len(texts)
+
+    # Serve what we can from the embedding cache
+    token_counts = [count_tokens(text) for text in texts]
+    cached = embedding_cache.get_many(EMBEDDING_MODEL, texts, token_counts)
+    for i, vector in cached.items():
+        results[i] = vector
+
+    pending = [i for i in range(len(texts)) if i not in cached]
+    done = len(cached)
+    if progress_callback:
+        progress_callback(done, len(texts))
+    if not pending:
+        print(f"All {len(texts)} embeddings served from cache")
+        return results
+
+    embeddings = _get_embeddings_client(api_key, batch_size)
+    pending_texts = [texts[i] for i in pending]
+    batches = list(_iter_batches(pending_texts, batch_size, max_batch_tokens))
+    print(f"Embedding {len(pending)} texts in {len(batches)} batches ({len(cached)} cached)")
+
+    for batch_number, indices in enumerate(batches, start=1):
+        batch_texts = [pending_texts[i] for i in indices]
+        for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+            try:
+                started = time.perf_counter()
+                vectors = embeddings.embed_documents(batch_texts)
+                embedding_cache.record_api_call(len(batch_texts), time.perf_counter() - started)
+                break
+            except Exception as e:
+                if attempt == EMBEDDING_MAX_RETRIES:
+                    print(f"Embedding batch {batch_number}/{len(batches)} failed after {attempt + 1} attempts: {str(e)}")
+                    raise
+                delay = 2 ** attempt
+                print(f"Embedding batch {batch_number}/{len(batches)} failed ({str(e)}), retrying in {delay}s")
+                time.sleep(delay)
+
+        embedding_cache.put_many(EMBEDDING_MODEL, batch_texts, vectors)
+        for i, vector in zip(indices, vectors):
+            results[pending[i]] = vector
+
+        done += len(indices)
+        if progress_callback:
+            progress_callback(done, len(texts))
+
+    return results
+
 def generate_embeddings(text: str, api_key: str = None) -> list[float]:
     """
     Generate embeddings for the given text using OpenAI's API.
@@ -15,24 +163,15 @@ def generate_embeddings(text: str, api_key: str = None) -> list[float]:
     print(f"Thread ID: {threading.get_ident()}")
     
     # Validate and set up API key
-    if not api_key:
-        api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
-        raise ValueError("OpenAI API key not found")
-    if not (api_key.startswith('sk-') or api_key.startswith('sk-proj-')):
-        raise ValueError("Invalid OpenAI API key format - must start with 'sk-' or 'sk-proj-'")
+    api_key = _validate_api_key(api_key)
     
     print(f"API key validation:")
     print(f"- Length: {len(api_key)}")
     print(f"- Format: {'Valid' if api_key.startswith('sk-') or api_key.startswith('sk-proj-') else 'Invalid'}")
     
     try:
-        # Ensure text is a string
-        if not isinstance(text, str):
-            text = str(text)
-        
-        # Remove any null bytes or invalid characters
-        text = text.replace('\x00', '').strip()
+        # Ensure text is a string without null bytes
+        text = _clean_text(text)
         
         if not text:
             raise ValueError("Empty text provided for embeddings generation")
@@ -41,15 +180,18 @@ def generate_embeddings(text: str, api_key: str = None) -> list[float]:
         print(f"- Text length: {len(text)}")
         print(f"- First 100 chars: {text[:100]}...")
         
-        print("\nCreating OpenAI embeddings object...")
-        embeddings = OpenAIEmbeddings(
-            openai_api_key=api_key,
-            model="text-embedding-3-small"
-        )
-        print("OpenAI embeddings object created successfully")
+        cached = embedding_cache.get(EMBEDDING_MODEL, text, count_tokens(text))
+        if cached is not None:
+            print(f"Embeddings served from cache (vector size: {len(cached)})")
+            return cached
+        
+        embeddings = _get_embeddings_client(api_key)
         
         print("Generating embeddings...")
+        started = time.perf_counter()
         result = embeddings.embed_query(text)
+        embedding_cache.record_api_call(1, time.perf_counter() - started)
+        embedding_cache.put(EMBEDDING_MODEL, text, result)
         print(f"Embeddings generated successfully (vector size: {len(result)})")
         return result
     except Exception as e:
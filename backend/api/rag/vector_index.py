@@ -0,0 +1,145 @@
+"""In-memory per-spa vector index used for document retrieval."""
+
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from models.database import SessionLocal, Document, DocumentChunk
+from ..generations import bump_generation, safe_get_generation
+
+logger = logging.getLogger(__name__)
+
+
+class SpaVectorIndex:
+    """
+    All chunk embeddings of one spa kept in a single pre-normalised float32 matrix.
+    Top-k retrieval is one matrix-vector product followed by argpartition.
+    """
+
+    def __init__(self, spa_id: str, chunk_ids: List[int], contents: List[str],
+                 sources: List[str], matrix: np.ndarray):
+        self.spa_id = spa_id
+        self.chunk_ids = chunk_ids
+        self.contents = contents
+        self.sources = sources
+        self.matrix = matrix
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @classmethod
+    def build(cls, spa_id: str) -> "SpaVectorIndex":
+        """Load every processed chunk of a spa and build its embedding matrix."""
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(DocumentChunk.id, DocumentChunk.content, DocumentChunk.embedding, Document.name)
+                .join(Document, DocumentChunk.document_id == Document.id)
+                .filter(Document.spa_id == spa_id)
+                .filter(Document.processed == True)
+                .filter(DocumentChunk.staged == False)
+                .order_by(DocumentChunk.id)
+                .all()
+            )
+        finally:
+            db.close()
+
+        chunk_ids, contents, sources, vectors = [], [], [], []
+        dimension = None
+        for chunk_id, content, embedding, doc_name in rows:
+            if embedding is None or len(embedding) == 0:
+                continue
+            if dimension is None:
+                dimension = len(embedding)
+            elif len(embedding) != dimension:
+                logger.warning(f"Skipping chunk {chunk_id}: embedding size {len(embedding)} != {dimension}")
+                continue
+            chunk_ids.append(chunk_id)
+            contents.append(content)
+            sources.append(doc_name or 'Unknown')
+            vectors.append(embedding)
+
+        if vectors:
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+
+        logger.info(f"Built vector index for spa {spa_id} with {len(chunk_ids)} chunks")
+        return cls(spa_id, chunk_ids, contents, sources, matrix)
+
+    def search(self, query_embedding: List[float], top_k: int = 3) -> List[Tuple[Dict, float]]:
+        """Return the top_k chunks by cosine similarity, best first."""
+        if not self.chunk_ids or top_k <= 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape[0] != self.matrix.shape[1]:
+            logger.warning(f"Query embedding size {query.shape[0]} does not match index size {self.matrix.shape[1]}")
+            return []
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query /= norm
+
+        scores = self.matrix @ query
+        k = min(top_k, len(scores))
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            ({
+                'id': self.chunk_ids[i],
+                'content': self.contents[i],
+                'source': self.sources[i]
+            }, float(scores[i]))
+            for i in top
+        ]
+
+
+# Index registry: one index per spa with the generation it was built at.
+# invalidate_index bumps the spa's generation in the database, so indexes
+# cached by other worker processes are rebuilt on their next query too.
+_indexes: Dict[str, Tuple[int, SpaVectorIndex]] = {}
+_lock = threading.Lock()
+
+
+def get_index(spa_id: str) -> SpaVectorIndex:
+    """
+    Get the vector index for a spa, building it when missing or out of date.
+    If the generation can't be read the index is rebuilt and not cached.
+    """
+    generation = safe_get_generation('vector_index', spa_id)
+    if generation is not None:
+        with _lock:
+            entry = _indexes.get(spa_id)
+        if entry is not None and entry[0] == generation:
+            return entry[1]
+
+    index = SpaVectorIndex.build(spa_id)
+
+    # Only cache the index if no invalidation happened while it was being built
+    if generation is not None and safe_get_generation('vector_index', spa_id) == generation:
+        with _lock:
+            _indexes[spa_id] = (generation, index)
+    return index
+
+
+def invalidate_index(spa_id: Optional[str]) -> None:
+    """Make every process rebuild the spa's index on its next query."""
+    if not spa_id:
+        return
+    with _lock:
+        _indexes.pop(spa_id, None)
+    try:
+        bump_generation('vector_index', spa_id)
+    except Exception as e:
+        logger.error(f"Error bumping vector index generation for {spa_id}: {str(e)}")
+    logger.info(f"Invalidated vector index for spa {spa_id}")
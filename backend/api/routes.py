@@ -1,20 +1,29 @@
 from flask import Blueprint, request, jsonify, g
 from flask_jwt_extended import jwt_required, create_access_token, get_jwt, get_jwt_identity, get_jwt_header
 from werkzeug.security import generate_password_hash, check_password_hash
-from .chatbot.openai_api import generate_response, get_spa_context
-from .rag.document_loader import process_document
+from .rag.vector_index import invalidate_index
+from .rag.embedding_cache import embedding_cache
+from .rag.blob_store import blob_store
+from .chatbot.context_cache import invalidate_spa_context
+from .chatbot.response_cache import response_cache
 from .chatbot.calendar import CalendarIntegration
 from datetime import datetime, timedelta
 import stripe
 from sqlalchemy import func
-from models.database import SessionLocal, Appointment, Client, User, SubscriptionPlan, SpaService, Location, Document, DocumentChunk, SpaProfile, BrandSettings, PlatformMetrics, PlatformSettings
+from sqlalchemy.orm import load_only
+from models.database import SessionLocal, Appointment, Client, User, SubscriptionPlan, SpaService, Location, Document, DocumentChunk, SpaProfile, BrandSettings, PlatformMetrics, PlatformSettings, SlotReservation
 import os
 import uuid
 import bcrypt
 from .notifications.email import send_email, send_welcome_email
 from flask import current_app
 import threading
-from .tasks import task_queue
+from .tasks import enqueue_document, get_document_job_status, release_blob
+from .job_queue import supersede_jobs
+from .scheduling.availability import DEFAULT_GRANULARITY_MINUTES, DEFAULT_BOOKING_MINUTES
+from .scheduling.bitmap_cache import availability_cache
+from .services.upsell_ranking import cobooking_cache
+from .scheduling.reservations import SlotTaken, hold_slot, release_hold, reserve_appointment, purge_expired_holds
 import base64
 import tempfile
 from werkzeug.utils import secure_filename
@@ -24,6 +33,9 @@ from functools import wraps
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
+# Longest date range /appointments/availability answers in one request
+AVAILABILITY_MAX_DAYS = int(os.getenv('AVAILABILITY_MAX_DAYS', 31))
+
 # Initialize Stripe with YOUR platform's secret key
 stripe.api_key = os.getenv('STRIPE_PLATFORM_SECRET_KEY')
 
@@ -201,40 +213,6 @@ def get_client(client_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# Existing routes with authentication added
-@bp.route('/chat', methods=['POST'])
-def chat():
-    # Public endpoint - no authentication required
-    try:
-        data = request.json
-        if not data or 'message' not in data:
-            return jsonify({'error': 'No message provided'}), 400
-
-        # Get spa_id from request or use default
-        spa_id = data.get('spa_id')
-        if not spa_id:
-            return jsonify({'error': 'No spa_id provided'}), 400
-
-        # Verify spa exists
-        db = SessionLocal()
-        try:
-            spa = db.query(Client).filter_by(spa_id=spa_id).first()
-            if not spa:
-                return jsonify({'error': 'Invalid spa_id'}), 404
-        finally:
-            db.close()
-
-        response_data = generate_response(
-            message=data['message'],
-            spa_id=spa_id,
-            conversation_history=data.get('conversation_history', [])
-        )
-        
-        return jsonify(response_data)
-    except Exception as e:
-        print(f"Error in chat endpoint: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
 @bp.route('/locations', methods=['GET'])
 def get_locations():
     """Get all locations for a spa"""
@@ -251,7 +229,9 @@ def get_locations():
                 'city': loc.city,
                 'state': loc.state,
                 'phone': loc.phone,
-                'is_primary': loc.is_primary
+                'is_primary': loc.is_primary,
+                'capacity': loc.capacity or 1,
+                'buffer_minutes': loc.buffer_minutes or 0
             } for loc in locations]
         })
     finally:
@@ -284,58 +264,150 @@ def get_available_slots():
         if not service:
             return jsonify({'error': 'Service not found'}), 404
             
-        # Get existing appointments for this date and location
-        existing_appointments = db.query(Appointment).filter(
-            Appointment.location_id == location_id,
-            func.date(Appointment.datetime) == date.date(),
-            Appointment.status != 'cancelled'
-        ).all()
-        
-        # Generate available slots based on business hours and existing appointments
-        weekday = date.strftime('%A').lower()
-        is_weekend = weekday in ['saturday', 'sunday']
-        
-        if is_weekend:
-            open_time = location.business_hours['weekend']['open']
-            close_time = location.business_hours['weekend']['close']
-        else:
-            open_time = location.business_hours['weekday']['open']
-            close_time = location.business_hours['weekday']['close']
-            
-        # Convert business hours to datetime
-        open_dt = datetime.strptime(f"{date.date()} {open_time}", "%Y-%m-%d %H:%M")
-        close_dt = datetime.strptime(f"{date.date()} {close_time}", "%Y-%m-%d %H:%M")
-        
-        # Generate slots every 30 minutes
-        slots = []
-        current = open_dt
-        while current + timedelta(minutes=service.duration) <= close_dt:
-            # Check if slot conflicts with existing appointments
-            is_available = True
-            for appt in existing_appointments:
-                appt_end = appt.datetime + timedelta(minutes=service.duration)
-                if (current >= appt.datetime and current < appt_end) or \
-                   (current + timedelta(minutes=service.duration) > appt.datetime and \
-                    current + timedelta(minutes=service.duration) <= appt_end):
-                    is_available = False
-                    break
-                    
-            if is_available:
-                slots.append({
-                    'time': current.strftime('%H:%M'),
-                    'duration': service.duration,
-                    'service': service.name,
-                    'service_id': service.id,
-                    'location_id': location.id
-                })
-                
-            current += timedelta(minutes=30)
+        # Free slots from business hours minus the times the location is at capacity,
+        # read from the location-day bitmaps (built from that day's bookings on first use)
+        starts = availability_cache.available_starts(
+            location,
+            date.date(),
+            date.date(),
+            service.duration or DEFAULT_BOOKING_MINUTES,
+            request.args.get('granularity', DEFAULT_GRANULARITY_MINUTES, type=int)
+        )
+        slots = [{
+            'time': start.strftime('%H:%M'),
+            'duration': service.duration,
+            'service': service.name,
+            'service_id': service.id,
+            'location_id': location.id
+        } for start in starts.get(date.date(), [])]
             
         return jsonify({'slots': slots})
         
     finally:
         db.close()
 
+@bp.route('/appointments/availability', methods=['GET'])
+def get_availability_calendar():
+    """
+    Availability of several services over a date range at one location.
+    Query: location_id, start, end (YYYY-MM-DD, inclusive), service_ids
+    (comma separated) and an optional granularity in minutes. Returns
+    {'services': {id: {'name', 'duration', 'days': {date: ['HH:MM', ...]}}}}.
+    """
+    location_id = request.args.get('location_id', type=int)
+    service_ids = [int(sid) for sid in request.args.get('service_ids', '').split(',') if sid.strip().isdigit()]
+    granularity = request.args.get('granularity', DEFAULT_GRANULARITY_MINUTES, type=int)
+    
+    if not location_id or not service_ids or not request.args.get('start'):
+        return jsonify({'error': 'Missing required parameters'}), 400
+    
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.args.get('end', request.args['start']), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    
+    if end < start or (end - start).days >= AVAILABILITY_MAX_DAYS:
+        return jsonify({'error': f'Date range must cover 1 to {AVAILABILITY_MAX_DAYS} days'}), 400
+    if granularity <= 0:
+        return jsonify({'error': 'Invalid granularity'}), 400
+        
+    db = SessionLocal()
+    try:
+        location = db.query(Location).filter_by(id=location_id).first()
+        if not location:
+            return jsonify({'error': 'Location not found'}), 404
+        
+        services = db.query(SpaService).filter(SpaService.id.in_(service_ids)).all()
+        if not services:
+            return jsonify({'error': 'Service not found'}), 404
+        
+        # Days missing from the bitmap cache are built with one range scan on
+        # (location_id, datetime); every service then reads the same bitmaps
+        calendar = {}
+        for service in services:
+            starts = availability_cache.available_starts(
+                location, start, end, service.duration or DEFAULT_BOOKING_MINUTES, granularity
+            )
+            calendar[str(service.id)] = {
+                'name': service.name,
+                'duration': service.duration,
+                'days': {
+                    day.isoformat(): [slot.strftime('%H:%M') for slot in slots]
+                    for day, slots in starts.items()
+                }
+            }
+        
+        return jsonify({
+            'location_id': location.id,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'granularity': granularity,
+            'services': calendar
+        })
+        
+    finally:
+        db.close()
+
+@bp.route('/appointments/holds', methods=['POST'])
+def create_slot_hold():
+    """
+    Hold a slot while the client fills in the booking form. Body:
+    service_id, location_id, datetime. Returns a hold_token to pass to
+    POST /appointments; the hold lapses on its own at expires_at.
+    """
+    data = request.json or {}
+    if not all(field in data for field in ['service_id', 'location_id', 'datetime']):
+        return jsonify({'error': 'Missing required fields'}), 400
+    
+    db = SessionLocal()
+    try:
+        service = db.query(SpaService).filter_by(id=data['service_id']).first()
+        if not service:
+            return jsonify({'error': 'Service not found'}), 404
+        
+        location = db.query(Location).filter_by(id=data['location_id']).first()
+        if not location:
+            return jsonify({'error': 'Location not found'}), 404
+        
+        start = datetime.fromisoformat(data['datetime'].replace('Z', '+00:00'))
+        purge_expired_holds(db)
+        try:
+            hold_token, expires_at = hold_slot(db, location, start, service.duration)
+        except SlotTaken as e:
+            db.rollback()
+            print(f"Slot not available: {e}")
+            return jsonify({'error': 'This time slot is no longer available'}), 409
+        # Held slots are offered to no one else until the hold lapses
+        version = availability_cache.begin_change(db, location.id)
+        db.commit()
+        availability_cache.record_booking(location.id, start, service.duration, 1, version, expires_at=expires_at)
+        
+        return jsonify({'hold_token': hold_token, 'expires_at': expires_at.isoformat() + 'Z'}), 201
+        
+    except ValueError:
+        db.rollback()
+        return jsonify({'error': 'Invalid datetime'}), 400
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
+
+@bp.route('/appointments/holds/<hold_token>', methods=['DELETE'])
+def release_slot_hold(hold_token):
+    """Release a hold early, e.g. when the client closes the booking form"""
+    db = SessionLocal()
+    try:
+        location_id = db.query(SlotReservation.location_id).filter_by(hold_token=hold_token).limit(1).scalar()
+        released = release_hold(db, hold_token)
+        if released:
+            availability_cache.begin_change(db, location_id)
+        db.commit()
+        return jsonify({'status': 'success', 'released': released > 0})
+    finally:
+        db.close()
+
 @bp.route('/appointments', methods=['POST'])
 def book_appointment():
     """Book a new appointment"""
@@ -376,7 +448,22 @@ def book_appointment():
         )
         
         db.add(appointment)
+        db.flush()
+        
+        # Claim the slot in this transaction; a concurrent booking of the same unit fails the insert
+        try:
+            reserve_appointment(db, location, appointment, service.duration, data.get('hold_token'))
+        except SlotTaken as e:
+            db.rollback()
+            print(f"Slot not available: {e}")
+            return jsonify({'error': 'This time slot is no longer available'}), 409
+        
+        version = availability_cache.begin_change(db, location.id)
+        cobooking_cache.invalidate(location.spa_id, db)
         db.commit()
+        if not data.get('hold_token'):
+            # A converted or dropped hold also changed the counts, so cached days are rebuilt instead
+            availability_cache.record_booking(location.id, appointment.datetime, service.duration, 1, version)
 
         # Handle calendar-specific booking and notifications
         calendar_type = client.calendar_type
@@ -446,7 +533,7 @@ def send_booking_notifications(appointment, service, location):
 @bp.route('/upload', methods=['POST'])
 @jwt_required()
 def upload_document():
-    """Upload and process a document."""
+    """Upload a document and queue it for background processing."""
     try:
         # Check if file is present
         if 'file' not in request.files:
@@ -463,58 +550,35 @@ def upload_document():
         # Create document record first
         db = SessionLocal()
         try:
-            # Read file content
-            file_content = file.read()
+            # Stream the file into the blob store; identical files are stored once.
+            # The record is committed under the blob's lock so a concurrent delete can't remove it
+            with blob_store.storing(file.stream) as (blob_hash, size):
+                doc = Document(
+                    spa_id=spa_id,
+                    name=file.filename,
+                    blob_hash=blob_hash,
+                    size=size,
+                    doc_type=os.path.splitext(file.filename)[1][1:].lower(),
+                    uploaded_at=datetime.utcnow(),
+                    processed=False,
+                    doc_metadata={
+                        'content_type': file.content_type,
+                        'size': size
+                    }
+                )
+                db.add(doc)
+                db.commit()
             
-            # Create document record
-            doc = Document(
-                spa_id=spa_id,
-                name=file.filename,
-                content=base64.b64encode(file_content).decode('utf-8') if not file.content_type.startswith('text/') else file_content.decode('utf-8'),
-                doc_type=os.path.splitext(file.filename)[1][1:].lower(),
-                uploaded_at=datetime.utcnow(),
-                processed=False,
-                doc_metadata={
-                    'content_type': file.content_type,
-                    'size': len(file_content)
-                }
-            )
-            db.add(doc)
-            db.commit()
+            # Hand the document to the durable ingestion queue
+            job_id = enqueue_document(doc.id, spa_id)
             
-            # Save file to temporary location and process it
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as temp_file:
-                # Reset file pointer to beginning
-                file.seek(0)
-                file.save(temp_file)
-                temp_file.flush()
-                
-                try:
-                    # Process document with document ID
-                    print(f"\nProcessing document: {file.filename}")
-                    result = process_document(temp_file.name, spa_id, doc.id)
-                    
-                    if result == "Error: Document record not found":
-                        return jsonify({'error': 'Failed to process document: Document record not found'}), 500
-                    
-                    # Update document status
-                    doc.processed = True
-                    doc.processed_at = datetime.utcnow()
-                    db.commit()
-                    
-                    return jsonify({
-                        'message': 'Document uploaded and processed successfully',
-                        'document_id': doc.id,
-                        'result': result
-                    }), 200
-                    
-                finally:
-                    # Ensure file handle is closed before attempting deletion
-                    temp_file.close()
-                    try:
-                        os.unlink(temp_file.name)
-                    except Exception as e:
-                        print(f"Error cleaning up temp file: {str(e)}")
+            print(f"\nQueued document {doc.id} for processing: {file.filename}")
+            return jsonify({
+                'message': 'Document uploaded and queued for processing',
+                'document_id': doc.id,
+                'job_id': job_id,
+                'status_url': f'/api/documents/{doc.id}/status'
+            }), 202
                     
         except Exception as e:
             db.rollback()
@@ -931,6 +995,7 @@ def setup_services():
                 db.add(new_service)
             
             db.commit()
+            invalidate_spa_context(spa_id)
             return jsonify({'status': 'success', 'message': 'Services setup completed'})
 
         finally:
@@ -1033,14 +1098,18 @@ def get_documents():
         # Debug print to check if we can query the database
         print(f"Attempting to fetch documents for spa_id: {user.spa_id}")
         
-        # Query documents
-        documents = db.query(Document).filter_by(spa_id=user.spa_id).all()
+        # Query documents (listing columns only, never the file content)
+        documents = db.query(Document).options(load_only(
+            Document.id, Document.name, Document.doc_type, Document.size,
+            Document.uploaded_at, Document.processed
+        )).filter_by(spa_id=user.spa_id).all()
         
         # Convert to list of dictionaries
         docs_list = [{
             'id': str(doc.id),
             'name': doc.name,
             'doc_type': doc.doc_type,
+            'size': doc.size,
             'uploaded_at': doc.uploaded_at.isoformat() if doc.uploaded_at else None,
             'processed': doc.processed
         } for doc in documents]
@@ -1056,6 +1125,101 @@ def get_documents():
         print("Closing database session")
         db.close()
 
+@bp.route('/documents/<int:doc_id>/status', methods=['GET'])
+@jwt_required()
+def get_document_status(doc_id):
+    """Get processing progress for an uploaded document."""
+    claims = get_jwt()
+    spa_id = claims.get('spa_id')
+    
+    if not spa_id:
+        return jsonify({'error': 'spa_id not found in token'}), 401
+        
+    db = SessionLocal()
+    try:
+        document = db.query(Document).filter_by(id=doc_id, spa_id=spa_id).first()
+        if not document:
+            return jsonify({'error': 'Document not found'}), 404
+        
+        status = get_document_job_status(doc_id)
+        if status is None:
+            # Documents processed before the job queue existed have no job row
+            state = 'done' if document.processed else ('failed' if document.error_message else 'queued')
+            status = {
+                'job_id': None,
+                'state': state,
+                'chunks_done': None,
+                'chunks_total': None,
+                'eta_seconds': 0 if state == 'done' else None,
+                'error': document.error_message
+            }
+        
+        status['document_id'] = doc_id
+        status['processed'] = document.processed
+        return jsonify(status)
+    finally:
+        db.close()
+
+@bp.route('/documents/<int:doc_id>', methods=['PUT'])
+@jwt_required()
+def replace_document(doc_id):
+    """Replace a document's file; only changed chunks are re-embedded."""
+    claims = get_jwt()
+    spa_id = claims.get('spa_id')
+    
+    if not spa_id:
+        return jsonify({'error': 'spa_id not found in token'}), 401
+        
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
+    
+    file = request.files['file']
+    if not file or not file.filename:
+        return jsonify({'error': 'Invalid file'}), 400
+        
+    db = SessionLocal()
+    try:
+        document = db.query(Document).filter_by(id=doc_id, spa_id=spa_id).first()
+        if not document:
+            return jsonify({'error': 'Document not found'}), 404
+        
+        with blob_store.storing(file.stream) as (blob_hash, size):
+            if blob_hash == document.blob_hash:
+                return jsonify({'message': 'Document unchanged', 'document_id': doc_id}), 200
+            
+            # Existing chunks stay searchable until the new version is swapped in
+            old_blob_hash = document.blob_hash
+            document.name = file.filename
+            document.blob_hash = blob_hash
+            document.size = size
+            document.content = None
+            document.doc_type = os.path.splitext(file.filename)[1][1:].lower()
+            document.uploaded_at = datetime.utcnow()
+            document.error_message = None
+            document.doc_metadata = {
+                **(document.doc_metadata or {}),
+                'content_type': file.content_type,
+                'size': size
+            }
+            db.commit()
+        
+        # A job still ingesting the old file is stopped; it releases that file when it exits
+        job_id = enqueue_document(doc_id, spa_id, supersede=True)
+        release_blob(old_blob_hash, doc_id)
+        return jsonify({
+            'message': 'Document replaced and queued for processing',
+            'document_id': doc_id,
+            'job_id': job_id,
+            'status_url': f'/api/documents/{doc_id}/status'
+        }), 202
+        
+    except Exception as e:
+        print(f"Error replacing document: {str(e)}")
+        db.rollback()
+        return jsonify({'error': f'Failed to replace document: {str(e)}'}), 500
+    finally:
+        db.close()
+
 @bp.route('/documents/<int:doc_id>', methods=['DELETE'])
 @jwt_required()
 def delete_document(doc_id):
@@ -1078,9 +1242,16 @@ def delete_document(doc_id):
         # Delete associated chunks first
         db.query(DocumentChunk).filter_by(document_id=doc_id).delete()
         
-        # Delete the document
+        # Stop any job still ingesting the document, then delete it
+        blob_hash = document.blob_hash
+        supersede_jobs(db, doc_id)
         db.delete(document)
         db.commit()
+        invalidate_index(spa_id)
+        invalidate_spa_context(spa_id)
+        
+        # Remove the stored file once no other document shares it and no job is reading it
+        release_blob(blob_hash, doc_id)
         
         return jsonify({'message': 'Document deleted successfully'}), 200
         
@@ -1137,6 +1308,7 @@ def update_colors():
             settings.secondary_color = data['secondary_color']
             
         db.commit()
+        invalidate_spa_context(spa_id)
         return jsonify({'message': 'Colors updated successfully'})
     finally:
         db.close()
@@ -1173,6 +1345,7 @@ def upload_logo():
             
             settings.logo_url = f'/uploads/logos/{spa_id}/{filename}'
             db.commit()
+            invalidate_spa_context(spa_id)
             
             return jsonify({
                 'message': 'Logo uploaded successfully',
@@ -1232,6 +1405,7 @@ def update_profile():
                 setattr(profile, field, data[field])
         
         db.commit()
+        invalidate_spa_context(spa_id)
         return jsonify({'message': 'Profile updated successfully'})
     finally:
         db.close()
@@ -1295,6 +1469,7 @@ def complete_onboarding_step():
             profile.onboarding_completed = True
         
         db.commit()
+        invalidate_spa_context(spa_id)
         return jsonify({
             'current_step': profile.onboarding_step,
             'completed': profile.onboarding_completed
@@ -1692,35 +1867,6 @@ def get_public_branding():
             'secondary_color': '#A7B5A0'
         })
 
-@bp.route('/public/chat', methods=['POST'])
-async def public_chat():
-    """Public chat endpoint that doesn't require authentication"""
-    try:
-        data = request.json
-        message = data.get('message')
-        spa_id = data.get('spa_id', 'default')
-        conversation_history = data.get('conversation_history', [])
-        
-        if not message:
-            return jsonify({'error': 'Message is required'}), 400
-            
-        # Get spa context
-        context = get_spa_context(spa_id)
-        
-        # Generate response using OpenAI
-        response = await generate_response(
-            message=message,
-            spa_id=spa_id,
-            conversation_history=conversation_history,
-            context=context
-        )
-        
-        return jsonify(response)
-        
-    except Exception as e:
-        print(f"Error in public chat: {str(e)}")
-        return jsonify({'error': 'Failed to process message'}), 500
-
 @bp.route('/admin/business-profile', methods=['GET'])
 @jwt_required()
 def get_business_profile():
@@ -1936,6 +2082,20 @@ def get_platform_metrics():
     finally:
         db.close()
 
+@bp.route('/admin/platform/embedding-cache', methods=['GET'])
+@jwt_required()
+@require_super_admin
+def get_embedding_cache_stats():
+    """Get embedding cache hit/miss counters for this worker (super admin only)"""
+    return jsonify(embedding_cache.stats())
+
+@bp.route('/admin/platform/response-cache', methods=['GET'])
+@jwt_required()
+@require_super_admin
+def get_response_cache_stats():
+    """Get semantic response cache hit rate and latency saved per spa for this worker (super admin only)"""
+    return jsonify(response_cache.stats())
+
 @bp.route('/admin/platform/spa/<string:spa_id>', methods=['GET'])
 @jwt_required()
 @require_super_admin
@@ -2317,4 +2477,62 @@ def toggle_widget():
         print(f"Error updating widget status: {str(e)}")
         return jsonify({'error': 'Failed to update widget status'}), 500
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+@bp.route('/admin/settings/response-cache', methods=['GET'])
+@jwt_required()
+def get_response_cache_settings():
+    """Get the spa's response cache setting and metrics"""
+    claims = get_jwt()
+    spa_id = claims.get('spa_id')
+    if not spa_id:
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    db = SessionLocal()
+    try:
+        client = db.query(Client).filter_by(spa_id=spa_id).first()
+        if not client:
+            return jsonify({'error': 'Spa not found'}), 404
+        
+        config = client.config or {}
+        return jsonify({
+            'enabled': config.get('response_cache', {}).get('enabled', False),
+            'metrics': response_cache.stats(spa_id)
+        }), 200
+    finally:
+        db.close()
+
+@bp.route('/admin/settings/response-cache', methods=['PUT'])
+@jwt_required()
+def update_response_cache_settings():
+    """Opt the spa in or out of the semantic response cache"""
+    claims = get_jwt()
+    spa_id = claims.get('spa_id')
+    if not spa_id:
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    data = request.get_json() or {}
+    if not isinstance(data.get('enabled'), bool):
+        return jsonify({'error': 'Missing or invalid enabled status'}), 400
+    
+    db = SessionLocal()
+    try:
+        client = db.query(Client).filter_by(spa_id=spa_id).first()
+        if not client:
+            return jsonify({'error': 'Spa not found'}), 404
+        
+        config = dict(client.config or {})
+        config['response_cache'] = {**config.get('response_cache', {}), 'enabled': data['enabled']}
+        client.config = config
+        db.commit()
+        
+        invalidate_spa_context(spa_id)
+        response_cache.clear(spa_id)
+        return jsonify({'message': 'Response cache setting updated successfully', 'enabled': data['enabled']}), 200
+        
+    except Exception as e:
+        db.rollback()
+        print(f"Error updating response cache setting: {str(e)}")
+        return jsonify({'error': 'Failed to update response cache setting'}), 500
+    finally:
+        db.close()
@@ -0,0 +1,175 @@
+"""
+Interval-based availability: opening windows minus the times a location is
+at capacity, found with one sweep over sorted booking intervals.
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+Interval = Tuple[datetime, datetime]
+
+# Opening hours used when a location has none configured
+DEFAULT_BUSINESS_HOURS = {
+    'weekday': {'open': '09:00', 'close': '20:00'},
+    'weekend': {'open': '10:00', 'close': '18:00'}
+}
+DEFAULT_GRANULARITY_MINUTES = 30
+# Length assumed for bookings whose service has no duration
+DEFAULT_BOOKING_MINUTES = 60
+
+
+def _day_hours(business_hours: Dict, day: date) -> Optional[Dict]:
+    """Hours for one day: a per-weekday entry wins over the weekday/weekend entry."""
+    weekday = day.strftime('%A').lower()
+    if weekday in business_hours:
+        return business_hours[weekday]
+    return business_hours.get('weekend' if day.weekday() >= 5 else 'weekday')
+
+
+def opening_windows(business_hours: Optional[Dict], start: date, end: date) -> List[Interval]:
+    """Opening (open, close) windows for each day from start to end inclusive, in order."""
+    business_hours = business_hours or DEFAULT_BUSINESS_HOURS
+    windows = []
+    day = start
+    while day <= end:
+        hours = _day_hours(business_hours, day)
+        if hours and hours.get('open') and hours.get('close') and not hours.get('closed'):
+            open_dt = datetime.combine(day, datetime.strptime(hours['open'], '%H:%M').time())
+            close_dt = datetime.combine(day, datetime.strptime(hours['close'], '%H:%M').time())
+            if close_dt > open_dt:
+                windows.append((open_dt, close_dt))
+        day += timedelta(days=1)
+    return windows
+
+
+def blocked_intervals(bookings: Sequence[Interval], capacity: int = 1, buffer_minutes: int = 0) -> List[Interval]:
+    """
+    Merged intervals during which all `capacity` units are busy. Each
+    booking holds a unit from its start until its end plus the buffer.
+    """
+    capacity = max(1, capacity)
+    buffer = timedelta(minutes=buffer_minutes)
+    events = []
+    for start, end in bookings:
+        events.append((start, 1))
+        events.append((end + buffer, -1))
+    # Ends sort before starts at the same instant, so back-to-back bookings don't stack
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    blocked = []
+    load = 0
+    blocked_since = None
+    for at, delta in events:
+        load += delta
+        if load >= capacity and blocked_since is None:
+            blocked_since = at
+        elif load < capacity and blocked_since is not None:
+            if blocked_since < at:
+                if blocked and blocked[-1][1] >= blocked_since:
+                    blocked[-1] = (blocked[-1][0], at)
+                else:
+                    blocked.append((blocked_since, at))
+            blocked_since = None
+    return blocked
+
+
+def subtract_intervals(windows: Sequence[Interval], blocked: Sequence[Interval]) -> List[Tuple[datetime, datetime, datetime]]:
+    """
+    Free (start, end, window_open) pieces of sorted windows after removing
+    sorted, merged blocked intervals; a two-pointer merge over both lists.
+    """
+    free = []
+    i = 0
+    for window_open, window_close in windows:
+        cursor = window_open
+        while i < len(blocked) and blocked[i][1] <= cursor:
+            i += 1
+        j = i
+        while j < len(blocked) and blocked[j][0] < window_close:
+            if blocked[j][0] > cursor:
+                free.append((cursor, blocked[j][0], window_open))
+            cursor = max(cursor, blocked[j][1])
+            j += 1
+        if cursor < window_close:
+            free.append((cursor, window_close, window_open))
+    return free
+
+
+def free_intervals(
+    business_hours: Optional[Dict],
+    bookings: Sequence[Interval],
+    start: date,
+    end: date,
+    capacity: int = 1,
+    buffer_minutes: int = 0
+) -> Tuple[List[Tuple[datetime, datetime, datetime]], Dict[datetime, datetime]]:
+    """
+    Free (start, end, window_open) pieces from `start` to `end` inclusive
+    and each window's closing time, keyed by its opening time. These do not
+    depend on the service, so one computation serves every service.
+    """
+    buffer = timedelta(minutes=buffer_minutes)
+    windows = opening_windows(business_hours, start, end)
+    # The closing buffer may run past closing time, so windows are padded by it
+    padded = [(window_open, window_close + buffer) for window_open, window_close in windows]
+    closes = {window_open: window_close for window_open, window_close in windows}
+    return subtract_intervals(padded, blocked_intervals(bookings, capacity, buffer_minutes)), closes
+
+
+def slot_starts(
+    free: Sequence[Tuple[datetime, datetime, datetime]],
+    closes: Dict[datetime, datetime],
+    duration_minutes: float,
+    buffer_minutes: int = 0,
+    granularity_minutes: int = DEFAULT_GRANULARITY_MINUTES
+) -> Dict[date, List[datetime]]:
+    """Grid start times, keyed by day, at which a service of `duration_minutes` fits the free pieces."""
+    duration = timedelta(minutes=duration_minutes)
+    buffer = timedelta(minutes=buffer_minutes)
+    step = timedelta(minutes=granularity_minutes)
+
+    starts: Dict[date, List[datetime]] = {window_open.date(): [] for window_open in closes}
+    for free_start, free_end, window_open in free:
+        close = closes[window_open]
+        # First grid point at or after the start of the free piece
+        steps = -((window_open - free_start) // step)
+        slot = window_open + steps * step
+        while slot + duration <= close and slot + duration + buffer <= free_end:
+            starts[window_open.date()].append(slot)
+            slot += step
+    return starts
+
+
+def available_starts(
+    business_hours: Optional[Dict],
+    bookings: Sequence[Interval],
+    start: date,
+    end: date,
+    duration_minutes: float,
+    capacity: int = 1,
+    buffer_minutes: int = 0,
+    granularity_minutes: int = DEFAULT_GRANULARITY_MINUTES
+) -> Dict[date, List[datetime]]:
+    """
+    Start times from `start` to `end` (inclusive) at which a service of
+    `duration_minutes` fits, keyed by day. Starts lie on a grid of
+    `granularity_minutes` from each day's opening time; the service must
+    finish by closing and, with its buffer, must not need more than
+    `capacity` units at once alongside the existing bookings.
+    """
+    free, closes = free_intervals(business_hours, bookings, start, end, capacity, buffer_minutes)
+    return slot_starts(free, closes, duration_minutes, buffer_minutes, granularity_minutes)
+
+
+def booking_intervals(rows: Sequence[Tuple[datetime, Optional[float]]]) -> List[Interval]:
+    """(start, end) of existing bookings from (start, service duration in minutes) rows."""
+    return [
+        (start, start + timedelta(minutes=duration or DEFAULT_BOOKING_MINUTES))
+        for start, duration in rows
+        if start is not None
+    ]
+
+
+def day_range(start: date, end: date) -> Interval:
+    """[start of the first day, start of the day after the last) for range queries."""
+    return datetime.combine(start, time.min), datetime.combine(end + timedelta(days=1), time.min)
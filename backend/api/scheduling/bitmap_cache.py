@@ -0,0 +1,321 @@
+"""
+Cached availability per (location, day) as 5-minute cells. Each cell keeps
+how many bookings hold it, and one bit per cell says whether the location
+still has a free unit then. Entries are built on first read and updated in
+place when a booking is added or cancelled:
+
+    version = availability_cache.begin_change(db, location_id)
+    db.commit()
+    availability_cache.record_appointment(appointment, +1, version)
+
+Live slot holds count like bookings until they expire; a day with holds
+is rebuilt once its earliest hold lapses.
+
+Every worker process keeps its own entries. begin_change bumps the
+location's generation in the cache_generations table inside the booking's
+transaction, and entries are only served while they were built at the
+current generation, so a booking handled by another process is seen on the
+next read.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+
+from models.database import SessionLocal, Appointment, SpaService, SlotReservation
+from ..generations import bump_generation, safe_get_generation
+from .availability import (
+    Interval, available_starts, booking_intervals, day_range, opening_windows, DEFAULT_BOOKING_MINUTES
+)
+
+logger = logging.getLogger(__name__)
+
+CELL_MINUTES = 5
+CELLS_PER_DAY = 24 * 60 // CELL_MINUTES
+AVAILABILITY_CACHE_MAX_ENTRIES = int(os.getenv('AVAILABILITY_CACHE_MAX_ENTRIES', 5000))
+GENERATION_SCOPE = 'availability'
+
+
+def load_appointments(location_id: int, start: date, end: date) -> List[Interval]:
+    """Non-cancelled appointments at a location from start to end inclusive, one range query."""
+    range_start, range_end = day_range(start, end)
+    db = SessionLocal()
+    try:
+        rows = db.query(Appointment.datetime, SpaService.duration).outerjoin(
+            SpaService, Appointment.service_id == SpaService.id
+        ).filter(
+            Appointment.location_id == location_id,
+            Appointment.datetime >= range_start,
+            Appointment.datetime < range_end,
+            Appointment.status != 'cancelled'
+        ).all()
+        return booking_intervals(rows)
+    finally:
+        db.close()
+
+
+def load_holds(location_id: int, start: date, end: date,
+               buffer_minutes: int = 0) -> List[Tuple[datetime, datetime, datetime]]:
+    """
+    Live holds at a location from start to end inclusive as (start, end,
+    expires_at). Held cells include the buffer, which is taken off the end
+    so the hold blocks the same cells as a booking of that length.
+    """
+    range_start, range_end = day_range(start, end)
+    db = SessionLocal()
+    try:
+        rows = db.query(
+            func.min(SlotReservation.slot_start), func.max(SlotReservation.slot_start),
+            func.min(SlotReservation.expires_at)
+        ).filter(
+            SlotReservation.location_id == location_id,
+            SlotReservation.hold_token.isnot(None),
+            SlotReservation.expires_at > datetime.utcnow(),
+            SlotReservation.slot_start >= range_start,
+            SlotReservation.slot_start < range_end
+        ).group_by(SlotReservation.hold_token).all()
+        holds = []
+        for first, last, expires_at in rows:
+            end_at = last + timedelta(minutes=CELL_MINUTES - buffer_minutes)
+            holds.append((first, max(first, end_at), expires_at))
+        return holds
+    finally:
+        db.close()
+
+
+def load_bookings(location_id: int, start: date, end: date, buffer_minutes: int = 0) -> List[Interval]:
+    """Appointments and live holds at a location from start to end inclusive."""
+    holds = load_holds(location_id, start, end, buffer_minutes)
+    return load_appointments(location_id, start, end) + [(hold_start, hold_end) for hold_start, hold_end, _ in holds]
+
+
+def _settings(location) -> tuple:
+    """What an entry was built from; a change to any of these rebuilds it."""
+    return (location.capacity or 1, location.buffer_minutes or 0,
+            json.dumps(location.business_hours, sort_keys=True, default=str))
+
+
+def _minute_of_day(moment: datetime) -> int:
+    return moment.hour * 60 + moment.minute
+
+
+class DayBitmap:
+    """One location-day: per-cell booking counts and the free-cell bitmap."""
+
+    def __init__(self, day: date, settings: tuple, window: Optional[Interval], generation: Optional[int] = 0):
+        self.day = day
+        self.settings = settings
+        self.generation = generation
+        # Earliest expiry of the holds counted in loads; the entry is stale after it
+        self.valid_until: Optional[datetime] = None
+        self.capacity, self.buffer = settings[0], settings[1]
+        self.loads = bytearray(CELLS_PER_DAY)
+        self.open_cell = self.close_minute = None
+        self.open_mask = 0
+        if window:
+            self.open_cell = _minute_of_day(window[0]) // CELL_MINUTES
+            self.close_minute = _minute_of_day(window[1]) or 24 * 60
+            # The closing buffer may run past closing time, so the open cells extend by it
+            last_cell = min(CELLS_PER_DAY, -(-(self.close_minute + self.buffer) // CELL_MINUTES))
+            self.open_mask = ((1 << (last_cell - self.open_cell)) - 1) << self.open_cell
+        self.free = self.open_mask
+
+    def _cells(self, start: datetime, end: datetime) -> range:
+        """Cells a booking holds on this day, including its buffer."""
+        day_start = datetime.combine(self.day, datetime.min.time())
+        first = math.floor((start - day_start).total_seconds() / 60 / CELL_MINUTES)
+        last = math.ceil(((end - day_start).total_seconds() / 60 + self.buffer) / CELL_MINUTES)
+        return range(max(0, first), min(CELLS_PER_DAY, last))
+
+    def apply(self, start: datetime, end: datetime, delta: int) -> None:
+        """Add (delta=1) or remove (delta=-1) one booking and update the affected bits."""
+        for cell in self._cells(start, end):
+            self.loads[cell] = max(0, min(255, self.loads[cell] + delta))
+            if self.loads[cell] >= self.capacity:
+                self.free &= ~(1 << cell)
+            else:
+                self.free |= (1 << cell) & self.open_mask
+
+    def add_hold(self, start: datetime, end: datetime, expires_at: datetime) -> None:
+        """Count a live hold until it expires."""
+        self.apply(start, end, 1)
+        if self.valid_until is None or expires_at < self.valid_until:
+            self.valid_until = expires_at
+
+    def current(self, settings: tuple, generation: Optional[int], now: datetime) -> bool:
+        """Whether the entry can be served: same settings, same generation and no lapsed hold."""
+        return (self.settings == settings and self.generation == generation
+                and (self.valid_until is None or now < self.valid_until))
+
+    def starts(self, duration_minutes: float, granularity_minutes: int) -> List[datetime]:
+        """Grid starts from opening at which the service and its buffer find free cells throughout."""
+        if self.open_cell is None:
+            return []
+        needed = max(1, math.ceil((duration_minutes + self.buffer) / CELL_MINUTES))
+        # Bit i of runs is set when cells i .. i + needed - 1 are all free
+        runs = self.free
+        span = 1
+        while span < needed and runs:
+            shift = min(span, needed - span)
+            runs &= runs >> shift
+            span += shift
+
+        step = granularity_minutes // CELL_MINUTES
+        day_start = datetime.combine(self.day, datetime.min.time())
+        starts = []
+        cell = self.open_cell
+        while cell * CELL_MINUTES + duration_minutes <= self.close_minute:
+            if runs >> cell & 1:
+                starts.append(day_start + timedelta(minutes=cell * CELL_MINUTES))
+            cell += step
+        return starts
+
+
+class AvailabilityCache:
+    """LRU of DayBitmaps keyed by (location_id, day), each tagged with the generation it reflects."""
+
+    def __init__(self, max_entries: int = AVAILABILITY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, DayBitmap]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'updates': 0}
+
+    @staticmethod
+    def _cacheable(location, granularity_minutes: int) -> bool:
+        if granularity_minutes <= 0 or granularity_minutes % CELL_MINUTES:
+            return False
+        hours = location.business_hours or {}
+        times = [value for day in hours.values() if isinstance(day, dict)
+                 for key, value in day.items() if key in ('open', 'close') and value]
+        return all(int(value.split(':')[1]) % CELL_MINUTES == 0 for value in times)
+
+    def _days(self, location, start: date, end: date) -> List[DayBitmap]:
+        settings = _settings(location)
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        found: Dict[date, DayBitmap] = {}
+        # None when it can't be read: build from the database and keep nothing
+        generation = safe_get_generation(GENERATION_SCOPE, location.id)
+        now = datetime.utcnow()
+        with self._lock:
+            for day in days:
+                entry = self._entries.get((location.id, day))
+                if entry is not None and entry.current(settings, generation, now):
+                    self._entries.move_to_end((location.id, day))
+                    found[day] = entry
+            self.stats['hits'] += len(found)
+            self.stats['misses'] += len(days) - len(found)
+
+        missing = [day for day in days if day not in found]
+        if missing:
+            bookings = load_appointments(location.id, missing[0], missing[-1])
+            holds = load_holds(location.id, missing[0], missing[-1], location.buffer_minutes or 0)
+            windows = {window[0].date(): window for window in
+                       opening_windows(location.business_hours, missing[0], missing[-1])}
+            built = {day: DayBitmap(day, settings, windows.get(day), generation) for day in missing}
+            for booking_start, booking_end in bookings:
+                entry = built.get(booking_start.date())
+                if entry is not None:
+                    entry.apply(booking_start, booking_end, 1)
+            for hold_start, hold_end, expires_at in holds:
+                entry = built.get(hold_start.date())
+                if entry is not None:
+                    entry.add_hold(hold_start, hold_end, expires_at)
+            found.update(built)
+
+            # A build that overlapped a booking change may or may not include it, so it is not kept
+            if generation is not None and safe_get_generation(GENERATION_SCOPE, location.id) == generation:
+                with self._lock:
+                    for day, entry in built.items():
+                        self._entries[(location.id, day)] = entry
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        return [found[day] for day in days]
+
+    def available_starts(
+        self,
+        location,
+        start: date,
+        end: date,
+        duration_minutes: float,
+        granularity_minutes: int
+    ) -> Dict[date, List[datetime]]:
+        """Same answer as availability.available_starts for the location, served from the bitmaps."""
+        if not self._cacheable(location, granularity_minutes):
+            return available_starts(
+                location.business_hours, load_bookings(location.id, start, end, location.buffer_minutes or 0),
+                start, end, duration_minutes,
+                location.capacity or 1, location.buffer_minutes or 0, granularity_minutes
+            )
+        return {
+            entry.day: entry.starts(duration_minutes, granularity_minutes)
+            for entry in self._days(location, start, end)
+            if entry.open_cell is not None
+        }
+
+    def begin_change(self, db, location_id: Optional[int]) -> Optional[int]:
+        """
+        Bump the location's generation in the caller's transaction, before
+        it commits a booking change; pass the returned version to
+        record_booking after the commit.
+        """
+        if location_id is None:
+            return None
+        return bump_generation(GENERATION_SCOPE, location_id, db)
+
+    def record_booking(self, location_id: Optional[int], start: Optional[datetime],
+                       duration_minutes: Optional[float], delta: int, version: Optional[int],
+                       expires_at: Optional[datetime] = None) -> None:
+        """
+        Apply a committed added (delta=1) or cancelled (delta=-1) booking, or
+        a new hold expiring at expires_at, to this process's cached days.
+        Only entries built at the generation just before the change are
+        brought forward; anything else may miss another change and is left
+        to be rebuilt.
+        """
+        if location_id is None or start is None or version is None:
+            return
+        start = start.replace(tzinfo=None)
+        end = start + timedelta(minutes=duration_minutes or DEFAULT_BOOKING_MINUTES)
+        with self._lock:
+            for key, entry in self._entries.items():
+                if key[0] != location_id or entry.generation != version - 1:
+                    continue
+                # Other days are unaffected by the booking and stay valid at the new generation
+                if key[1] == start.date():
+                    if expires_at is not None:
+                        entry.add_hold(start, end, expires_at)
+                    else:
+                        entry.apply(start, end, delta)
+                    self.stats['updates'] += 1
+                entry.generation = version
+
+    def record_appointment(self, appointment, delta: int, version: Optional[int]) -> None:
+        """record_booking for an Appointment row (its session must still be open)."""
+        try:
+            duration = appointment.service.duration if appointment.service else None
+            self.record_booking(appointment.location_id, appointment.datetime, duration, delta, version)
+        except Exception as e:
+            logger.error(f"Error updating availability cache: {str(e)}")
+            self.invalidate(appointment.location_id)
+
+    def invalidate(self, location_id: Optional[int], days: Optional[Sequence[date]] = None) -> None:
+        """Drop a location's cached days (all of them when days is None) here and in other processes."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == location_id and (days is None or key[1] in days)]:
+                del self._entries[key]
+        if location_id is not None:
+            try:
+                bump_generation(GENERATION_SCOPE, location_id)
+            except Exception as e:
+                logger.error(f"Error bumping availability generation for {location_id}: {str(e)}")
+
+
+# Shared cache used by the availability endpoints
+availability_cache = AvailabilityCache()
@@ -0,0 +1,194 @@
+"""
+Atomic slot claims. A booking or hold inserts one SlotReservation row per
+5-minute cell it covers (buffer included), on the lowest capacity unit
+still free in that cell. The unique constraint on (location_id,
+slot_start, unit) makes a concurrent claim of the same unit fail on
+insert, so bookings no longer need to be serialised:
+
+    appointment = Appointment(...)
+    db.add(appointment)
+    db.flush()
+    try:
+        reserve_appointment(db, location, appointment, service.duration, hold_token)
+    except SlotTaken:
+        db.rollback()   # 409
+    availability_cache.begin_change(db, location.id)
+    db.commit()
+
+Holds are the same rows with a hold_token and an expiry. Expired holds
+stop counting as soon as they lapse and are deleted by the next claim
+that touches them or by purge_expired_holds.
+"""
+
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import count
+from typing import List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from models.database import SlotReservation
+from .availability import DEFAULT_BOOKING_MINUTES
+from .bitmap_cache import CELL_MINUTES
+
+logger = logging.getLogger(__name__)
+
+# How long a slot stays held while the client fills in the booking form
+SLOT_HOLD_TTL_SECONDS = int(os.getenv('SLOT_HOLD_TTL_SECONDS', 300))
+
+
+class SlotTaken(Exception):
+    """The requested slot has no free unit left, or a concurrent claim got it first."""
+
+
+def _naive(moment: datetime) -> datetime:
+    # Appointment datetimes are stored without their offset, so cells are too
+    return moment.replace(tzinfo=None)
+
+
+def reservation_cells(start: datetime, duration_minutes: Optional[float], buffer_minutes: int = 0) -> List[datetime]:
+    """Starts of the cells a booking holds, from its start until its end plus the buffer."""
+    start = _naive(start)
+    day_start = datetime.combine(start.date(), datetime.min.time())
+    minutes = (start - day_start).total_seconds() / 60
+    first = int(minutes // CELL_MINUTES)
+    last = -int(-(minutes + (duration_minutes or DEFAULT_BOOKING_MINUTES) + buffer_minutes) // CELL_MINUTES)
+    return [day_start + timedelta(minutes=cell * CELL_MINUTES) for cell in range(first, max(last, first + 1))]
+
+
+def claim_slot(
+    db,
+    location,
+    start: datetime,
+    duration_minutes: Optional[float],
+    appointment_id: Optional[int] = None,
+    hold_token: Optional[str] = None,
+    expires_at: Optional[datetime] = None,
+    enforce_capacity: bool = True
+) -> List[SlotReservation]:
+    """
+    Claim a unit in every cell of the slot inside the caller's transaction.
+    Raises SlotTaken when a cell is full (only if enforce_capacity) or a
+    concurrent claim wins the insert; the caller must then roll back.
+    """
+    cells = reservation_cells(start, duration_minutes, location.buffer_minutes or 0)
+    capacity = location.capacity or 1
+    now = datetime.utcnow()
+
+    # Lapsed holds on these cells would otherwise block the insert
+    db.query(SlotReservation).filter(
+        SlotReservation.location_id == location.id,
+        SlotReservation.slot_start.in_(cells),
+        SlotReservation.expires_at <= now
+    ).delete(synchronize_session=False)
+
+    taken = defaultdict(set)
+    for slot_start, unit in db.query(SlotReservation.slot_start, SlotReservation.unit).filter(
+        SlotReservation.location_id == location.id,
+        SlotReservation.slot_start.in_(cells)
+    ):
+        taken[slot_start].add(unit)
+
+    rows = []
+    for cell in cells:
+        unit = next(u for u in count() if u not in taken[cell])
+        if unit >= capacity:
+            if enforce_capacity:
+                raise SlotTaken(f"Location {location.id} is fully booked at {cell:%Y-%m-%d %H:%M}")
+            logger.warning(f"Location {location.id} overbooked at {cell:%Y-%m-%d %H:%M}")
+        rows.append(SlotReservation(
+            location_id=location.id,
+            slot_start=cell,
+            unit=unit,
+            appointment_id=appointment_id,
+            hold_token=hold_token,
+            expires_at=expires_at,
+            created_at=now
+        ))
+
+    db.add_all(rows)
+    try:
+        db.flush()
+    except IntegrityError:
+        raise SlotTaken(f"Slot at {cells[0]:%Y-%m-%d %H:%M} was claimed concurrently")
+    return rows
+
+
+def hold_slot(db, location, start: datetime, duration_minutes: Optional[float],
+              ttl_seconds: int = SLOT_HOLD_TTL_SECONDS) -> tuple:
+    """Hold the slot for ttl_seconds; returns (hold_token, expires_at)."""
+    token = str(uuid.uuid4())
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+    claim_slot(db, location, start, duration_minutes, hold_token=token, expires_at=expires_at)
+    return token, expires_at
+
+
+def convert_hold(db, hold_token: str, location, start: datetime,
+                 duration_minutes: Optional[float], appointment_id: int) -> bool:
+    """
+    Turn a live hold covering the slot into the appointment's booking.
+    Returns False (and drops the hold) when it has lapsed or is for a
+    different slot; raises SlotTaken if it lapses while being converted.
+    """
+    cells = reservation_cells(start, duration_minutes, location.buffer_minutes or 0)
+    now = datetime.utcnow()
+    held = db.query(SlotReservation).filter(
+        SlotReservation.hold_token == hold_token,
+        SlotReservation.location_id == location.id,
+        SlotReservation.slot_start.in_(cells),
+        SlotReservation.expires_at > now
+    )
+    if held.count() != len(cells):
+        release_hold(db, hold_token)
+        return False
+
+    # The expiry check is repeated in the UPDATE, so a purge in between can't leave half a booking
+    converted = held.update(
+        {'appointment_id': appointment_id, 'hold_token': None, 'expires_at': None},
+        synchronize_session=False
+    )
+    if converted != len(cells):
+        raise SlotTaken(f"Hold {hold_token} expired")
+    # Cells held beyond this slot (e.g. for a longer service) are no longer needed
+    release_hold(db, hold_token)
+    return True
+
+
+def reserve_appointment(db, location, appointment, duration_minutes: Optional[float],
+                        hold_token: Optional[str] = None) -> None:
+    """Reserve a flushed appointment's slot, from the client's hold when it still covers it."""
+    if hold_token and convert_hold(db, hold_token, location, appointment.datetime,
+                                   duration_minutes, appointment.id):
+        return
+    claim_slot(db, location, appointment.datetime, duration_minutes, appointment_id=appointment.id)
+
+
+def release_hold(db, hold_token: str) -> int:
+    """Drop a hold; returns how many cells it freed."""
+    return db.query(SlotReservation).filter(
+        SlotReservation.hold_token == hold_token
+    ).delete(synchronize_session=False)
+
+
+def release_appointment(db, appointment_id: int) -> int:
+    """Free a cancelled appointment's cells."""
+    return db.query(SlotReservation).filter(
+        SlotReservation.appointment_id == appointment_id
+    ).delete(synchronize_session=False)
+
+
+def purge_expired_holds(db) -> int:
+    """
+    Delete every lapsed hold; claims and the availability cache ignore
+    them anyway, so this only keeps the table small and needs no
+    availability_cache.begin_change.
+    """
+    purged = db.query(SlotReservation).filter(
+        SlotReservation.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    if purged:
+        logger.info(f"Purged {purged} expired slot hold cells")
+    return purged
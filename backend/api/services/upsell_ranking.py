@@ -0,0 +1,231 @@
+"""Local add-on ranking from co-booking statistics and the conversation."""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+
+from models.database import SessionLocal, Appointment, SpaService
+from ..generations import bump_generation, safe_get_generation
+
+logger = logging.getLogger(__name__)
+
+# How long a spa's co-booking statistics are reused before they are recomputed
+UPSELL_STATS_TTL = float(os.getenv('UPSELL_STATS_TTL', 900))
+GENERATION_SCOPE = 'upsell_stats'
+# Pseudo-count that keeps rarely booked services from getting extreme rates
+UPSELL_PRIOR_VISITS = 5
+# Score weights; each signal is in [0, 1]
+UPSELL_WEIGHTS = {'co_booking': 0.4, 'type_affinity': 0.15, 'keywords': 0.3, 'price': 0.15}
+# Below this top score the local ranking has no real signal
+UPSELL_MIN_SIGNAL = 0.05
+
+BUDGET_TERMS = {'cheap', 'cheaper', 'cheapest', 'budget', 'affordable', 'afford', 'discount', 'deal', 'expensive', 'cost', 'save'}
+PREMIUM_TERMS = {'luxury', 'luxurious', 'premium', 'splurge', 'treat', 'pamper', 'indulge', 'special', 'birthday', 'anniversary'}
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'at', 'be', 'book', 'booking', 'can', 'do', 'for', 'get', 'have', 'i', 'in', 'is', 'it',
+    'like', 'me', 'my', 'of', 'on', 'or', 'please', 'the', 'to', 'want', 'we', 'what', 'with', 'would', 'you', 'your'
+}
+
+
+def _words(text: str) -> set:
+    return {word for word in re.findall(r"[a-z]+", (text or '').lower()) if word not in STOPWORDS and len(word) > 2}
+
+
+def _service_type(name: str, catalog_types: Dict[str, str], types: List[str]) -> Optional[str]:
+    """Catalog type of a booked service, else the first service type its name mentions."""
+    catalog_type = catalog_types.get(name)
+    if catalog_type:
+        return None if catalog_type == 'add-on' else catalog_type
+    return next((t for t in types if t.lower() in name), None)
+
+
+class CoBookingStats:
+    """
+    Per-spa counts of what gets booked together. A visit is one client's
+    non-cancelled appointments on one day; for each service name we keep
+    how many visits included it and how many of those also included a
+    service of each type.
+    """
+
+    def __init__(self):
+        self.visits = 0
+        self.type_visits: Counter = Counter()
+        self.name_visits: Counter = Counter()
+        self.name_with_type: Counter = Counter()
+
+    @classmethod
+    def build(cls, spa_id: str, services: List[Dict]) -> 'CoBookingStats':
+        catalog_types = {(s.get('name') or '').lower(): s.get('type') for s in services if s.get('type')}
+        types = sorted({s.get('parent_type') for s in services if s.get('parent_type')} |
+                       {t for t in catalog_types.values() if t != 'add-on'})
+
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                Appointment.client_email, Appointment.client_phone, Appointment.client_name,
+                Appointment.datetime, SpaService.name
+            ).join(SpaService, Appointment.service_id == SpaService.id).filter(
+                Appointment.spa_id == spa_id,
+                or_(Appointment.status.is_(None), Appointment.status != 'cancelled')
+            ).all()
+        finally:
+            db.close()
+
+        visits = defaultdict(set)
+        for email, phone, client_name, when, name in rows:
+            client = (email or phone or client_name or '').strip().lower()
+            if client and when and name:
+                visits[(client, when.date())].add(name.lower())
+
+        stats = cls()
+        for names in visits.values():
+            visit_types = {_service_type(name, catalog_types, types) for name in names} - {None}
+            stats.visits += 1
+            stats.type_visits.update(visit_types)
+            stats.name_visits.update(names)
+            stats.name_with_type.update((name, t) for name in names for t in visit_types)
+        return stats
+
+    def co_booking(self, name: str, service_type: str) -> float:
+        """Share of visits with this service type that also included the add-on."""
+        together = self.name_with_type[(name.lower(), service_type)]
+        return together / (self.type_visits[service_type] + UPSELL_PRIOR_VISITS)
+
+    def type_affinity(self, name: str, service_type: str) -> float:
+        """Share of the add-on's visits that were alongside this service type."""
+        together = self.name_with_type[(name.lower(), service_type)]
+        return together / (self.name_visits[name.lower()] + UPSELL_PRIOR_VISITS)
+
+
+class CoBookingCache:
+    """
+    Co-booking statistics per spa. Appointment writes bump the spa's
+    generation, shared by all worker processes; statistics that are out of
+    date or older than UPSELL_STATS_TTL keep being served while a background
+    thread recomputes them, so only a spa's first lookup builds them on the
+    request path.
+    """
+
+    def __init__(self, ttl: float = UPSELL_STATS_TTL):
+        self.ttl = ttl
+        self._stats: Dict[str, Tuple[int, float, CoBookingStats]] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, spa_id: str, services: List[Dict]) -> CoBookingStats:
+        generation = safe_get_generation(GENERATION_SCOPE, spa_id)
+        with self._lock:
+            entry = self._stats.get(spa_id)
+            if entry is None:
+                pass
+            elif generation is not None and entry[0] == generation and time.monotonic() - entry[1] < self.ttl:
+                return entry[2]
+            elif spa_id not in self._refreshing:
+                self._refreshing.add(spa_id)
+                threading.Thread(target=self._refresh, args=(spa_id, services, generation),
+                                 daemon=True, name=f"UpsellStats-{spa_id}").start()
+        if entry is not None:
+            return entry[2]
+        return self._build(spa_id, services, generation)
+
+    def _build(self, spa_id: str, services: List[Dict], generation: Optional[int]) -> CoBookingStats:
+        stats = CoBookingStats.build(spa_id, services)
+        # Don't store statistics that missed an appointment written during the build
+        if generation is not None and safe_get_generation(GENERATION_SCOPE, spa_id) == generation:
+            with self._lock:
+                self._stats[spa_id] = (generation, time.monotonic(), stats)
+        logger.info(f"Co-booking stats for {spa_id}: {stats.visits} visits")
+        return stats
+
+    def _refresh(self, spa_id: str, services: List[Dict], generation: Optional[int]) -> None:
+        try:
+            self._build(spa_id, services, generation)
+        except Exception as e:
+            logger.error(f"Error refreshing co-booking stats for {spa_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(spa_id)
+
+    def invalidate(self, spa_id: str, db=None) -> None:
+        """
+        Mark a spa's statistics out of date in every process. Call when an
+        appointment is created or changes; with `db` the bump commits with
+        the caller's transaction.
+        """
+        if spa_id:
+            bump_generation(GENERATION_SCOPE, spa_id, db)
+
+
+# Shared statistics used by the upsell ranking
+cobooking_cache = CoBookingCache()
+
+
+def estimate_price_sensitivity(text: str) -> Optional[float]:
+    """0 (price no object) to 1 (price conscious) from the wording, None if no hint."""
+    words = _words(text)
+    budget, premium = len(words & BUDGET_TERMS), len(words & PREMIUM_TERMS)
+    if not budget and not premium:
+        return None
+    return budget / (budget + premium)
+
+
+def conversation_text(customer_history: Optional[List[Dict]], message: str = '') -> str:
+    """The client's side of the conversation."""
+    parts = [msg.get('content', '') for msg in (customer_history or []) if msg.get('isUser', True)]
+    return ' '.join(parts + [message or ''])
+
+
+def score_addons(
+    options: List[Dict],
+    service_type: str,
+    stats: CoBookingStats,
+    text: str = '',
+    price_sensitivity: Optional[float] = None
+) -> List[float]:
+    """Weighted score of each add-on option, in option order."""
+    if price_sensitivity is None:
+        price_sensitivity = estimate_price_sensitivity(text)
+    words = _words(text)
+    prices = [float(option.get('price') or 0) for option in options]
+    max_price = max(prices) if prices else 0.0
+
+    scores = []
+    for option, price in zip(options, prices):
+        name = option.get('name') or ''
+        option_words = _words(f"{name} {option.get('description') or ''}")
+        signals = {
+            'co_booking': stats.co_booking(name, service_type),
+            'type_affinity': stats.type_affinity(name, service_type),
+            'keywords': len(words & option_words) / len(option_words) if option_words else 0.0,
+            # Cheaper add-ons suit price conscious clients, pricier ones clients looking to treat themselves
+            'price': 0.0 if price_sensitivity is None or not max_price else
+                     price_sensitivity * (1 - price / max_price) + (1 - price_sensitivity) * (price / max_price)
+        }
+        scores.append(sum(UPSELL_WEIGHTS[key] * value for key, value in signals.items()))
+    return scores
+
+
+def rank_addons(
+    spa_id: str,
+    service_type: str,
+    options: List[Dict],
+    services: List[Dict],
+    text: str = '',
+    price_sensitivity: Optional[float] = None
+) -> Tuple[List[Dict], bool]:
+    """
+    Options sorted by local score (catalog order breaks ties) and whether
+    the ranking had any signal to go on.
+    """
+    if not options:
+        return [], False
+    stats = cobooking_cache.get(spa_id, services)
+    scores = score_addons(options, service_type, stats, text, price_sensitivity)
+    order = sorted(range(len(options)), key=lambda i: -scores[i])
+    return [options[i] for i in order], max(scores) >= UPSELL_MIN_SIGNAL
@@ -1,135 +1,42 @@
 from typing import Dict, List, Optional
-import openai
 from datetime import datetime
-from models.database import SessionLocal, SpaService, SpaProfile, BrandSettings, Document
-from sqlalchemy import and_
+from models.database import SessionLocal, BrandSettings
+from ..chatbot.context_cache import spa_context_cache
 
-class UpsellService:
-    def __init__(self, spa_id: str = None):
-        self.spa_id = spa_id
-        self.db = SessionLocal()
-
-    def __del__(self):
-        self.db.close()
-
-    def _get_spa_context(self) -> str:
-        """Get relevant spa context from documents and profile."""
-        try:
-            # Get spa profile and brand settings
-            profile = self.db.query(SpaProfile).filter_by(spa_id=self.spa_id).first()
-            brand_settings = self.db.query(BrandSettings).filter_by(spa_id=self.spa_id).first()
-            
-            # Get relevant documents
-            docs = self.db.query(Document).filter_by(
-                spa_id=self.spa_id,
-                processed=True
-            ).all()
-            
-            context_parts = []
-            
-            if profile:
-                context_parts.append(f"Business Profile: {profile.business_name} - {profile.description}")
-            
-            if brand_settings and brand_settings.services:
-                services_str = "Available Services: " + ", ".join(
-                    [s.get('name', '') for s in brand_settings.services]
-                )
-                context_parts.append(services_str)
-            
-            # Add relevant document content
-            for doc in docs:
-                if doc.doc_metadata and isinstance(doc.doc_metadata, dict):
-                    if doc.doc_metadata.get('category') in ['services', 'pricing', 'promotions']:
-                        context_parts.append(doc.content[:500])  # Limit content length
-            
-            return "\n".join(context_parts)
-        except Exception as e:
-            print(f"Error getting spa context: {str(e)}")
-            return ""
-
-    async def get_personalized_upsell(
-        self, 
-        service_type: str, 
-        customer_history: Optional[List[Dict]] = None,
-        price_sensitivity: Optional[float] = None
-    ) -> List[Dict]:
-        """Get personalized upsell recommendations based on service type and customer history."""
-        try:
-            # Get base service options from brand settings
-            brand_settings = self.db.query(BrandSettings).filter_by(spa_id=self.spa_id).first()
-            base_options = []
-            
-            if brand_settings and brand_settings.services:
-                for service in brand_settings.services:
-                    if service.get('type') == 'add-on' and service.get('parent_type') == service_type:
-                        base_options.append({
-                            'name': service.get('name'),
-                            'description': service.get('description'),
-                            'price': service.get('price'),
-                            'duration': service.get('duration')
-                        })
-
-            if not base_options:
-                return []
+def _load_brand_services(spa_id: str) -> List[Dict]:
+    db = SessionLocal()
+    try:
+        brand_settings = db.query(BrandSettings).filter_by(spa_id=spa_id).first()
+        return list(brand_settings.services or []) if brand_settings else []
+    finally:
+        db.close()
 
-            # Get spa context for better personalization
-            spa_context = self._get_spa_context()
+def get_brand_services(spa_id: str) -> List[Dict]:
+    """The spa's BrandSettings.services list (cached per spa context version)."""
+    if not spa_id:
+        return []
+    return spa_context_cache.get_or_build(spa_id, 'brand_services', lambda: _load_brand_services(spa_id))
 
-            # If we have customer history, use OpenAI to personalize suggestions
-            if customer_history:
-                try:
-                    messages = [
-                        {
-                            "role": "system",
-                            "content": f"""You are a spa upsell recommendation system. Use the following spa context 
-                            to make personalized recommendations:\n\n{spa_context}"""
-                        },
-                        {
-                            "role": "user",
-                            "content": f"""Customer history: {customer_history}
-                            Available add-ons: {base_options}
-                            Price sensitivity: {price_sensitivity}
-                            Service type: {service_type}
+def addon_options(services: List[Dict], service_type: str, ranked: Optional[List[str]] = None) -> List[Dict]:
+    """Add-ons for a service type, the ranked names first and the rest in catalog order."""
+    options = [
+        {
+            'name': service.get('name'),
+            'description': service.get('description'),
+            'price': service.get('price'),
+            'duration': service.get('duration')
+        }
+        for service in services
+        if service.get('type') == 'add-on' and service.get('parent_type') == service_type
+    ]
+    if ranked:
+        position = {name.lower(): i for i, name in enumerate(ranked)}
+        options.sort(key=lambda option: position.get((option['name'] or '').lower(), len(position)))
+    return options
 
-                            Analyze the customer's conversation history and preferences to rank the most relevant 
-                            add-on services. Consider their interests, previous treatments, and any mentioned 
-                            preferences or concerns."""
-                        }
-                    ]
-
-                    response = await openai.chat.completions.create(
-                        model="gpt-4",
-                        messages=messages,
-                        temperature=0.7,
-                        max_tokens=200
-                    )
-                    
-                    # Parse the response and reorder the options
-                    suggested_order = response.choices[0].message.content.strip().split('\n')
-                    reordered_options = []
-                    
-                    for suggestion in suggested_order:
-                        for option in base_options:
-                            if option["name"].lower() in suggestion.lower():
-                                reordered_options.append(option)
-                    
-                    # Add any remaining options not mentioned by the AI
-                    for option in base_options:
-                        if option not in reordered_options:
-                            reordered_options.append(option)
-                    
-                    return reordered_options
-                    
-                except Exception as e:
-                    print(f"Error getting personalized upsells: {str(e)}")
-                    return base_options
-            
-            return base_options
-        except Exception as e:
-            print(f"Error in get_personalized_upsell: {str(e)}")
-            return []
-
-    def format_upsell_message(self, service_type: str, upsell_option: Dict) -> str:
+class UpsellService:
+    @staticmethod
+    def format_upsell_message(service_type: str, upsell_option: Dict) -> str:
         """Format an upsell suggestion into a natural language message."""
         try:
             templates = {
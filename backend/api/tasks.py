@@ -1,82 +1,219 @@
 """Background task processing module."""
 
 import threading
-from queue import Queue, Empty
-from typing import Any, Callable
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from typing import Dict, Iterator, List, Optional, Union, BinaryIO
 import logging
 from datetime import datetime
-from .rag.document_loader import process_document
+from sqlalchemy import update
+from .rag.document_loader import iter_document_chunks, split_pages, count_pages, update_chunks
+from .rag.vector_index import invalidate_index
+from .rag.blob_store import blob_store
+from .chatbot.context_cache import invalidate_spa_context
+from .integrations.slot_cache import start_slot_refresher, stop_slot_refresher
+from .job_queue import (
+    enqueue_job, claim_job, heartbeat, complete_job, fail_job, recover_jobs, release_superseded,
+    document_busy, get_job_status, get_document_job_status, JOB_LEASE_SECONDS
+)
 from models.database import SessionLocal, Document
 import traceback
-import tempfile
+import io
+import socket
+import time
 import os
 import base64
 
 logger = logging.getLogger(__name__)
 
-# Task queue
-task_queue = Queue()
+# Pool configuration
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 4))
+INGEST_PARSE_PROCESSES = int(os.getenv('INGEST_PARSE_PROCESSES', min(4, os.cpu_count() or 1)))
+INGEST_DRAIN_TIMEOUT = float(os.getenv('INGEST_DRAIN_TIMEOUT', 30))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2))
+JOB_PROGRESS_INTERVAL = float(os.getenv('JOB_PROGRESS_INTERVAL', 2))
+# PDF pages handed to a parse process at a time
+INGEST_PAGE_WINDOW = int(os.getenv('INGEST_PAGE_WINDOW', 20))
+
 _should_stop = False
+_workers: List[threading.Thread] = []
+_parse_executor: Optional[ProcessPoolExecutor] = None
+_wakeup = threading.Event()
+
+class LeaseLost(Exception):
+    """Raised when another worker has taken over a job."""
+
+class LeaseKeeper:
+    """Heartbeats a job lease from a side thread and records progress."""
+
+    def __init__(self, job_id: int, worker_id: str):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.chunks_done = None
+        self.chunks_total = None
+        self.lost = False
+        self._last_beat = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"JobLease-{job_id}")
+
+    def _run(self) -> None:
+        while not self._stop.wait(JOB_LEASE_SECONDS / 3):
+            self.beat()
+
+    def beat(self) -> None:
+        self._last_beat = time.monotonic()
+        try:
+            if not heartbeat(self.job_id, self.worker_id, self.chunks_done, self.chunks_total):
+                logger.warning(f"Lost lease on job {self.job_id}")
+                self.lost = True
+                self._stop.set()
+        except Exception as e:
+            logger.error(f"Heartbeat failed for job {self.job_id}: {str(e)}")
+
+    def progress(self, done: int, total: Optional[int]) -> None:
+        """Progress callback for store_chunks; aborts the job if the lease was lost."""
+        self.chunks_done = done
+        if total is not None:
+            self.chunks_total = total
+        if time.monotonic() - self._last_beat >= JOB_PROGRESS_INTERVAL:
+            self.beat()
+        self.check()
+
+    def check(self) -> None:
+        if self.lost:
+            raise LeaseLost(f"Job {self.job_id} was taken over by another worker")
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+def enqueue_document(document_id: int, spa_id: Optional[str] = None, supersede: bool = False) -> Optional[int]:
+    """Queue a document for background processing; returns the job id. See enqueue_job for supersede."""
+    job_id = enqueue_job(document_id, spa_id, supersede)
+    _wakeup.set()
+    return job_id
+
+def _blob_referenced(blob_hash: str) -> bool:
+    db = SessionLocal()
+    try:
+        return db.query(Document.id).filter_by(blob_hash=blob_hash).first() is not None
+    finally:
+        db.close()
+
+def release_blob(blob_hash: Optional[str], document_id: Optional[int] = None) -> None:
+    """
+    Delete a stored file once no document references it. While a job for
+    `document_id` may still be reading it, the file is left for that job
+    to release when it stops.
+    """
+    if not blob_hash or (document_id is not None and document_busy(document_id)):
+        return
+    blob_store.delete_unreferenced(blob_hash, lambda: _blob_referenced(blob_hash))
+
+def _iter_chunks(source: Union[str, BinaryIO], file_type: str, name: str) -> Iterator[Dict]:
+    """
+    Lazily yield chunks for a document. PDFs on disk are parsed in page
+    windows in the process pool, one window ahead of the embedder, so at
+    most two windows are in memory; anything else streams in-thread.
+    """
+    if _parse_executor is None or file_type != 'pdf' or not isinstance(source, str):
+        yield from iter_document_chunks(source, file_type, name)
+        return
+
+    total_pages = count_pages(source, file_type)
+    windows = range(0, total_pages, INGEST_PAGE_WINDOW)
+    pending = None
+    for start in windows:
+        future = _parse_executor.submit(split_pages, source, file_type, start, start + INGEST_PAGE_WINDOW, name)
+        if pending is not None:
+            yield from pending.result()
+        pending = future
+    if pending is not None:
+        yield from pending.result()
+
+def _document_source(doc: Document) -> Union[str, BinaryIO]:
+    """Blob path for the document's file, or a stream over legacy inline content."""
+    if doc.blob_hash:
+        return blob_store.path(doc.blob_hash)
+    if (doc.doc_metadata or {}).get('content_type', '').startswith('text/'):
+        return io.BytesIO(doc.content.encode('utf-8'))
+    return io.BytesIO(base64.b64decode(doc.content))
 
-def process_task(task_id: int) -> None:
-    """Process a document in the background."""
+def process_task(job: Dict, worker_id: str) -> None:
+    """Process a leased ingestion job in the background."""
+    task_id = job['document_id']
+    keeper = LeaseKeeper(job['id'], worker_id)
+    keeper.start()
     db = SessionLocal()
+    doc = None
+    ingested_blob = None
+    superseded = False
     try:
         # Get document from database
         doc = db.query(Document).filter_by(id=task_id).first()
         if not doc:
             logger.error(f"Document {task_id} not found")
+            keeper.stop()
+            fail_job(job['id'], worker_id, 'Document not found')
             return
 
-        logger.info(f"Processing document {task_id}: {doc.name}")
-        
-        # Skip if already processed
-        if doc.processed:
+        logger.info(f"Processing document {task_id}: {doc.name} (attempt {job['attempts']})")
+
+        # Skip if the current file was already processed (a replaced file bumps uploaded_at)
+        if doc.processed and doc.processed_at and doc.uploaded_at and doc.processed_at >= doc.uploaded_at:
             logger.info(f"Document {task_id} already processed")
+            keeper.stop()
+            complete_job(job['id'], worker_id)
             return
-            
-        # Create a temporary file with the document content
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{doc.doc_type}") as temp_file:
-            try:
-                # Write content to temp file
-                logger.info(f"Creating temporary file for document {task_id}")
-                if doc.doc_metadata.get('content_type', '').startswith('text/'):
-                    temp_file.write(doc.content.encode('utf-8'))
-                else:
-                    temp_file.write(base64.b64decode(doc.content))
-                temp_file.flush()
-                
-                # Process the document
-                logger.info(f"Starting document processing for {task_id}")
-                process_document(temp_file.name, spa_id=doc.spa_id)
-                
-                # Update document status
-                doc.processed = True
-                doc.processed_at = datetime.utcnow()
-                doc.error_message = None
-                db.commit()
+
+        try:
+            # Stream pages from the blob into the splitter and embedder
+            logger.info(f"Starting document processing for {task_id}")
+            ingested_blob = doc.blob_hash
+            chunks = _iter_chunks(_document_source(doc), doc.doc_type, doc.name)
+            update_chunks(doc.id, chunks, progress_callback=keeper.progress, lease_check=keeper.check)
+
+            # Mark the document processed only if the file ingested is still its current one
+            current = Document.blob_hash == ingested_blob if ingested_blob else Document.blob_hash.is_(None)
+            result = db.execute(
+                update(Document)
+                .where(Document.id == doc.id, current)
+                .values(processed=True, processed_at=datetime.utcnow(), error_message=None)
+            )
+            db.commit()
+            superseded = result.rowcount == 0
+            invalidate_index(doc.spa_id)
+            invalidate_spa_context(doc.spa_id)
+            keeper.stop()
+            complete_job(job['id'], worker_id, keeper.chunks_done, keeper.chunks_total)
+            if superseded:
+                logger.info(f"Document {task_id} was replaced during processing; the newer job ingests it")
+            else:
                 logger.info(f"Successfully processed document {task_id}")
-                
-            except Exception as e:
-                error_msg = f"Error processing document {task_id}: {str(e)}"
-                logger.error(error_msg)
-                logger.error(f"Stack trace: {traceback.format_exc()}")
-                doc.processed = False
-                doc.error_message = error_msg
-                db.commit()
-            finally:
-                # Clean up temp file
-                try:
-                    os.unlink(temp_file.name)
-                    logger.info(f"Cleaned up temporary file for document {task_id}")
-                except Exception as e:
-                    logger.error(f"Error cleaning up temp file: {str(e)}")
-            
+
+        except LeaseLost as e:
+            logger.warning(str(e))
+
+        except Exception as e:
+            error_msg = f"Error processing document {task_id}: {str(e)}"
+            logger.error(error_msg)
+            logger.error(f"Stack trace: {traceback.format_exc()}")
+            keeper.stop()
+            doc.processed = False
+            doc.error_message = error_msg
+            db.commit()
+            state = fail_job(job['id'], worker_id, error_msg)
+            logger.info(f"Job {job['id']} is now {state}")
+
     except Exception as e:
         error_msg = f"Task error for document {task_id}: {str(e)}"
         logger.error(error_msg)
         logger.error(f"Stack trace: {traceback.format_exc()}")
+        keeper.stop()
         try:
+            fail_job(job['id'], worker_id, error_msg)
             if doc:
                 doc.error_message = error_msg
                 doc.processed = False
@@ -84,37 +221,76 @@ def process_task(task_id: int) -> None:
         except:
             pass
     finally:
+        keeper.stop()
         db.close()
+        try:
+            # A replacement left the old file for this job to release once it stopped reading it
+            if release_superseded(job['id'], worker_id) or superseded:
+                release_blob(ingested_blob)
+        except Exception as e:
+            logger.error(f"Error releasing job {job['id']}: {str(e)}")
 
 def worker() -> None:
-    """Background worker that processes tasks from the queue."""
-    logger.info("Background worker started")
+    """Background worker that leases jobs from the durable queue."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+    logger.info(f"Background worker {worker_id} started")
     while not _should_stop:
         try:
-            task_id = task_queue.get(timeout=1)  # 1 second timeout
-            if task_id is not None:
-                logger.info(f"Processing task {task_id}")
-                process_task(task_id)
-                logger.info(f"Completed task {task_id}")
-            task_queue.task_done()
-        except Empty:
-            # This is normal when queue is empty, just continue
+            job = claim_job(worker_id)
+        except Exception as e:
+            logger.error(f"Worker error claiming job: {str(e)}")
+            job = None
+        if job is None:
+            # Nothing runnable; sleep until the poll interval or a new upload
+            _wakeup.wait(JOB_POLL_INTERVAL)
+            _wakeup.clear()
             continue
+        try:
+            logger.info(f"Processing job {job['id']} (document {job['document_id']}, spa {job['spa_id']})")
+            process_task(job, worker_id)
+            logger.info(f"Completed job {job['id']}")
         except Exception as e:
             logger.error(f"Worker error: {str(e)}")
             logger.error(f"Stack trace: {traceback.format_exc()}")
-            continue
 
 def start_background_tasks() -> None:
-    """Start the background task processor."""
-    logger.info("Starting background task processor")
-    thread = threading.Thread(target=worker, daemon=True, name="DocumentProcessor")
-    thread.start()
-    logger.info(f"Background task processor started in thread {thread.name}")
-
-def stop_background_tasks() -> None:
-    """Stop the background task processor."""
-    global _should_stop
+    """Start the background task processor pool and resume unfinished jobs."""
+    global _should_stop, _parse_executor
+    if _workers:
+        return
+    logger.info(f"Starting background task processor ({INGEST_WORKERS} workers, {INGEST_PARSE_PROCESSES} parse processes)")
+    _should_stop = False
+    try:
+        recover_jobs()
+    except Exception as e:
+        logger.error(f"Error recovering ingestion jobs: {str(e)}")
+    if INGEST_PARSE_PROCESSES > 0:
+        _parse_executor = ProcessPoolExecutor(
+            max_workers=INGEST_PARSE_PROCESSES,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    for i in range(INGEST_WORKERS):
+        thread = threading.Thread(target=worker, daemon=True, name=f"DocumentProcessor-{i}")
+        thread.start()
+        _workers.append(thread)
+    logger.info(f"Background task processor started with {len(_workers)} threads")
+    start_slot_refresher()
+
+def stop_background_tasks(drain: bool = True, timeout: float = INGEST_DRAIN_TIMEOUT) -> None:
+    """
+    Stop the background task processor. Workers stop claiming new jobs and,
+    when draining, in-flight jobs get up to `timeout` seconds to finish.
+    Queued jobs stay in the database and resume on the next start.
+    """
+    global _should_stop, _parse_executor
     logger.info("Stopping background task processor")
     _should_stop = True
-    logger.info("Background task processor stopping") 
\ No newline at end of file
+    _wakeup.set()
+    for thread in _workers:
+        thread.join(timeout if drain else 0)
+    _workers.clear()
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait=drain, cancel_futures=True)
+        _parse_executor = None
+    stop_slot_refresher()
+    logger.info("Background task processor stopped")
@@ -74,9 +74,15 @@ def create_app(test_config=None):
     from api.routes import bp as api_bp
     app.register_blueprint(api_bp)
 
+    # Background workers run in serving processes only, once the tables exist
+    if not app.config.get('TESTING'):
+        from api import start_background_services
+        start_background_services()
+
     return app
 
 app = create_app()
 
 if __name__ == '__main__':
+    # The chat endpoints are served by the Quart app; use asgi.py for the full API
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
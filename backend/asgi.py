@@ -0,0 +1,22 @@
+"""
+ASGI entry point: the chat endpoints run on the async Quart app, everything
+else on the Flask app through a WSGI adapter.
+
+    hypercorn asgi:application --bind 0.0.0.0:5000
+"""
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as flask_app
+from api.chat_asgi import create_chat_app, CHAT_PATHS
+
+chat_app = create_chat_app()
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def application(scope, receive, send):
+    # Lifespan events go to Quart so its shared clients are closed on shutdown
+    if scope['type'] == 'lifespan' or scope.get('path', '').rstrip('/') in CHAT_PATHS:
+        await chat_app(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
@@ -1,6 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, JSON, DateTime, ForeignKey, Boolean, Text, Date
+from sqlalchemy import create_engine, Column, Integer, String, Float, JSON, DateTime, ForeignKey, Boolean, Text, Date, LargeBinary, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, deferred
+from sqlalchemy.types import TypeDecorator
+import numpy as np
+import json
 import os
 from datetime import datetime
 
@@ -9,7 +12,7 @@ os.makedirs('instance', exist_ok=True)
 
 # Create database engine
 SQLALCHEMY_DATABASE_URL = "sqlite:///instance/spa.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"timeout": 30})
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -17,6 +20,68 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Create base class for declarative models
 Base = declarative_base()
 
+# Storage format for embedding vectors: float32, float16 or int8 (quantised)
+EMBEDDING_STORAGE_DTYPE = os.getenv('EMBEDDING_STORAGE_DTYPE', 'float32')
+
+# One-byte format tag written in front of every encoded embedding
+_EMBEDDING_TAGS = {'float32': b'F', 'float16': b'H', 'int8': b'Q'}
+
+def encode_embedding(vector, dtype: str = None) -> bytes:
+    """Encode an embedding as a format tag followed by raw little-endian bytes."""
+    dtype = dtype or EMBEDDING_STORAGE_DTYPE
+    if dtype not in _EMBEDDING_TAGS:
+        raise ValueError(f"Unsupported embedding storage dtype: {dtype}")
+
+    values = np.asarray(vector, dtype=np.float32)
+    if dtype == 'float32':
+        return b'F' + values.astype('<f4').tobytes()
+    if dtype == 'float16':
+        return b'H' + values.astype('<f2').tobytes()
+
+    # int8: symmetric quantisation with a single float32 scale per vector
+    max_abs = float(np.max(np.abs(values))) if values.size else 0.0
+    scale = max_abs / 127.0 if max_abs > 0 else 1.0
+    quantised = np.clip(np.rint(values / scale), -127, 127).astype(np.int8)
+    return b'Q' + np.float32(scale).astype('<f4').tobytes() + quantised.tobytes()
+
+def decode_embedding(value) -> np.ndarray:
+    """Decode a stored embedding (binary or legacy JSON list) into a float32 array."""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return np.asarray(value, dtype=np.float32)
+    if isinstance(value, str) or value[:1] == b'[':
+        # Rows written before the binary format was introduced
+        return np.asarray(json.loads(value), dtype=np.float32)
+
+    value = bytes(value)
+    tag, payload = value[:1], value[1:]
+    if tag == b'F':
+        return np.frombuffer(payload, dtype='<f4').astype(np.float32)
+    if tag == b'H':
+        return np.frombuffer(payload, dtype='<f2').astype(np.float32)
+    if tag == b'Q':
+        scale = np.frombuffer(payload[:4], dtype='<f4')[0]
+        return np.frombuffer(payload[4:], dtype=np.int8).astype(np.float32) * scale
+    raise ValueError(f"Unknown embedding format tag: {tag!r}")
+
+class EmbeddingVector(TypeDecorator):
+    """Embedding column stored as a compact BLOB and exposed as a float32 NumPy array."""
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, dtype: str = None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dtype = dtype
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return encode_embedding(value, self.dtype)
+
+    def process_result_value(self, value, dialect):
+        return decode_embedding(value)
+
 class Location(Base):
     __tablename__ = "locations"
     
@@ -31,6 +96,8 @@ class Location(Base):
     email = Column(String)
     is_primary = Column(Boolean, default=False)
     business_hours = Column(JSON)
+    capacity = Column(Integer, default=1)  # Appointments that can run at once (rooms/therapists)
+    buffer_minutes = Column(Integer, default=0)  # Turnover time held after each appointment
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -97,7 +164,9 @@ class Document(Base):
     id = Column(Integer, primary_key=True, index=True)
     spa_id = Column(String, index=True)
     name = Column(String)
-    content = Column(Text)
+    content = deferred(Column(Text))  # Legacy inline content; new uploads live in the blob store
+    blob_hash = Column(String(64), index=True, nullable=True)  # SHA-256 of the raw file in instance/blobs
+    size = Column(Integer, nullable=True)
     doc_type = Column(String)  # pdf, txt, docx, etc.
     uploaded_at = Column(DateTime)
     processed = Column(Boolean, default=False)
@@ -107,6 +176,31 @@ class Document(Base):
     
     # Add relationship to DocumentChunk
     chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
+    # Job rows outlive their document: a superseded job's worker may still be reading the file
+    jobs = relationship("IngestionJob", back_populates="document", passive_deletes='all')
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), index=True)
+    spa_id = Column(String, index=True)
+    state = Column(String, default='queued', index=True)  # queued, running, superseded, done, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    next_run_at = Column(DateTime, default=datetime.utcnow)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    chunks_done = Column(Integer, default=0)
+    chunks_total = Column(Integer, nullable=True)
+    last_error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    document = relationship("Document", back_populates="jobs")
 
 class Embedding(Base):
     __tablename__ = "embeddings"
@@ -115,7 +209,7 @@ class Embedding(Base):
     document_id = Column(Integer, ForeignKey("documents.id"))
     chunk_index = Column(Integer)
     content = Column(Text)
-    embedding = Column(JSON)  # Store as JSON until we set up pgvector
+    embedding = Column(EmbeddingVector())  # Binary vector until we set up pgvector
     created_at = Column(DateTime)
     chunk_metadata = Column(JSON, nullable=True)  # Store chunk-specific metadata
 
@@ -138,6 +232,24 @@ class Appointment(Base):
     service = relationship("SpaService", back_populates="appointments")
     location = relationship("Location", back_populates="appointments")
 
+    # Availability reads one location's appointments over a date range
+    __table_args__ = (Index('ix_appointments_location_datetime', 'location_id', 'datetime'),)
+
+class SlotReservation(Base):
+    __tablename__ = "slot_reservations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    location_id = Column(Integer, ForeignKey("locations.id"), nullable=False)
+    slot_start = Column(DateTime, nullable=False)  # Start of a 5-minute cell
+    unit = Column(Integer, nullable=False, default=0)  # Which of the location's capacity units holds it
+    appointment_id = Column(Integer, ForeignKey("appointments.id"), nullable=True, index=True)
+    hold_token = Column(String, nullable=True, index=True)  # Set while the slot is only held
+    expires_at = Column(DateTime, nullable=True, index=True)  # Holds lapse after this; bookings never do
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # A unit of a location can only be claimed once per cell; concurrent claims fail on insert
+    __table_args__ = (UniqueConstraint('location_id', 'slot_start', 'unit', name='uq_slot_reservations_slot'),)
+
 class SubscriptionPlan(Base):
     __tablename__ = "subscription_plans"
     
@@ -149,6 +261,15 @@ class SubscriptionPlan(Base):
     created_at = Column(DateTime)
     updated_at = Column(DateTime)
 
+class CacheGeneration(Base):
+    __tablename__ = "cache_generations"
+    
+    # Counters bumped whenever cached data changes, so every worker process sees the change
+    scope = Column(String, primary_key=True)  # vector_index, spa_context, availability, upsell_stats, slot_cache
+    key = Column(String, primary_key=True)  # spa_id or location id
+    generation = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 def init_db():
     """Initialize the database and create tables"""
     Base.metadata.create_all(bind=engine)
@@ -165,11 +286,13 @@ class DocumentChunk(Base):
     __tablename__ = "document_chunks"
     
     id = Column(Integer, primary_key=True, index=True)
-    document_id = Column(Integer, ForeignKey("documents.id"))
+    document_id = Column(Integer, ForeignKey("documents.id"), index=True)
     chunk_index = Column(Integer)
     content = Column(Text)
-    embedding = Column(JSON)
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of the normalised content
+    embedding = Column(EmbeddingVector())
     chunk_metadata = Column(JSON)
+    staged = Column(Boolean, default=False)  # Written by a re-ingest still in progress; hidden from retrieval
     created_at = Column(DateTime, default=datetime.utcnow)
 
     document = relationship("Document", back_populates="chunks")
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import sys
+import time
+import types
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.chatbot import openai_api
+from api.services.upsell_service import UpsellService, get_brand_services, addon_options
+
+BOOKING_TURNS = [
+    ("I'd like to book a deep tissue massage for Saturday afternoon", []),
+    ("Can I get a facial next Tuesday at 3pm?", []),
+    ("Yes, please book that one for me", [
+        {'isUser': True, 'content': 'What massages do you offer?'},
+        {'isUser': False, 'content': 'We offer Swedish, deep tissue and hot stone massages.'}
+    ]),
+    ("Book me in for the hot stone massage tomorrow morning", []),
+    ("I want to schedule a hydrating facial for my birthday", []),
+]
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def simulated_client(latency_ms: float):
+    """Stand-in AsyncOpenAI client that answers every call after a fixed delay"""
+    async def create(**kwargs):
+        await asyncio.sleep(latency_ms / 1000)
+        if kwargs.get('response_format'):
+            content = '{"intent": "BOOKING", "service_type": "massage", "addons": []}'
+        elif kwargs.get('max_tokens') == 10:
+            content = 'massage'
+        else:
+            content = 'BOOKING'
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+    return lambda: client
+
+async def complete(context: str, extras: list, message: str):
+    """The main completion both variants finish with"""
+    messages = [
+        {"role": "system", "content": openai_api.SYSTEM_PROMPT_TEMPLATE.format(spa_context=context, relevant_context="\n".join(extras))},
+        {"role": "user", "content": message}
+    ]
+    await openai_api.get_async_client().chat.completions.create(
+        model="gpt-4-turbo-preview", messages=messages, temperature=0.7, max_tokens=500
+    )
+
+async def llm_intent(message: str) -> str:
+    """The intent call the previous pipeline made"""
+    response = await openai_api.get_async_client().chat.completions.create(
+        model="gpt-4",
+        messages=[{
+            "role": "system",
+            "content": "Classify the user's intent into one of these categories: BOOKING, INFORMATION, PRICING, AVAILABILITY, OTHER"
+        }, {
+            "role": "user",
+            "content": message
+        }],
+        temperature=0,
+        max_tokens=50
+    )
+    answer = response.choices[0].message.content.strip().upper()
+    return next((label for label in openai_api.INTENT_LABELS if label in answer), "OTHER")
+
+async def extract_service_type(message: str, history: list):
+    """The service type call the previous pipeline made"""
+    messages = [{
+        "role": "system",
+        "content": "Extract the spa service type from the conversation. Return only 'massage' or 'facial' if mentioned, otherwise return 'none'."
+    }]
+    for msg in history[-3:]:
+        messages.append({"role": "user" if msg.get('isUser') else "assistant", "content": msg.get('content', '')})
+    messages.append({"role": "user", "content": message})
+    completion = await openai_api.get_async_client().chat.completions.create(
+        model="gpt-4", messages=messages, temperature=0, max_tokens=10
+    )
+    service_type = completion.choices[0].message.content.strip().lower()
+    return service_type if service_type != "none" else None
+
+async def llm_upsell_order(service_type: str, options: list, history: list) -> list:
+    """The add-on ranking call the previous pipeline made"""
+    completion = await openai_api.get_async_client().chat.completions.create(
+        model="gpt-4",
+        messages=[{
+            "role": "system",
+            "content": "You are a spa upsell recommendation system."
+        }, {
+            "role": "user",
+            "content": f"Customer history: {history}\nAvailable add-ons: {options}\nService type: {service_type}\n\n"
+                       "Rank the most relevant add-on services, one name per line."
+        }],
+        temperature=0.7,
+        max_tokens=200
+    )
+    suggested = completion.choices[0].message.content.lower()
+    return sorted(options, key=lambda option: (option['name'] or '').lower() not in suggested)
+
+async def separate_calls(spa_id: str, context: str, message: str, history: list):
+    """Previous booking turn: intent, service type and upsell ranking as serial calls"""
+    await llm_intent(message)
+    extras = []
+    service_type = await extract_service_type(message, history)
+    if service_type:
+        options = addon_options(get_brand_services(spa_id), service_type)
+        if options:
+            options = await llm_upsell_order(
+                service_type, options, history or [{'isUser': True, 'content': message}]
+            )
+            extras.append(UpsellService.format_upsell_message(service_type, options[0]))
+    await complete(context, extras, message)
+
+async def structured_call(spa_id: str, context: str, message: str, history: list):
+    """Current booking turn: one structured plan call"""
+    services = get_brand_services(spa_id)
+    plan = await openai_api.plan_turn(message, history, services)
+    extras = []
+    if plan['service_type']:
+        options = addon_options(services, plan['service_type'], ranked=plan['addons'])
+        if options:
+            extras.append(UpsellService.format_upsell_message(plan['service_type'], options[0]))
+    await complete(context, extras, message)
+
+async def benchmark(spa_id: str, rounds: int):
+    """Compare booking-turn latency of the two pipelines"""
+    context = "Spa Name: Benchmark Spa"
+    results = {'separate calls': [], 'structured call': []}
+    for _ in range(rounds):
+        for message, history in BOOKING_TURNS:
+            for name, variant in (('separate calls', separate_calls), ('structured call', structured_call)):
+                start = time.perf_counter()
+                await variant(spa_id, context, message, history)
+                results[name].append((time.perf_counter() - start) * 1000)
+
+    for name, latencies in results.items():
+        print(f"{name:16} p50 {percentile(latencies, 50):7.0f} ms   p95 {percentile(latencies, 95):7.0f} ms   ({len(latencies)} turns)")
+    before = percentile(results['separate calls'], 50)
+    after = percentile(results['structured call'], 50)
+    if before:
+        print(f"Median booking turn is {(before - after) / before:.0%} faster")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python benchmark_booking_turn.py <spa_id> [rounds] [--simulate <latency_ms>]")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    if '--simulate' in args:
+        # Offline run: every LLM call takes the given latency
+        i = args.index('--simulate')
+        fake = simulated_client(float(args[i + 1]))
+        openai_api.get_async_client = fake
+        del args[i:i + 2]
+
+    asyncio.run(benchmark(args[0], int(args[1]) if len(args) > 1 else 3))
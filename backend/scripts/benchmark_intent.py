@@ -0,0 +1,89 @@
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.chatbot.intent_classifier import classify_intent, load_examples
+from api.rag.embeddings import generate_embeddings_batch
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def benchmark(rules_only: bool = False, use_llm: bool = False):
+    """Measure accuracy, LLM fallback rate and latency of the local intent classifier"""
+    test = load_examples()['test']
+
+    embeddings = [None] * len(test)
+    if not rules_only:
+        # Retrieval computes the query embedding anyway, so it is not counted as classifier latency
+        embeddings = generate_embeddings_batch([example['text'] for example in test])
+
+    if use_llm:
+        from api.chatbot.openai_api import plan_turn
+        loop = asyncio.new_event_loop()
+
+    local_correct = 0
+    fallbacks = 0
+    final_correct = 0
+    local_ms = []
+    llm_ms = []
+    methods = Counter()
+    errors = []
+
+    for example, embedding in zip(test, embeddings):
+        start = time.perf_counter()
+        label, confidence, method = classify_intent(example['text'], embedding)
+        local_ms.append((time.perf_counter() - start) * 1000)
+
+        if label is None:
+            fallbacks += 1
+            methods['llm'] += 1
+            if use_llm:
+                start = time.perf_counter()
+                # Same fallback the chat pipeline uses when the classifier is unsure
+                plan = loop.run_until_complete(plan_turn(example['text'], [], []))
+                label = plan['intent']
+                llm_ms.append((time.perf_counter() - start) * 1000)
+        else:
+            methods[method] += 1
+            if label == example['label']:
+                local_correct += 1
+
+        if label == example['label']:
+            final_correct += 1
+        elif label is not None:
+            errors.append((example['text'], example['label'], label))
+
+    total = len(test)
+    decided = total - fallbacks
+    print(f"Test examples:        {total}")
+    print(f"Decided locally:      {decided} ({decided / total:.1%})")
+    print(f"LLM fallbacks:        {fallbacks} ({fallbacks / total:.1%})")
+    print(f"Local accuracy:       {local_correct / decided:.1%}" if decided else "Local accuracy:       n/a")
+    if use_llm:
+        print(f"End-to-end accuracy:  {final_correct / total:.1%}")
+    print(f"Decisions by method:  {dict(methods)}")
+    print(f"Local latency p50/p95: {percentile(local_ms, 50):.3f} / {percentile(local_ms, 95):.3f} ms")
+    if llm_ms:
+        print(f"LLM latency p50/p95:   {percentile(llm_ms, 50):.0f} / {percentile(llm_ms, 95):.0f} ms")
+
+    if errors:
+        print("\nMisclassified:")
+        for text, expected, predicted in errors:
+            print(f"- {text!r}: expected {expected}, got {predicted}")
+
+if __name__ == "__main__":
+    args = set(sys.argv[1:])
+    if not args <= {'--rules-only', '--llm'}:
+        print("Usage: python benchmark_intent.py [--rules-only] [--llm]")
+        sys.exit(1)
+
+    benchmark(rules_only='--rules-only' in args, use_llm='--llm' in args)
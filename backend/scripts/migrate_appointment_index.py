@@ -0,0 +1,17 @@
+import os
+import sys
+from sqlalchemy import text
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database import engine
+
+if __name__ == "__main__":
+    with engine.connect() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_appointments_location_datetime ON appointments (location_id, datetime)"
+        ))
+        conn.execute(text("ANALYZE appointments"))
+        conn.commit()
+        print("appointments: ix_appointments_location_datetime ready")
@@ -0,0 +1,53 @@
+import os
+import sys
+from sqlalchemy import text
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database import engine
+from api.rag.embedding_cache import text_hash
+
+BATCH_SIZE = 500
+
+def add_columns(conn):
+    """Add the content hash and staged columns and document index to document_chunks if missing"""
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(document_chunks)"))}
+    if 'content_hash' not in columns:
+        conn.execute(text("ALTER TABLE document_chunks ADD COLUMN content_hash VARCHAR(64)"))
+    if 'staged' not in columns:
+        conn.execute(text("ALTER TABLE document_chunks ADD COLUMN staged BOOLEAN DEFAULT 0"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_document_chunks_document_id ON document_chunks (document_id)"))
+    conn.commit()
+
+def backfill_hashes(conn) -> int:
+    """Hash the content of every chunk stored before hashes were recorded"""
+    updated = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text("SELECT id, content FROM document_chunks "
+                 "WHERE id > :last_id AND content_hash IS NULL "
+                 "ORDER BY id LIMIT :limit"),
+            {'last_id': last_id, 'limit': BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+
+        for chunk_id, content in rows:
+            conn.execute(
+                text("UPDATE document_chunks SET content_hash = :content_hash WHERE id = :id"),
+                {'content_hash': text_hash(content or ''), 'id': chunk_id}
+            )
+        conn.commit()
+
+        updated += len(rows)
+        last_id = rows[-1][0]
+        print(f"document_chunks: hashed {updated} rows")
+    return updated
+
+if __name__ == "__main__":
+    with engine.connect() as conn:
+        add_columns(conn)
+        count = backfill_hashes(conn)
+        print(f"document_chunks: {count} rows backfilled")
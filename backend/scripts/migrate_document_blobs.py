@@ -0,0 +1,64 @@
+import os
+import sys
+import base64
+from sqlalchemy import text
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database import engine
+from api.rag.blob_store import blob_store
+
+BATCH_SIZE = 50
+
+def add_columns(conn):
+    """Add the blob reference columns to the documents table if missing"""
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(documents)"))}
+    if 'blob_hash' not in columns:
+        conn.execute(text("ALTER TABLE documents ADD COLUMN blob_hash VARCHAR(64)"))
+    if 'size' not in columns:
+        conn.execute(text("ALTER TABLE documents ADD COLUMN size INTEGER"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_blob_hash ON documents (blob_hash)"))
+    conn.commit()
+
+def migrate_documents(conn) -> int:
+    """Move inline document content into the blob store"""
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text("SELECT id, content, json_extract(doc_metadata, '$.content_type') FROM documents "
+                 "WHERE id > :last_id AND blob_hash IS NULL AND content IS NOT NULL "
+                 "ORDER BY id LIMIT :limit"),
+            {'last_id': last_id, 'limit': BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+
+        for doc_id, content, content_type in rows:
+            if (content_type or '').startswith('text/'):
+                data = content.encode('utf-8')
+            else:
+                data = base64.b64decode(content)
+            blob_hash, size = blob_store.put_bytes(data)
+            conn.execute(
+                text("UPDATE documents SET blob_hash = :blob_hash, size = :size, content = NULL WHERE id = :id"),
+                {'blob_hash': blob_hash, 'size': size, 'id': doc_id}
+            )
+        conn.commit()
+
+        migrated += len(rows)
+        last_id = rows[-1][0]
+        print(f"documents: moved {migrated} files to {blob_store.root}")
+    return migrated
+
+if __name__ == "__main__":
+    with engine.connect() as conn:
+        add_columns(conn)
+        count = migrate_documents(conn)
+        print(f"documents: {count} rows migrated")
+
+    # Reclaim the space freed by the inline content
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    print("Database vacuumed")
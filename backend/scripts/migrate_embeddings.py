@@ -0,0 +1,57 @@
+import os
+import sys
+from sqlalchemy import text
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database import engine, encode_embedding, decode_embedding, EMBEDDING_STORAGE_DTYPE
+
+TABLES = ['document_chunks', 'embeddings']
+BATCH_SIZE = 500
+
+def migrate_table(conn, table: str, dtype: str) -> int:
+    """Re-encode every JSON embedding in a table as a binary BLOB"""
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text(f"SELECT id, embedding FROM {table} "
+                 f"WHERE id > :last_id AND typeof(embedding) = 'text' "
+                 f"ORDER BY id LIMIT :limit"),
+            {'last_id': last_id, 'limit': BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+
+        for row_id, value in rows:
+            conn.execute(
+                text(f"UPDATE {table} SET embedding = :embedding WHERE id = :id"),
+                {'embedding': encode_embedding(decode_embedding(value), dtype), 'id': row_id}
+            )
+        conn.commit()
+
+        migrated += len(rows)
+        last_id = rows[-1][0]
+        print(f"{table}: migrated {migrated} rows")
+    return migrated
+
+def migrate_embeddings(dtype: str):
+    """Convert all stored embeddings from JSON lists to binary vectors"""
+    with engine.connect() as conn:
+        for table in TABLES:
+            count = migrate_table(conn, table, dtype)
+            print(f"{table}: {count} rows converted to {dtype}")
+
+    # Reclaim the space freed by the JSON text
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    print("Database vacuumed")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print("Usage: python migrate_embeddings.py [float32|float16|int8]")
+        sys.exit(1)
+
+    dtype = sys.argv[1] if len(sys.argv) == 2 else EMBEDDING_STORAGE_DTYPE
+    migrate_embeddings(dtype)
@@ -0,0 +1,25 @@
+import os
+import sys
+from sqlalchemy import text
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database import engine
+
+def add_columns(conn):
+    """Add the capacity and buffer columns to locations if missing"""
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(locations)"))}
+    if 'capacity' not in columns:
+        conn.execute(text("ALTER TABLE locations ADD COLUMN capacity INTEGER DEFAULT 1"))
+    if 'buffer_minutes' not in columns:
+        conn.execute(text("ALTER TABLE locations ADD COLUMN buffer_minutes INTEGER DEFAULT 0"))
+    conn.execute(text("UPDATE locations SET capacity = 1 WHERE capacity IS NULL"))
+    conn.execute(text("UPDATE locations SET buffer_minutes = 0 WHERE buffer_minutes IS NULL"))
+    conn.commit()
+
+if __name__ == "__main__":
+    with engine.connect() as conn:
+        add_columns(conn)
+        count = conn.execute(text("SELECT COUNT(*) FROM locations")).scalar()
+        print(f"locations: capacity and buffer_minutes ready on {count} rows")
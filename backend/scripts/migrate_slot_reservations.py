@@ -0,0 +1,57 @@
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime
+from itertools import count
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database import engine, SessionLocal, SlotReservation, Appointment, Location, SpaService
+from api.scheduling.reservations import reservation_cells
+
+def backfill(db):
+    """Reserve the cells of upcoming confirmed appointments that have none yet"""
+    reserved = {row[0] for row in db.query(SlotReservation.appointment_id).filter(SlotReservation.appointment_id.isnot(None))}
+    rows = db.query(Appointment, SpaService.duration).outerjoin(
+        SpaService, Appointment.service_id == SpaService.id
+    ).filter(
+        Appointment.location_id.isnot(None),
+        Appointment.datetime >= datetime.utcnow(),
+        Appointment.status != 'cancelled'
+    ).order_by(Appointment.datetime).all()
+    
+    locations = {location.id: location for location in db.query(Location).all()}
+    taken = defaultdict(set)
+    for location_id, slot_start, unit in db.query(SlotReservation.location_id, SlotReservation.slot_start, SlotReservation.unit):
+        taken[(location_id, slot_start)].add(unit)
+    
+    added = overbooked = 0
+    for appointment, duration in rows:
+        location = locations.get(appointment.location_id)
+        if not location or appointment.id in reserved:
+            continue
+        for cell in reservation_cells(appointment.datetime, duration, location.buffer_minutes or 0):
+            # Existing double bookings are kept, on units past the location's capacity
+            unit = next(u for u in count() if u not in taken[(location.id, cell)])
+            taken[(location.id, cell)].add(unit)
+            if unit >= (location.capacity or 1):
+                overbooked += 1
+            db.add(SlotReservation(location_id=location.id, slot_start=cell, unit=unit,
+                                   appointment_id=appointment.id, created_at=datetime.utcnow()))
+        added += 1
+    db.commit()
+    return added, overbooked
+
+if __name__ == "__main__":
+    SlotReservation.__table__.create(bind=engine, checkfirst=True)
+    print("slot_reservations: table ready")
+    
+    db = SessionLocal()
+    try:
+        added, overbooked = backfill(db)
+        print(f"Reserved slots for {added} upcoming appointments")
+        if overbooked:
+            print(f"Warning: {overbooked} cells are already booked beyond their location's capacity")
+    finally:
+        db.close()
@@ -0,0 +1,37 @@
+"""
+Test setup. models.database opens sqlite:///instance/spa.db relative to the
+working directory, so the tests run from a temporary directory with an
+empty instance/ and every test starts from freshly created tables.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_workdir = tempfile.mkdtemp(prefix='wellnessflow-tests-')
+os.makedirs(os.path.join(_workdir, 'instance'))
+os.chdir(_workdir)
+
+os.environ.setdefault('OPENAI_API_KEY', 'sk-test')
+os.environ.setdefault('INGEST_WORKERS', '0')
+os.environ.setdefault('INGEST_PARSE_PROCESSES', '0')
+os.environ.setdefault('SLOT_PREWARM_DAYS', '0')
+
+
+@pytest.fixture
+def db():
+    """A session on empty tables."""
+    from models.database import Base, SessionLocal, engine
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,134 @@
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from api.scheduling.availability import available_starts, blocked_intervals
+from api.scheduling.bitmap_cache import CELL_MINUTES, DayBitmap
+
+DAY = date(2030, 1, 7)  # a Monday
+DAY_START = datetime.combine(DAY, datetime.min.time())
+
+
+def _at(minute):
+    return DAY_START + timedelta(minutes=minute)
+
+
+def _loads(bookings, buffer_minutes):
+    """Bookings holding a unit in each minute of the day."""
+    loads = [0] * (24 * 60 + 300)
+    for start, end in bookings:
+        first = int((start - DAY_START).total_seconds() // 60)
+        last = int((end - DAY_START).total_seconds() // 60) + buffer_minutes
+        for minute in range(first, last):
+            loads[minute] += 1
+    return loads
+
+
+def _brute_starts(open_minute, close_minute, bookings, duration, capacity, buffer_minutes, granularity):
+    loads = _loads(bookings, buffer_minutes)
+    return [
+        _at(minute) for minute in range(open_minute, close_minute, granularity)
+        if minute + duration <= close_minute
+        and all(load < capacity for load in loads[minute:minute + duration + buffer_minutes])
+    ]
+
+
+def _random_case(rng, step=1):
+    open_minute = rng.randrange(6 * 60, 11 * 60, CELL_MINUTES)
+    close_minute = rng.randrange(open_minute + 60, 22 * 60, CELL_MINUTES)
+    bookings = []
+    for _ in range(rng.randrange(0, 12)):
+        start = rng.randrange(open_minute - 120, close_minute + 30, step)
+        bookings.append((_at(start), _at(start + rng.randrange(step, 121, step))))
+    return {
+        'open_minute': open_minute,
+        'close_minute': close_minute,
+        'bookings': bookings,
+        'capacity': rng.randrange(1, 4),
+        'buffer_minutes': rng.choice([0, 5, 10, 15]),
+    }
+
+
+def _hours(case):
+    def hhmm(minute):
+        return f"{minute // 60:02d}:{minute % 60:02d}"
+    return {'monday': {'open': hhmm(case['open_minute']), 'close': hhmm(case['close_minute'])}}
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_blocked_intervals_match_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(1000):
+        case = _random_case(rng)
+        blocked = blocked_intervals(case['bookings'], case['capacity'], case['buffer_minutes'])
+
+        # Sorted, non-empty and merged
+        assert all(start < end for start, end in blocked)
+        assert all(a[1] < b[0] for a, b in zip(blocked, blocked[1:]))
+
+        loads = _loads(case['bookings'], case['buffer_minutes'])
+        expected = {minute for minute, load in enumerate(loads) if load >= case['capacity']}
+        covered = set()
+        for start, end in blocked:
+            covered.update(range(int((start - DAY_START).total_seconds() // 60),
+                                 int((end - DAY_START).total_seconds() // 60)))
+        assert covered == expected
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_available_starts_match_brute_force(seed):
+    rng = random.Random(100 + seed)
+    for _ in range(1000):
+        case = _random_case(rng)
+        duration = rng.randrange(10, 121)
+        granularity = rng.choice([5, 10, 15, 30, 60])
+        starts = available_starts(
+            _hours(case), case['bookings'], DAY, DAY, duration,
+            case['capacity'], case['buffer_minutes'], granularity
+        )
+        assert starts[DAY] == _brute_starts(
+            case['open_minute'], case['close_minute'], case['bookings'], duration,
+            case['capacity'], case['buffer_minutes'], granularity
+        )
+
+
+def test_available_starts_closed_day_has_no_entry():
+    hours = {'monday': {'open': '09:00', 'close': '17:00'}, 'tuesday': {'closed': True}}
+    starts = available_starts(hours, [], DAY, DAY + timedelta(days=1), 60)
+    assert list(starts) == [DAY]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_day_bitmap_starts_match_intervals(seed):
+    # With everything on the 5-minute grid the bitmap is exact
+    rng = random.Random(200 + seed)
+    for _ in range(1000):
+        case = _random_case(rng, step=CELL_MINUTES)
+        duration = rng.randrange(CELL_MINUTES, 121, CELL_MINUTES)
+        granularity = rng.choice([5, 10, 15, 30, 60])
+        settings = (case['capacity'], case['buffer_minutes'], '')
+        bitmap = DayBitmap(DAY, settings, (_at(case['open_minute']), _at(case['close_minute'])))
+        for start, end in case['bookings']:
+            bitmap.apply(start, end, 1)
+
+        expected = available_starts(
+            _hours(case), case['bookings'], DAY, DAY, duration,
+            case['capacity'], case['buffer_minutes'], granularity
+        )
+        assert bitmap.starts(duration, granularity) == expected[DAY]
+
+
+def test_day_bitmap_cancel_restores_free_cells():
+    bitmap = DayBitmap(DAY, (1, 10, ''), (_at(9 * 60), _at(13 * 60)))
+    before = bitmap.starts(60, 30)
+    bitmap.apply(_at(10 * 60), _at(11 * 60), 1)
+    # The booking and its buffer hold 10:00-11:10
+    assert bitmap.starts(60, 30) == [_at(11 * 60 + 30), _at(12 * 60)]
+    bitmap.apply(_at(10 * 60), _at(11 * 60), -1)
+    assert bitmap.starts(60, 30) == before
+
+
+def test_day_bitmap_closed_day():
+    bitmap = DayBitmap(DAY, (1, 0, ''), None)
+    assert bitmap.starts(30, 30) == []
@@ -0,0 +1,59 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models.database import Appointment, Location, SpaService
+from api.scheduling.bitmap_cache import AvailabilityCache
+
+DAY = date(2030, 1, 7)
+HOURS = {'monday': {'open': '09:00', 'close': '12:00'}}
+
+
+def _at(hour, minute=0):
+    return datetime.combine(DAY, datetime.min.time()).replace(hour=hour, minute=minute)
+
+
+@pytest.fixture
+def location(db):
+    location = Location(spa_id='spa', name='Main', capacity=1, buffer_minutes=10, business_hours=HOURS)
+    db.add(location)
+    db.commit()
+    return location
+
+
+def _appointment(db, location, start, duration=50):
+    service = SpaService(name='Massage', duration=duration)
+    db.add(service)
+    db.flush()
+    appointment = Appointment(spa_id='spa', service_id=service.id, location_id=location.id,
+                              datetime=start, status='confirmed')
+    db.add(appointment)
+    db.flush()
+    return appointment
+
+
+def test_availability_sees_changes_from_other_processes(db, location):
+    cache, other = AvailabilityCache(), AvailabilityCache()
+    cache.available_starts(location, DAY, DAY, 50, 30)
+
+    appointment = _appointment(db, location, _at(10))
+    version = other.begin_change(db, location.id)
+    db.commit()
+    other.record_appointment(appointment, 1, version)
+
+    assert cache.available_starts(location, DAY, DAY, 50, 30)[DAY] == [_at(9), _at(11)]
+    assert cache.stats['misses'] == 2
+
+
+def test_availability_records_own_bookings_in_place(db, location):
+    cache = AvailabilityCache()
+    cache.available_starts(location, DAY, DAY + timedelta(days=7), 50, 30)
+
+    appointment = _appointment(db, location, _at(10))
+    version = cache.begin_change(db, location.id)
+    db.commit()
+    cache.record_appointment(appointment, 1, version)
+
+    misses = cache.stats['misses']
+    assert cache.available_starts(location, DAY, DAY + timedelta(days=7), 50, 30)[DAY] == [_at(9), _at(11)]
+    assert cache.stats['misses'] == misses
@@ -0,0 +1,75 @@
+import hashlib
+import io
+import os
+from datetime import datetime
+
+import pytest
+
+from models.database import Document
+from api import tasks
+from api.rag.blob_store import BlobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / 'blobs'))
+
+
+def test_put_is_content_addressed(store):
+    blob_hash, size = store.put_bytes(b'spa menu')
+    assert blob_hash == hashlib.sha256(b'spa menu').hexdigest() and size == 8
+    assert store.path(blob_hash).endswith(os.path.join(blob_hash[:2], blob_hash[2:4], blob_hash))
+    with store.open(blob_hash) as handle:
+        assert handle.read() == b'spa menu'
+
+    # The same bytes are stored once
+    assert store.put_stream(io.BytesIO(b'spa menu')) == (blob_hash, size)
+    assert os.listdir(os.path.join(store.root, 'tmp')) == []
+
+
+def test_large_streams_are_copied_in_blocks(store, monkeypatch):
+    monkeypatch.setattr('api.rag.blob_store.BLOB_READ_SIZE', 7)
+    data = bytes(range(256)) * 10
+    blob_hash, size = store.put_stream(io.BytesIO(data))
+    assert size == len(data)
+    with store.open(blob_hash) as handle:
+        assert handle.read() == data
+
+
+def test_failed_write_leaves_nothing_behind(store):
+    class Broken(io.BytesIO):
+        def read(self, size=-1):
+            raise IOError('client went away')
+
+    with pytest.raises(IOError):
+        store.put_stream(Broken())
+    assert os.listdir(os.path.join(store.root, 'tmp')) == []
+
+
+def test_delete_unreferenced(store):
+    blob_hash, _ = store.put_bytes(b'x')
+    assert not store.delete_unreferenced(blob_hash, lambda: True)
+    assert store.exists(blob_hash)
+    assert store.delete_unreferenced(blob_hash, lambda: False)
+    assert not store.exists(blob_hash)
+    store.delete(blob_hash)
+
+
+def test_release_blob_keeps_files_other_documents_share(db, store, monkeypatch):
+    monkeypatch.setattr(tasks, 'blob_store', store)
+    blob_hash, size = store.put_bytes(b'shared')
+    for name in ('a.txt', 'b.txt'):
+        db.add(Document(spa_id='spa', name=name, doc_type='txt', blob_hash=blob_hash, size=size,
+                        uploaded_at=datetime.utcnow()))
+    db.commit()
+
+    first = db.query(Document).filter_by(name='a.txt').one()
+    db.delete(first)
+    db.commit()
+    tasks.release_blob(blob_hash)
+    assert store.exists(blob_hash)
+
+    db.query(Document).delete()
+    db.commit()
+    tasks.release_blob(blob_hash)
+    assert not store.exists(blob_hash)
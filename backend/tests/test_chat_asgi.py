@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from api import chat_asgi
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    async def generate_response(**kwargs):
+        calls.append(('generate', kwargs))
+        return {'response': 'Hi!', 'intent': 'OTHER'}
+
+    async def astream_response(**kwargs):
+        calls.append(('stream', kwargs))
+        yield 'token', {'token': 'Hi!'}
+        yield 'done', {'intent': 'OTHER'}
+
+    monkeypatch.setattr(chat_asgi, 'get_spa_context', lambda spa_id: f'context for {spa_id}')
+    monkeypatch.setattr(chat_asgi, 'generate_response', generate_response)
+    monkeypatch.setattr(chat_asgi, 'astream_response', astream_response)
+    return calls
+
+
+def _post(path, body):
+    async def post():
+        client = chat_asgi.create_chat_app().test_client()
+        response = await client.post(path, json=body)
+        return response.status_code, await response.get_data(as_text=True)
+    return asyncio.run(post())
+
+
+def test_public_chat_and_stream_pass_the_same_context(calls):
+    body = {'message': 'hello', 'spa_id': 'spa'}
+    assert _post('/api/public/chat', body)[0] == 200
+    status, text = _post('/api/public/chat/stream', body)
+    assert status == 200
+    assert 'event: token\ndata: {"token": "Hi!"}' in text and 'event: done' in text
+
+    (_, plain), (_, streamed) = calls
+    assert plain['context'] == streamed['context'] == 'context for spa'
+    assert plain['message'] == streamed['message'] == 'hello'
+
+
+def test_public_stream_requires_a_message(calls):
+    assert _post('/api/public/chat/stream', {'spa_id': 'spa'})[0] == 400
+    assert calls == []
@@ -0,0 +1,57 @@
+from api.chatbot import context_cache
+from api.chatbot.context_cache import SpaContextCache
+from api.generations import bump_generation
+
+
+class Builder:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return f'context v{self.calls}'
+
+
+def test_blocks_are_cached_per_spa_and_kind(db):
+    cache, build = SpaContextCache(), Builder()
+    assert cache.get_or_build('spa', 'services', build) == 'context v1'
+    assert cache.get_or_build('spa', 'services', build) == 'context v1'
+    cache.get_or_build('spa', 'brand', build)
+    cache.get_or_build('other', 'services', build)
+    assert build.calls == 3
+
+
+def test_bump_invalidates_every_process(db):
+    cache, other, build = SpaContextCache(), SpaContextCache(), Builder()
+    cache.get_or_build('spa', 'services', build)
+    other.get_or_build('spa', 'services', build)
+
+    other.bump('spa')
+    assert cache.get_or_build('spa', 'services', build) == 'context v3'
+
+
+def test_entries_expire_after_ttl(db):
+    cache, build = SpaContextCache(ttl=0), Builder()
+    cache.get_or_build('spa', 'services', build)
+    cache.get_or_build('spa', 'services', build)
+    assert build.calls == 2
+
+
+def test_block_built_during_a_bump_is_not_stored(db):
+    cache = SpaContextCache()
+
+    def racing_build():
+        bump_generation(context_cache.GENERATION_SCOPE, 'spa')
+        return 'old context'
+
+    assert cache.get_or_build('spa', 'services', racing_build) == 'old context'
+    assert cache.get_or_build('spa', 'services', lambda: 'new context') == 'new context'
+
+
+def test_unreadable_version_is_never_cached(db, monkeypatch):
+    cache, build = SpaContextCache(), Builder()
+    cache.get_or_build('spa', 'services', build)
+    monkeypatch.setattr(context_cache, 'safe_get_generation', lambda scope, key: None)
+    cache.get_or_build('spa', 'services', build)
+    cache.get_or_build('spa', 'services', build)
+    assert build.calls == 3
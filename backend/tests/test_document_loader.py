@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pytest
+
+from models.database import Document, DocumentChunk
+from api.rag import document_loader
+from api.rag.document_loader import update_chunks
+from api.rag.vector_index import SpaVectorIndex
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """Replaces the embeddings API; records every text sent to it."""
+    sent = []
+
+    def generate(texts):
+        sent.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    monkeypatch.setattr(document_loader, 'generate_embeddings_batch', generate)
+    return sent
+
+
+@pytest.fixture
+def document(db):
+    document = Document(spa_id='spa', name='menu.txt', doc_type='txt', uploaded_at=datetime.utcnow(),
+                        processed=True)
+    db.add(document)
+    db.commit()
+    return document.id
+
+
+def _chunks(*contents):
+    return [{'content': content, 'metadata': {'source': 'menu.txt'}} for content in contents]
+
+
+def _contents(db, document_id):
+    db.expire_all()
+    return [content for (content,) in db.query(DocumentChunk.content)
+            .filter_by(document_id=document_id).order_by(DocumentChunk.chunk_index)]
+
+
+def test_reingest_only_embeds_changed_chunks(db, document, embedded):
+    update_chunks(document, _chunks('facial', 'massage', 'sauna'))
+    embedded.clear()
+
+    update_chunks(document, _chunks('massage', 'hot stone', 'facial'))
+    assert embedded == ['hot stone']
+    assert _contents(db, document) == ['massage', 'hot stone', 'facial']
+    assert db.query(DocumentChunk).filter_by(staged=True).count() == 0
+
+
+def test_new_chunks_stay_hidden_until_the_swap(db, document, embedded):
+    update_chunks(document, _chunks('facial', 'massage'))
+    seen = []
+
+    def chunks():
+        yield from _chunks('pedicure', 'wrap')
+        # The first batch is committed by now but retrieval still sees the old version
+        seen.append(sorted(SpaVectorIndex.build('spa').contents))
+        yield from _chunks('facial')
+
+    update_chunks(document, chunks(), batch_size=2)
+    assert seen == [['facial', 'massage']]
+    assert _contents(db, document) == ['pedicure', 'wrap', 'facial']
+
+
+def test_lost_lease_keeps_the_old_version(db, document, embedded):
+    update_chunks(document, _chunks('facial', 'massage'))
+    checks = []
+
+    def lease_check():
+        checks.append(1)
+        if len(checks) > 1:
+            raise RuntimeError('lease lost')
+
+    with pytest.raises(RuntimeError):
+        update_chunks(document, _chunks('pedicure', 'facial'), batch_size=1, lease_check=lease_check)
+    # The staged batch was committed, the swap was not
+    assert len(checks) == 2
+    assert sorted(_contents(db, document)) == ['facial', 'massage', 'pedicure']
+    assert sorted(SpaVectorIndex.build('spa').contents) == ['facial', 'massage']
+
+    # The next attempt clears the leftover staged rows
+    update_chunks(document, _chunks('pedicure', 'facial'))
+    assert _contents(db, document) == ['pedicure', 'facial']
+
+
+def test_document_deleted_mid_reingest_leaves_no_chunks(db, document, embedded):
+    update_chunks(document, _chunks('facial', 'massage'))
+
+    def chunks():
+        yield from _chunks('pedicure')
+        # What delete_document does
+        db.query(DocumentChunk).filter_by(document_id=document).delete()
+        db.query(Document).filter_by(id=document).delete()
+        db.commit()
+        yield from _chunks('wrap')
+
+    with pytest.raises(LookupError):
+        update_chunks(document, chunks(), batch_size=1)
+    assert db.query(DocumentChunk).count() == 0
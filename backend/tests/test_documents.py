@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from models.database import Document, IngestionJob
+from api import tasks
+from api.job_queue import claim_job, document_busy, enqueue_job, release_superseded
+from api.rag.blob_store import BlobStore
+
+
+@pytest.fixture
+def app(db):
+    from app import create_app
+    return create_app({'TESTING': True})
+
+
+@pytest.fixture
+def headers(app):
+    with app.app_context():
+        token = create_access_token(identity='admin@spa.test', additional_claims={'spa_id': 'spa'})
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    monkeypatch.setattr(tasks, 'blob_store', store)
+    return store
+
+
+def test_delete_while_job_runs_keeps_blob_until_worker_lets_go(app, headers, db, store):
+    blob_hash, size = store.put_bytes(b'spa menu')
+    document = Document(spa_id='spa', name='menu.txt', doc_type='txt', blob_hash=blob_hash,
+                        size=size, uploaded_at=datetime.utcnow())
+    db.add(document)
+    db.commit()
+    document_id = document.id
+    job_id = enqueue_job(document_id, 'spa')
+    claim_job('worker-1')
+
+    response = app.test_client().delete(f'/api/documents/{document_id}', headers=headers)
+    assert response.status_code == 200
+
+    # The job row survives the delete, so the worker still holds the document
+    db.expire_all()
+    assert db.query(IngestionJob).filter_by(id=job_id).one().state == 'superseded'
+    assert document_busy(document_id)
+    assert store.exists(blob_hash)
+
+    # What process_task does once the worker notices and stops
+    assert release_superseded(job_id, 'worker-1')
+    tasks.release_blob(blob_hash)
+    assert not store.exists(blob_hash)
+
+
+def test_delete_without_running_job_removes_blob(app, headers, db, store):
+    blob_hash, size = store.put_bytes(b'spa menu')
+    document = Document(spa_id='spa', name='menu.txt', doc_type='txt', blob_hash=blob_hash,
+                        size=size, uploaded_at=datetime.utcnow())
+    db.add(document)
+    db.commit()
+
+    response = app.test_client().delete(f'/api/documents/{document.id}', headers=headers)
+    assert response.status_code == 200
+    assert not store.exists(blob_hash)
+
+
+def test_worker_of_a_deleted_document_does_not_requeue_it(app, headers, db, store):
+    document = Document(spa_id='spa', name='menu.txt', doc_type='txt', uploaded_at=datetime.utcnow())
+    db.add(document)
+    db.commit()
+    document_id = document.id
+    enqueue_job(document_id, 'spa')
+    job = claim_job('worker-1')
+
+    app.test_client().delete(f'/api/documents/{document_id}', headers=headers)
+    # The worker starts after the delete and finds no document
+    tasks.process_task(job, 'worker-1')
+
+    db.expire_all()
+    row = db.query(IngestionJob).filter_by(id=job['id']).one()
+    assert row.state == 'superseded' and row.lease_owner is None
+    assert not document_busy(document_id)
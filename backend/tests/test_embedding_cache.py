@@ -0,0 +1,60 @@
+import pytest
+
+from api.rag import embeddings
+from api.rag.embedding_cache import EmbeddingCache, text_hash
+from api.rag.embeddings import generate_embeddings_batch
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(str(tmp_path / 'cache.db'), memory_items=2)
+
+
+def test_normalised_text_shares_an_entry():
+    assert text_hash('Hot  stone\nmassage ') == text_hash('Hot stone massage')
+    assert text_hash('Hot stone massage') != text_hash('hot stone massage')
+
+
+def test_entries_are_keyed_by_model(cache):
+    cache.put('model-a', 'facial', [1.0, 2.0])
+    assert cache.get('model-a', 'facial') == [1.0, 2.0]
+    assert cache.get('model-b', 'facial') is None
+
+
+def test_memory_is_bounded_and_disk_is_shared(cache, tmp_path):
+    cache.put_many('model', ['a', 'b', 'c'], [[1.0], [2.0], [3.0]])
+    assert cache.stats()['memory_items'] == 2
+
+    # 'a' fell out of memory but is still on disk, as it is for other processes
+    assert cache.get_many('model', ['a', 'c']) == {0: [1.0], 1: [3.0]}
+    stats = cache.stats()
+    assert stats['disk_hits'] == 1 and stats['memory_hits'] == 1
+
+    other = EmbeddingCache(str(tmp_path / 'cache.db'))
+    assert other.get('model', 'b') == [2.0]
+
+
+def test_get_many_reports_misses_and_tokens_saved(cache):
+    cache.put('model', 'a', [1.0])
+    assert cache.get_many('model', ['a', 'b', 'a'], [5, 7, 5]) == {0: [1.0], 2: [1.0]}
+    stats = cache.stats()
+    assert stats['misses'] == 1 and stats['tokens_saved'] == 10
+    assert stats['hit_rate'] == pytest.approx(2 / 3, abs=1e-4)
+
+
+def test_batch_only_sends_uncached_texts(cache, monkeypatch):
+    sent = []
+
+    class Client:
+        def embed_documents(self, texts):
+            sent.append(list(texts))
+            return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(embeddings, 'embedding_cache', cache)
+    monkeypatch.setattr(embeddings, '_get_embeddings_client', lambda api_key, batch_size=None: Client())
+
+    assert generate_embeddings_batch(['aa', 'bbb'], api_key='sk-test') == [[2.0], [3.0]]
+    assert generate_embeddings_batch(['bbb', 'c'], api_key='sk-test') == [[3.0], [1.0]]
+    assert sent == [['aa', 'bbb'], ['c']]
+    assert generate_embeddings_batch(['aa'], api_key='sk-test') == [[2.0]]
+    assert len(sent) == 2
@@ -0,0 +1,57 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from models.database import Document, DocumentChunk, decode_embedding, encode_embedding
+
+
+@pytest.fixture
+def vector():
+    return np.random.default_rng(0).normal(size=1536).astype(np.float32)
+
+
+def test_float32_round_trip_is_exact(vector):
+    encoded = encode_embedding(vector, 'float32')
+    assert encoded[:1] == b'F' and len(encoded) == 1 + 4 * 1536
+    assert np.array_equal(decode_embedding(encoded), vector)
+
+
+@pytest.mark.parametrize('dtype, size, tolerance', [('float16', 2, 1e-3), ('int8', 1, 2e-2)])
+def test_compact_formats_keep_cosine_similarity(vector, dtype, size, tolerance):
+    encoded = encode_embedding(vector, dtype)
+    assert len(encoded) <= 1 + 4 + size * 1536
+    decoded = decode_embedding(encoded)
+    cosine = np.dot(decoded, vector) / (np.linalg.norm(decoded) * np.linalg.norm(vector))
+    assert cosine == pytest.approx(1.0, abs=tolerance)
+
+
+def test_int8_zero_vector():
+    assert not decode_embedding(encode_embedding([0.0, 0.0], 'int8')).any()
+
+
+def test_legacy_json_rows_still_decode():
+    assert decode_embedding(json.dumps([0.5, -1.0]).encode()).tolist() == [0.5, -1.0]
+    assert decode_embedding('[0.25]').tolist() == [0.25]
+    assert decode_embedding(None) is None
+
+
+def test_unknown_formats_are_rejected():
+    with pytest.raises(ValueError):
+        encode_embedding([1.0], 'float64')
+    with pytest.raises(ValueError):
+        decode_embedding(b'Z1234')
+
+
+def test_embedding_column_round_trip(db):
+    document = Document(spa_id='spa', name='menu.txt', doc_type='txt', uploaded_at=datetime.utcnow())
+    db.add(document)
+    db.flush()
+    db.add(DocumentChunk(document_id=document.id, chunk_index=0, content='x', embedding=[0.5, -0.25]))
+    db.commit()
+    db.expire_all()
+
+    embedding = db.query(DocumentChunk.embedding).scalar()
+    assert isinstance(embedding, np.ndarray) and embedding.dtype == np.float32
+    assert embedding.tolist() == [0.5, -0.25]
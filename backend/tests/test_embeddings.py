@@ -0,0 +1,70 @@
+import pytest
+
+from api.rag import embeddings
+from api.rag.embedding_cache import EmbeddingCache
+from api.rag.embeddings import _iter_batches, count_tokens, generate_embeddings_batch
+
+
+class FakeClient:
+    """Stands in for OpenAIEmbeddings and records each batch it is sent."""
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+
+    def embed_documents(self, texts):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('rate limited')
+        self.batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    client = FakeClient()
+    monkeypatch.setattr(embeddings, 'embedding_cache', EmbeddingCache(str(tmp_path / 'cache.db')))
+    monkeypatch.setattr(embeddings, '_get_embeddings_client', lambda api_key, batch_size=None: client)
+    monkeypatch.setattr(embeddings.time, 'sleep', lambda seconds: None)
+    return client
+
+
+def test_iter_batches_respects_size_limit():
+    assert list(_iter_batches(['a'] * 5, 2, 1000)) == [[0, 1], [2, 3], [4]]
+
+
+def test_iter_batches_respects_token_limit():
+    texts = ['word ' * 40] * 4
+    per_text = count_tokens(texts[0])
+    batches = list(_iter_batches(texts, 100, per_text * 2))
+    assert batches == [[0, 1], [2, 3]]
+    # A single text over the limit still gets a batch of its own
+    assert list(_iter_batches(texts[:1], 100, 1)) == [[0]]
+
+
+def test_batch_results_keep_input_order(client):
+    texts = [f'text{"x" * i}' for i in range(7)]
+    vectors = generate_embeddings_batch(texts, api_key='sk-test', batch_size=3)
+    assert [len(batch) for batch in client.batches] == [3, 3, 1]
+    assert [vector[0] for vector in vectors] == [float(len(text)) for text in texts]
+
+
+def test_failed_batch_is_retried(client):
+    client.failures = 2
+    progress = []
+    generate_embeddings_batch(['a', 'b'], api_key='sk-test', batch_size=1,
+                              progress_callback=lambda done, total: progress.append(done))
+    assert client.batches == [['a'], ['b']]
+    assert progress == [0, 1, 2]
+
+
+def test_batch_gives_up_after_max_retries(client, monkeypatch):
+    monkeypatch.setattr(embeddings, 'EMBEDDING_MAX_RETRIES', 1)
+    client.failures = 2
+    with pytest.raises(RuntimeError):
+        generate_embeddings_batch(['a'], api_key='sk-test')
+
+
+def test_empty_text_is_rejected(client):
+    with pytest.raises(ValueError):
+        generate_embeddings_batch(['a', ' \x00 '], api_key='sk-test')
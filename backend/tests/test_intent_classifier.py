@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from api.chatbot import intent_classifier
+from api.chatbot.intent_classifier import IntentClassifier, match_rules
+
+AXES = {'BOOKING': 0, 'PRICING': 1, 'OTHER': 2}
+
+
+def _embed(texts):
+    """Fake embeddings: one axis per label keyword found in the text."""
+    vectors = []
+    for text in texts:
+        vector = [0.0] * len(AXES)
+        for word, axis in (('appointment', 0), ('money', 1), ('weather', 2)):
+            if word in text:
+                vector[axis] = 1.0
+        vectors.append(vector)
+    return vectors
+
+
+@pytest.fixture
+def examples(tmp_path):
+    path = tmp_path / 'examples.json'
+    path.write_text(json.dumps({'train': [
+        {'text': 'appointment for two', 'label': 'BOOKING'},
+        {'text': 'appointment tomorrow', 'label': 'BOOKING'},
+        {'text': 'money question', 'label': 'PRICING'},
+        {'text': 'nice weather', 'label': 'OTHER'},
+    ], 'test': []}))
+    return str(path)
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    calls = []
+
+    def generate(texts):
+        calls.append(texts)
+        return _embed(texts)
+
+    monkeypatch.setattr(intent_classifier, 'generate_embeddings_batch', generate)
+    return calls
+
+
+def test_unambiguous_rules_win():
+    classifier = IntentClassifier()
+    assert classifier.classify('How much is a facial?') == ('PRICING', 1.0, 'rules')
+    assert classifier.classify('hello there') == ('OTHER', 1.0, 'rules')
+    # A specific label beats the generic ones
+    assert classifier.classify('What is the price of a wrap?')[0] == 'PRICING'
+    assert set(match_rules('Can I book? How much is it?')) == {'BOOKING', 'PRICING'}
+
+
+def test_ambiguous_message_without_embedding_is_unsure():
+    assert IntentClassifier().classify('Can I book? How much is it?') == (None, 0.0, 'rules')
+
+
+def test_centroid_decides_when_rules_cannot(examples, embeddings):
+    classifier = IntentClassifier(examples)
+    label, margin, method = classifier.classify('something else', _embed(['appointment'])[0])
+    assert (label, method) == ('BOOKING', 'centroid') and margin > 0
+    # Centroids are built once
+    classifier.classify('something else', _embed(['money'])[0])
+    assert len(embeddings) == 1
+
+
+def test_small_margin_returns_no_label(examples, embeddings):
+    classifier = IntentClassifier(examples)
+    label, _, method = classifier.classify('something else', [1.0, 1.0, 0.0])
+    assert label is None and method == 'centroid'
+
+
+def test_centroids_build_right_after_boot(examples, embeddings, monkeypatch):
+    # time.monotonic() can be small on a freshly booted host
+    monkeypatch.setattr(intent_classifier.time, 'monotonic', lambda: 5.0)
+    classifier = IntentClassifier(examples)
+    assert classifier.classify('something else', _embed(['money'])[0])[0] == 'PRICING'
+
+
+def test_failed_build_is_retried_after_a_delay(examples, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(intent_classifier.time, 'monotonic', lambda: now[0])
+
+    def broken(texts):
+        raise RuntimeError('embeddings down')
+
+    monkeypatch.setattr(intent_classifier, 'generate_embeddings_batch', broken)
+    classifier = IntentClassifier(examples)
+    assert classifier.classify('something else', [1.0, 0.0, 0.0]) == (None, 0.0, 'centroid')
+
+    monkeypatch.setattr(intent_classifier, 'generate_embeddings_batch', _embed)
+    now[0] += 10
+    assert classifier.classify('something else', [1.0, 0.0, 0.0])[0] is None
+    now[0] += intent_classifier.INTENT_CENTROID_RETRY_SECONDS
+    assert classifier.classify('something else', [1.0, 0.0, 0.0])[0] == 'BOOKING'
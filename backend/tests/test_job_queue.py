@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlalchemy import update
+
+from models.database import Document, IngestionJob
+from api import job_queue
+from api.job_queue import (
+    claim_job, complete_job, document_busy, enqueue_job, fail_job, heartbeat, release_superseded
+)
+from api.tasks import _document_source
+
+
+def _add_document(db, spa_id='spa'):
+    document = Document(spa_id=spa_id, name='menu.txt', doc_type='txt', uploaded_at=datetime.utcnow())
+    db.add(document)
+    db.commit()
+    return document.id
+
+
+@pytest.fixture
+def document(db):
+    return _add_document(db)
+
+
+def _state(db, job_id):
+    db.expire_all()
+    return db.query(IngestionJob).filter_by(id=job_id).one().state
+
+
+def test_enqueue_reuses_queued_and_running_jobs(db, document):
+    job_id = enqueue_job(document, 'spa')
+    assert enqueue_job(document, 'spa') == job_id
+
+    claimed = claim_job('worker-1')
+    assert claimed['id'] == job_id and claimed['attempts'] == 1
+    assert enqueue_job(document, 'spa') == job_id
+
+
+def test_claim_leases_a_job_once(db, document):
+    enqueue_job(document, 'spa')
+    assert claim_job('worker-1') is not None
+    assert claim_job('worker-2') is None
+
+
+def test_lease_loss(db, document):
+    job_id = enqueue_job(document, 'spa')
+    claim_job('worker-1', lease_seconds=-1)
+
+    # The lease lapsed, so another worker takes the job over
+    taken = claim_job('worker-2')
+    assert taken['id'] == job_id and taken['attempts'] == 2
+    assert not heartbeat(job_id, 'worker-1')
+    assert not complete_job(job_id, 'worker-1')
+    assert fail_job(job_id, 'worker-1', 'boom') == 'lost'
+
+    assert heartbeat(job_id, 'worker-2', chunks_done=3, chunks_total=10)
+    assert complete_job(job_id, 'worker-2')
+    assert _state(db, job_id) == 'done'
+
+
+def test_failed_job_is_retried_with_backoff(db, document):
+    job_id = enqueue_job(document, 'spa')
+    claim_job('worker-1')
+    assert fail_job(job_id, 'worker-1', 'boom') == 'queued'
+    # Not due until the backoff passes
+    assert claim_job('worker-1') is None
+
+    db.query(IngestionJob).filter_by(id=job_id).update({'next_run_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    assert claim_job('worker-1')['attempts'] == 2
+
+
+def test_final_attempt_lease_expiry_fails_job(db, document):
+    job_id = enqueue_job(document, 'spa')
+    db.query(IngestionJob).filter_by(id=job_id).update({'max_attempts': 1})
+    db.commit()
+    claim_job('worker-1', lease_seconds=-1)
+    assert claim_job('worker-2') is None
+    assert _state(db, job_id) == 'failed'
+
+
+def test_claim_limits_running_jobs_per_spa(db, monkeypatch):
+    monkeypatch.setattr(job_queue, 'JOB_MAX_RUNNING_PER_SPA', 1)
+    first = enqueue_job(_add_document(db), 'spa')
+    second = enqueue_job(_add_document(db), 'spa')
+    other = enqueue_job(_add_document(db, 'other'), 'other')
+
+    assert claim_job('worker-1')['id'] == first
+    assert claim_job('worker-2')['id'] == other
+    assert claim_job('worker-3') is None
+    complete_job(first, 'worker-1')
+    assert claim_job('worker-3')['id'] == second
+
+
+def test_claim_update_rechecks_the_spa_limit(db, document, monkeypatch):
+    # A claim that passed the pre-filter loses if another worker filled the spa meanwhile
+    monkeypatch.setattr(job_queue, 'JOB_MAX_RUNNING_PER_SPA', 1)
+    enqueue_job(document, 'spa')
+    claim_job('worker-1')
+    queued = enqueue_job(_add_document(db), 'spa')
+
+    now = datetime.utcnow()
+    result = db.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == queued, job_queue._spa_has_room('spa', now))
+        .values(state='running')
+    )
+    assert result.rowcount == 0
+
+
+def test_document_source_without_metadata():
+    document = Document(spa_id='spa', name='menu.txt', doc_type='txt', content='aGVsbG8=')
+    assert _document_source(document).read() == b'hello'
+
+
+def test_supersede_waits_for_the_running_worker(db, document):
+    old_id = enqueue_job(document, 'spa')
+    claim_job('worker-1')
+
+    new_id = enqueue_job(document, 'spa', supersede=True)
+    assert new_id != old_id
+    assert _state(db, old_id) == 'superseded'
+    # The old worker's heartbeats fail, and the new job waits until it lets go
+    assert not heartbeat(old_id, 'worker-1')
+    assert document_busy(document)
+    assert claim_job('worker-2') is None
+
+    assert release_superseded(old_id, 'worker-1')
+    assert not document_busy(document)
+    assert claim_job('worker-2')['id'] == new_id
+
+
+def test_supersede_reuses_a_queued_job(db, document):
+    job_id = enqueue_job(document, 'spa')
+    assert enqueue_job(document, 'spa', supersede=True) == job_id
@@ -0,0 +1,51 @@
+from api.chatbot.prompt_builder import build_prompt, dedupe_chunks
+from api.rag.embeddings import count_tokens
+
+TEMPLATE = "You are a spa assistant.\nSpa:\n{spa_context}\nDocuments:\n{relevant_context}"
+
+
+def _chunk(text, score, source='menu.txt'):
+    return {'content': text, 'score': score, 'source': source}
+
+
+def _words(prefix, count):
+    return ' '.join(f'{prefix}{i}' for i in range(count))
+
+
+def test_dedupe_drops_near_copies_keeping_the_best():
+    text = 'Our hot stone massage uses smooth heated basalt stones to relax tight muscles'
+    chunks = [_chunk(text, 0.7), _chunk(text + ' deeply.', 0.9), _chunk('Facials start at $80', 0.5)]
+    kept = dedupe_chunks(chunks)
+    assert [chunk['score'] for chunk in kept] == [0.9, 0.5]
+
+
+def test_everything_fits_under_a_large_budget():
+    history = [{'role': 'user', 'content': 'hi'}, {'role': 'assistant', 'content': 'Hello!'}]
+    messages, counts = build_prompt(TEMPLATE, 'Open 9-5', [_chunk('Facials start at $80', 0.5)],
+                                    history, 'How much is a facial?', max_tokens=6000)
+    assert messages[0]['role'] == 'system'
+    assert 'Open 9-5' in messages[0]['content'] and 'From menu.txt: Facials start at $80' in messages[0]['content']
+    assert messages[1:3] == history and messages[-1] == {'role': 'user', 'content': 'How much is a facial?'}
+    assert counts['total'] <= 6000
+
+
+def test_budget_is_respected_and_lowest_scored_chunks_go_first():
+    chunks = [_chunk(_words(f'c{n}x', 150), score) for n, score in enumerate((0.9, 0.8, 0.7, 0.6))]
+    history = [{'role': 'user', 'content': _words(f'h{n}x', 100)} for n in range(6)]
+    messages, counts = build_prompt(TEMPLATE, _words('fact', 400), chunks, history, 'Any deals?',
+                                    max_tokens=1200)
+
+    system = messages[0]['content']
+    assert counts['total'] <= 1200
+    assert count_tokens(system) <= counts['instructions'] + counts['spa_facts'] + counts['documents'] + 5
+    assert 'c0x0' in system and 'c3x0' not in system
+    # History keeps the most recent messages
+    assert messages[-2] == history[-1] and history[0] not in messages
+    assert messages[-1]['content'] == 'Any deals?'
+
+
+def test_unused_budget_flows_to_other_sections():
+    chunks = [_chunk(_words(f'c{n}x', 200), 1 - n / 10) for n in range(6)]
+    _, counts = build_prompt(TEMPLATE, 'Open 9-5', chunks, [], 'Tell me everything', max_tokens=2000)
+    # Spa facts and history need almost nothing, so documents get most of the budget
+    assert counts['documents'] > 0.8 * (2000 - counts['instructions'] - counts['message'])
@@ -0,0 +1,135 @@
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from models.database import Appointment, Location, SlotReservation, SpaService
+from api.scheduling.bitmap_cache import AvailabilityCache
+from api.scheduling.reservations import (
+    SlotTaken, claim_slot, convert_hold, hold_slot, purge_expired_holds, release_appointment,
+    release_hold, reservation_cells, reserve_appointment
+)
+
+DAY = date(2030, 1, 7)
+HOURS = {'monday': {'open': '09:00', 'close': '12:00'}}
+
+
+def _at(hour, minute=0):
+    return datetime.combine(DAY, datetime.min.time()).replace(hour=hour, minute=minute)
+
+
+@pytest.fixture
+def location(db):
+    location = Location(spa_id='spa', name='Main', capacity=1, buffer_minutes=10, business_hours=HOURS)
+    db.add(location)
+    db.commit()
+    return location
+
+
+def _appointment(db, location, start, duration=50):
+    service = SpaService(name='Massage', duration=duration)
+    db.add(service)
+    db.flush()
+    appointment = Appointment(spa_id='spa', service_id=service.id, location_id=location.id,
+                              datetime=start, status='confirmed')
+    db.add(appointment)
+    db.flush()
+    return appointment
+
+
+def test_reservation_cells_cover_duration_and_buffer():
+    cells = reservation_cells(_at(10, 2), 50, 10)
+    assert cells[0] == _at(10)
+    assert cells[-1] == _at(11, 0)
+    assert len(cells) == 13
+
+
+def test_claim_slot_respects_capacity(db, location):
+    claim_slot(db, location, _at(10), 50, appointment_id=1)
+    with pytest.raises(SlotTaken):
+        claim_slot(db, location, _at(10, 30), 50, appointment_id=2)
+    db.rollback()
+
+    location.capacity = 2
+    claim_slot(db, location, _at(10), 50, appointment_id=1)
+    claim_slot(db, location, _at(10, 30), 50, appointment_id=2)
+    units = {unit for (unit,) in db.query(SlotReservation.unit).filter_by(slot_start=_at(10, 30))}
+    assert units == {0, 1}
+
+
+def test_claim_slot_overbooks_only_when_not_enforced(db, location):
+    claim_slot(db, location, _at(10), 50, appointment_id=1)
+    rows = claim_slot(db, location, _at(10), 50, appointment_id=2, enforce_capacity=False)
+    assert {row.unit for row in rows} == {1}
+
+
+def test_convert_live_hold(db, location):
+    token, _ = hold_slot(db, location, _at(10), 50)
+    appointment = _appointment(db, location, _at(10))
+    assert convert_hold(db, token, location, _at(10), 50, appointment.id)
+    rows = db.query(SlotReservation).all()
+    assert rows and all(row.appointment_id == appointment.id and row.hold_token is None for row in rows)
+
+
+def test_convert_hold_for_other_slot_drops_it(db, location):
+    token, _ = hold_slot(db, location, _at(9), 50)
+    appointment = _appointment(db, location, _at(10, 30))
+    assert not convert_hold(db, token, location, _at(10, 30), 50, appointment.id)
+    assert db.query(SlotReservation).count() == 0
+
+
+def test_expired_hold_neither_converts_nor_blocks(db, location):
+    token, _ = hold_slot(db, location, _at(10), 50, ttl_seconds=-1)
+    appointment = _appointment(db, location, _at(10))
+    assert not convert_hold(db, token, location, _at(10), 50, appointment.id)
+
+    hold_slot(db, location, _at(10), 50, ttl_seconds=-1)
+    # A lapsed hold is cleared by the next claim of its cells
+    reserve_appointment(db, location, appointment, 50, token)
+    assert db.query(SlotReservation).filter(SlotReservation.hold_token.isnot(None)).count() == 0
+
+
+def test_live_hold_blocks_claim_until_released(db, location):
+    token, _ = hold_slot(db, location, _at(10), 50)
+    with pytest.raises(SlotTaken):
+        claim_slot(db, location, _at(10), 50, appointment_id=1)
+    db.rollback()
+
+    token, _ = hold_slot(db, location, _at(10), 50)
+    assert release_hold(db, token) == len(reservation_cells(_at(10), 50, 10))
+    claim_slot(db, location, _at(10), 50, appointment_id=1)
+    assert release_appointment(db, 1) == len(reservation_cells(_at(10), 50, 10))
+
+
+def test_purge_expired_holds(db, location):
+    hold_slot(db, location, _at(9), 50, ttl_seconds=-1)
+    hold_slot(db, location, _at(10, 30), 50)
+    assert purge_expired_holds(db) == len(reservation_cells(_at(9), 50, 10))
+    assert db.query(SlotReservation).count() == len(reservation_cells(_at(10, 30), 50, 10))
+
+
+def test_availability_counts_live_holds(db, location):
+    cache = AvailabilityCache()
+    assert cache.available_starts(location, DAY, DAY, 50, 30)[DAY] == [_at(9), _at(9, 30), _at(10), _at(10, 30), _at(11)]
+
+    token, _ = hold_slot(db, location, _at(10), 50)
+    cache.begin_change(db, location.id)
+    db.commit()
+    # 10:00-11:00 is held, so only starts whose slot and buffer end by 10:00 or begin at 11:00 remain
+    assert cache.available_starts(location, DAY, DAY, 50, 30)[DAY] == [_at(9), _at(11)]
+
+    release_hold(db, token)
+    cache.begin_change(db, location.id)
+    db.commit()
+    assert cache.available_starts(location, DAY, DAY, 50, 30)[DAY] == [_at(9), _at(9, 30), _at(10), _at(10, 30), _at(11)]
+
+
+def test_availability_drops_days_once_a_hold_lapses(db, location):
+    cache = AvailabilityCache()
+    hold_slot(db, location, _at(10), 50, ttl_seconds=1)
+    db.commit()
+    assert cache.available_starts(location, DAY, DAY, 50, 30)[DAY] == [_at(9), _at(11)]
+
+    # No booking change bumps the generation; the hold just lapses
+    time.sleep(1.1)
+    assert cache.available_starts(location, DAY, DAY, 50, 30)[DAY] == [_at(9), _at(9, 30), _at(10), _at(10, 30), _at(11)]
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+from models.database import Client
+from api.chatbot import openai_api
+from api.chatbot.response_cache import ResponseCache, response_cache_enabled
+from api.chatbot.context_cache import invalidate_spa_context
+
+ANSWER = {'intent': 'INFORMATION', 'response': 'We open at 9.'}
+
+
+def test_similar_question_hits():
+    cache = ResponseCache(threshold=0.95)
+    cache.store('spa', [1.0, 0.0], 1, ANSWER, latency_ms=800)
+    response, similarity = cache.lookup('spa', [0.99, 0.05], 1)
+    assert response == ANSWER and similarity > 0.95
+    assert cache.lookup('spa', [0.0, 1.0], 1) is None
+    assert cache.lookup('other', [1.0, 0.0], 1) is None
+
+    stats = cache.stats('spa')
+    assert stats['hits'] == 1 and stats['misses'] == 1 and stats['latency_saved_ms'] == 800
+
+
+def test_new_context_version_retires_answers():
+    cache = ResponseCache()
+    cache.store('spa', [1.0, 0.0], 1, ANSWER, latency_ms=1)
+    assert cache.lookup('spa', [1.0, 0.0], 2) is None
+    # An answer produced under the old version is not stored after the change
+    cache.store('spa', [1.0, 0.0], 1, ANSWER, latency_ms=1)
+    assert cache.lookup('spa', [1.0, 0.0], 2) is None
+    assert cache.lookup('spa', [1.0, 0.0], None) is None
+
+
+def test_uncacheable_and_expired_answers():
+    cache = ResponseCache(ttl=0)
+    cache.store('spa', [1.0, 0.0], 1, {'intent': 'BOOKING', 'response': 'Booked!'}, latency_ms=1)
+    assert cache.stats('spa')['stores'] == 0
+    cache.store('spa', [1.0, 0.0], 1, ANSWER, latency_ms=1)
+    assert cache.lookup('spa', [1.0, 0.0], 1) is None
+    assert cache.stats('spa')['entries'] == 0
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        cache.store('spa', vector, 1, dict(ANSWER, n=i), latency_ms=1)
+    assert cache.lookup('spa', [1.0, 0.0, 0.0], 1) is None
+    assert cache.lookup('spa', [0.0, 0.0, 1.0], 1)[0]['n'] == 2
+    assert cache.stats('spa')['evictions'] == 1
+
+
+def test_opt_in_setting_follows_context_invalidation(db):
+    client = Client(spa_id='spa', name='Spa', config={'response_cache': {'enabled': True}})
+    db.add(client)
+    db.commit()
+    assert response_cache_enabled('spa')
+
+    client.config = {'response_cache': {'enabled': False}}
+    db.commit()
+    invalidate_spa_context('spa')
+    assert not response_cache_enabled('spa')
+    assert not response_cache_enabled(None)
+
+
+def test_prepare_response_checks_the_cache_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def enabled(spa_id):
+        threads.append(threading.current_thread())
+        return True
+
+    def version(spa_id):
+        threads.append(threading.current_thread())
+        return 7
+
+    cache = ResponseCache()
+    cache.store('spa', [1.0, 0.0], 7, ANSWER, latency_ms=1)
+    monkeypatch.setattr(openai_api, 'response_cache', cache)
+    monkeypatch.setattr(openai_api, 'response_cache_enabled', enabled)
+    monkeypatch.setattr(openai_api, 'get_context_version', version)
+    monkeypatch.setattr(openai_api, '_query_embedding', lambda message: [1.0, 0.0])
+
+    prepared = asyncio.run(openai_api.prepare_response('When do you open?', 'spa', context='spa info'))
+    assert prepared['cached'] == ANSWER
+    assert len(threads) == 2 and threading.main_thread() not in threads
@@ -0,0 +1,185 @@
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from api.generations import bump_generation
+from api.integrations import slot_cache as slot_cache_module
+from api.integrations.slot_cache import SlotCache
+
+DAY = date(2030, 1, 7)
+
+
+class Provider:
+    """Fetch callable that counts calls and can be made to fail."""
+
+    def __init__(self, slots=None):
+        self.slots = slots if slots is not None else [{'time': '10:00'}]
+        self.calls = 0
+        self.fail = False
+        self.delay = 0.0
+
+    def __call__(self):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('provider down')
+        return list(self.slots)
+
+
+def _wait_idle(cache):
+    deadline = time.monotonic() + 5
+    while cache._inflight and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def cache(db):
+    cache = SlotCache(ttl=0.2, max_stale=5)
+    yield cache
+    cache.shutdown()
+
+
+def test_miss_then_fresh(cache):
+    provider = Provider()
+    assert cache.get('spa', 'acuity', DAY, provider) == [{'time': '10:00'}]
+    assert cache.get('spa', 'acuity', DAY, provider) == [{'time': '10:00'}]
+    assert provider.calls == 1
+    assert cache.stats['misses'] == 1 and cache.stats['fresh'] == 1
+
+
+def test_concurrent_misses_share_one_fetch(cache):
+    provider = Provider()
+    provider.delay = 0.1
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('spa', 'acuity', DAY, provider)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert provider.calls == 1
+    assert results == [[{'time': '10:00'}]] * 5
+
+
+def test_stale_entry_is_served_while_refreshing(cache):
+    provider = Provider()
+    cache.get('spa', 'acuity', DAY, provider)
+    time.sleep(0.25)
+
+    provider.slots = [{'time': '11:00'}]
+    assert cache.get('spa', 'acuity', DAY, provider) == [{'time': '10:00'}]
+    _wait_idle(cache)
+    assert cache.get('spa', 'acuity', DAY, provider) == [{'time': '11:00'}]
+    assert provider.calls == 2
+    assert cache.stats['stale'] == 1
+
+
+def test_failed_refresh_keeps_stale_entry(cache):
+    provider = Provider()
+    cache.get('spa', 'acuity', DAY, provider)
+    time.sleep(0.25)
+
+    provider.fail = True
+    assert cache.get('spa', 'acuity', DAY, provider) == [{'time': '10:00'}]
+    _wait_idle(cache)
+    # Still the old slots, and no new fetch until the retry delay has passed
+    assert cache.get('spa', 'acuity', DAY, provider) == [{'time': '10:00'}]
+    _wait_idle(cache)
+    assert provider.calls == 2
+    assert cache.stats['errors'] == 1
+
+
+def test_miss_propagates_provider_error(cache):
+    provider = Provider()
+    provider.fail = True
+    with pytest.raises(RuntimeError):
+        cache.get('spa', 'acuity', DAY, provider)
+    provider.fail = False
+    assert cache.get('spa', 'acuity', DAY, provider) == [{'time': '10:00'}]
+
+
+def test_entries_past_max_stale_are_refetched(db):
+    cache = SlotCache(ttl=0.05, max_stale=0.05)
+    provider = Provider()
+    cache.get('spa', 'acuity', DAY, provider)
+    time.sleep(0.15)
+    provider.slots = [{'time': '12:00'}]
+    assert cache.get('spa', 'acuity', DAY, provider) == [{'time': '12:00'}]
+    assert cache.stats['misses'] == 2
+    cache.shutdown()
+
+
+def test_invalidate_drops_entries_and_in_flight_results(cache):
+    provider = Provider()
+    cache.get('spa', 'acuity', DAY, provider)
+    cache.get('other', 'acuity', DAY, provider)
+
+    cache.invalidate('spa', DAY)
+    provider.slots = [{'time': '13:00'}]
+    assert cache.get('spa', 'acuity', DAY, provider) == [{'time': '13:00'}]
+    assert cache.get('other', 'acuity', DAY, provider) == [{'time': '10:00'}]
+
+    # A fetch that started before invalidate returns its answer but isn't stored
+    slow = Provider([{'time': '14:00'}])
+    slow.delay = 0.1
+    time.sleep(0.25)
+    cache.get('spa', 'acuity', DAY, slow)
+    cache.invalidate('spa')
+    _wait_idle(cache)
+    provider.slots = [{'time': '15:00'}]
+    assert cache.get('spa', 'acuity', DAY, provider) == [{'time': '15:00'}]
+
+
+def test_drop_before_forgets_past_days(cache):
+    provider = Provider()
+    cache.get('spa', 'acuity', date(2030, 1, 6), provider)
+    cache.get('spa', 'acuity', DAY, provider)
+    cache.drop_before(DAY)
+    cache.get('spa', 'acuity', date(2030, 1, 6), provider)
+    assert provider.calls == 3
+
+
+def test_invalidation_reaches_other_processes(cache):
+    other = SlotCache(ttl=60, max_stale=60)
+    provider = Provider()
+    cache.get('spa', 'acuity', DAY, provider)
+    other.get('spa', 'acuity', DAY, provider)
+    other.get('spa', 'acuity', date(2030, 1, 8), provider)
+
+    # A booking handled by this process; the other one refetches the spa's days
+    cache.invalidate('spa', DAY)
+    provider.slots = [{'time': '16:00'}]
+    assert other.get('spa', 'acuity', DAY, provider) == [{'time': '16:00'}]
+    assert other.get('spa', 'acuity', date(2030, 1, 8), provider) == [{'time': '16:00'}]
+    other.shutdown()
+
+
+def test_invalidating_one_day_keeps_the_others_locally(cache):
+    provider = Provider()
+    cache.get('spa', 'acuity', DAY, provider)
+    cache.get('spa', 'acuity', date(2030, 1, 8), provider)
+    cache.invalidate('spa', DAY)
+    cache.get('spa', 'acuity', date(2030, 1, 8), provider)
+    assert provider.calls == 2
+
+
+def test_fetch_racing_another_process_invalidation_is_not_stored(cache):
+    provider = Provider()
+
+    def racing():
+        bump_generation('slot_cache', 'spa')
+        return [{'time': '09:00'}]
+
+    assert cache.get('spa', 'acuity', DAY, racing) == [{'time': '09:00'}]
+    assert cache.get('spa', 'acuity', DAY, provider) == [{'time': '10:00'}]
+
+
+def test_unreadable_generation_is_never_cached(cache, monkeypatch):
+    provider = Provider()
+    monkeypatch.setattr(slot_cache_module, 'safe_get_generation', lambda scope, key: None)
+    cache.get('spa', 'acuity', DAY, provider)
+    cache.get('spa', 'acuity', DAY, provider)
+    assert provider.calls == 2
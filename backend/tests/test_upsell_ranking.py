@@ -0,0 +1,101 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from models.database import Appointment, SpaService
+from api.services import upsell_ranking
+from api.services.upsell_ranking import (
+    CoBookingCache, CoBookingStats, estimate_price_sensitivity, rank_addons, score_addons
+)
+from api.services.upsell_service import addon_options
+
+SERVICES = [
+    {'name': 'Swedish Massage', 'type': 'massage', 'price': 90},
+    {'name': 'Hydrating Facial', 'type': 'facial', 'price': 80},
+    {'name': 'Hot Stones', 'type': 'add-on', 'parent_type': 'massage', 'price': 30,
+     'description': 'Heated basalt stones'},
+    {'name': 'Aromatherapy', 'type': 'add-on', 'parent_type': 'massage', 'price': 15,
+     'description': 'Essential oil blend'},
+    {'name': 'Scalp Treatment', 'type': 'add-on', 'parent_type': 'massage', 'price': 45,
+     'description': 'Nourishing scalp massage'},
+]
+
+
+def _book(db, client, day, *names):
+    for name in names:
+        service = db.query(SpaService).filter_by(name=name).first()
+        if service is None:
+            service = SpaService(name=name, duration=60)
+            db.add(service)
+            db.flush()
+        db.add(Appointment(spa_id='spa', client_email=client, service_id=service.id,
+                           datetime=datetime(2030, 1, day, 10), status='confirmed'))
+    db.commit()
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(upsell_ranking, 'cobooking_cache', CoBookingCache())
+
+
+def test_stats_count_add_ons_booked_with_a_service_type(db):
+    _book(db, 'a@x.test', 1, 'Swedish Massage', 'Aromatherapy')
+    _book(db, 'b@x.test', 1, 'Swedish Massage', 'Aromatherapy')
+    _book(db, 'c@x.test', 1, 'Swedish Massage', 'Hot Stones')
+    _book(db, 'c@x.test', 2, 'Hydrating Facial')
+
+    stats = CoBookingStats.build('spa', SERVICES)
+    assert stats.visits == 4 and stats.type_visits['massage'] == 3
+    assert stats.co_booking('Aromatherapy', 'massage') > stats.co_booking('Hot Stones', 'massage') > 0
+    assert stats.co_booking('Scalp Treatment', 'massage') == 0
+
+
+def test_rank_prefers_co_booked_add_ons(db):
+    for n in range(5):
+        _book(db, f'{n}@x.test', 1, 'Swedish Massage', 'Aromatherapy')
+    ranked, has_signal = rank_addons('spa', 'massage', addon_options(SERVICES, 'massage'), SERVICES)
+    assert has_signal and ranked[0]['name'] == 'Aromatherapy'
+
+
+def test_rank_uses_conversation_keywords_and_price(db):
+    options = addon_options(SERVICES, 'massage')
+    ranked, _ = rank_addons('spa', 'massage', options, SERVICES, 'Could you add heated stones?')
+    assert ranked[0]['name'] == 'Hot Stones'
+
+    assert estimate_price_sensitivity('something cheap please') == 1.0
+    assert estimate_price_sensitivity('a birthday treat') == 0.0
+    assert estimate_price_sensitivity('hello') is None
+    scores = score_addons(options, 'massage', CoBookingStats(), price_sensitivity=1.0)
+    assert max(range(3), key=lambda i: scores[i]) == 1  # the cheapest
+
+
+def test_no_signal_keeps_catalog_order(db):
+    options = addon_options(SERVICES, 'massage', ranked=['Scalp Treatment'])
+    ranked, has_signal = rank_addons('spa', 'massage', options, SERVICES)
+    assert not has_signal
+    assert [o['name'] for o in ranked] == ['Scalp Treatment', 'Hot Stones', 'Aromatherapy']
+
+
+def test_cache_serves_stats_and_refreshes_after_an_appointment(db, monkeypatch):
+    cache, builds = CoBookingCache(), []
+    build = CoBookingStats.build
+
+    def counting_build(spa_id, services):
+        builds.append(spa_id)
+        return build(spa_id, services)
+
+    monkeypatch.setattr(CoBookingStats, 'build', staticmethod(counting_build))
+    first = cache.get('spa', SERVICES)
+    assert cache.get('spa', SERVICES) is first and len(builds) == 1
+
+    # Another process records an appointment; the old stats are served while they are rebuilt
+    _book(db, 'a@x.test', 1, 'Swedish Massage', 'Aromatherapy')
+    CoBookingCache().invalidate('spa')
+    assert cache.get('spa', SERVICES) is first
+
+    deadline = time.monotonic() + 5
+    while cache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    refreshed = cache.get('spa', SERVICES)
+    assert refreshed is not first and refreshed.visits == 1 and len(builds) == 2
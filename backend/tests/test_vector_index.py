@@ -0,0 +1,100 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from models.database import Document, DocumentChunk
+from api.rag import vector_index
+from api.rag.vector_index import SpaVectorIndex, get_index, invalidate_index
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    vector_index._indexes.clear()
+    yield
+    vector_index._indexes.clear()
+
+
+def _index(vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    ids = list(range(1, len(vectors) + 1))
+    return SpaVectorIndex('spa', ids, [f'chunk {i}' for i in ids], ['menu.txt'] * len(ids), matrix)
+
+
+def _add_document(db, spa_id, vectors, processed=True):
+    document = Document(spa_id=spa_id, name='menu.txt', doc_type='txt',
+                        uploaded_at=datetime.utcnow(), processed=processed)
+    db.add(document)
+    db.flush()
+    for i, vector in enumerate(vectors):
+        db.add(DocumentChunk(document_id=document.id, chunk_index=i, content=f'chunk {i}', embedding=vector))
+    db.commit()
+    return document
+
+
+def test_search_matches_brute_force_cosine():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 8))
+    index = _index(vectors)
+    query = rng.normal(size=8)
+
+    expected = sorted(
+        range(50),
+        key=lambda i: -np.dot(vectors[i], query) / (np.linalg.norm(vectors[i]) * np.linalg.norm(query))
+    )[:5]
+    results = index.search(query.tolist(), top_k=5)
+    assert [chunk['id'] - 1 for chunk, _ in results] == expected
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_search_edge_cases():
+    index = _index([[1.0, 0.0], [0.0, 1.0]])
+    assert len(index.search([1.0, 0.0], top_k=10)) == 2
+    assert index.search([1.0, 0.0], top_k=0) == []
+    assert index.search([0.0, 0.0]) == []
+    # A query from a different embedding model
+    assert index.search([1.0, 0.0, 0.0]) == []
+
+
+def test_build_skips_unprocessed_documents_and_other_spas(db):
+    _add_document(db, 'spa', [[1.0, 0.0], [0.0, 1.0]])
+    _add_document(db, 'spa', [[1.0, 1.0]], processed=False)
+    _add_document(db, 'other', [[1.0, 1.0]])
+
+    index = SpaVectorIndex.build('spa')
+    assert len(index) == 2
+    chunk, score = index.search([1.0, 0.0], top_k=1)[0]
+    assert chunk['content'] == 'chunk 0' and chunk['source'] == 'menu.txt'
+    assert score == pytest.approx(1.0)
+
+
+def test_get_index_is_cached_until_invalidated(db):
+    _add_document(db, 'spa', [[1.0, 0.0]])
+    index = get_index('spa')
+    assert get_index('spa') is index
+
+    _add_document(db, 'spa', [[0.0, 1.0]])
+    invalidate_index('spa')
+    rebuilt = get_index('spa')
+    assert rebuilt is not index and len(rebuilt) == 2
+
+
+def test_get_index_sees_invalidation_from_another_process(db):
+    from api.generations import bump_generation
+
+    index = get_index('spa')
+    # Another process bumps the generation; this one still has its cached entry
+    bump_generation('vector_index', 'spa')
+    assert get_index('spa') is not index
+
+
+def test_get_index_rebuilds_without_caching_when_generation_is_unknown(db, monkeypatch):
+    _add_document(db, 'spa', [[1.0, 0.0]])
+    cached = get_index('spa')
+
+    monkeypatch.setattr(vector_index, 'safe_get_generation', lambda scope, key: None)
+    first, second = get_index('spa'), get_index('spa')
+    assert first is not cached and second is not first
+    assert vector_index._indexes['spa'][1] is cached